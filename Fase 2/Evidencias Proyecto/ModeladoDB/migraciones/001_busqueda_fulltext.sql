@@ -0,0 +1,7 @@
+-- Columna desnormalizada (título + autor) con índice FULLTEXT para la búsqueda del OPAC.
+ALTER TABLE MATERIALES ADD COLUMN texto_busqueda VARCHAR(300) COLLATE utf8mb4_0900_ai_ci NULL;
+ALTER TABLE MATERIALES ADD FULLTEXT INDEX ft_materiales_busqueda (texto_busqueda);
+
+UPDATE MATERIALES M
+JOIN AUTOR A ON M.AUTOR_id_autor = A.id_autor
+SET M.texto_busqueda = CONCAT_WS(' ', M.titulo, A.nombre_autor);
@@ -0,0 +1,35 @@
+-- Contadores de préstamo por material, mantenidos por la aplicación en cada préstamo y devolución.
+CREATE TABLE ESTADISTICAS_MATERIAL (
+    MATERIALES_id_material INT PRIMARY KEY,
+    total_prestamos INT DEFAULT 0 NOT NULL,
+    prestamos_activos INT DEFAULT 0 NOT NULL,
+    ultimo_prestamo DATETIME NULL,
+
+    INDEX idx_estadisticas_total (total_prestamos),
+
+    CONSTRAINT fk_estadisticas_materiales FOREIGN KEY (MATERIALES_id_material) 
+        REFERENCES MATERIALES(id_material) ON DELETE CASCADE
+);
+
+CREATE TABLE ESTADISTICAS_MATERIAL_MES (
+    MATERIALES_id_material INT NOT NULL,
+    mes DATE NOT NULL,
+    prestamos INT DEFAULT 0 NOT NULL,
+
+    PRIMARY KEY (MATERIALES_id_material, mes),
+
+    CONSTRAINT fk_estadisticas_mes_materiales FOREIGN KEY (MATERIALES_id_material) 
+        REFERENCES MATERIALES(id_material) ON DELETE CASCADE
+);
+
+INSERT INTO ESTADISTICAS_MATERIAL (MATERIALES_id_material, total_prestamos, prestamos_activos, ultimo_prestamo)
+SELECT MATERIALES_id_material, COUNT(*), SUM(estado_prestamo = 'Activo'), MAX(fecha_prestamo)
+FROM PRESTAMOS
+GROUP BY MATERIALES_id_material;
+
+INSERT INTO ESTADISTICAS_MATERIAL_MES (MATERIALES_id_material, mes, prestamos)
+SELECT MATERIALES_id_material,
+       MAKEDATE(YEAR(fecha_prestamo), 1) + INTERVAL (MONTH(fecha_prestamo) - 1) MONTH AS mes,
+       COUNT(*)
+FROM PRESTAMOS
+GROUP BY MATERIALES_id_material, mes;
@@ -0,0 +1,13 @@
+-- Índices compuestos para los filtros y ordenamientos que usa app.py.
+
+-- Préstamos activos ordenados por vencimiento, reporte de mora y conteo del dashboard.
+CREATE INDEX idx_prestamos_estado_vencimiento ON PRESTAMOS (estado_prestamo, fecha_devolucion);
+
+-- Reservas pendientes de un material.
+CREATE INDEX idx_reservas_material_estado ON RESERVAS (MATERIALES_id_material, estado_reserva);
+
+-- Orden alfabético del OPAC y búsqueda por prefijo de título.
+CREATE INDEX idx_materiales_titulo ON MATERIALES (titulo);
+
+-- Materiales de una categoría (filtro categoria_id del OPAC), índice cubriente.
+CREATE INDEX idx_mc_categoria_material ON MATERIALES_CATEGORIAS (CATEGORIAS_id_categoria, MATERIALES_id_material);
@@ -0,0 +1,22 @@
+-- Cola de reservas por material: al devolver un ejemplar se retiene para la
+-- reserva pendiente más antigua en lugar de volver a la estantería.
+
+ALTER TABLE RESERVAS
+    ADD COLUMN fecha_retencion DATE NULL,
+    ADD COLUMN fecha_limite_retiro DATE NULL,
+    ADD COLUMN usuario_vigente INT GENERATED ALWAYS AS
+        (IF(estado_reserva IN ('Pendiente', 'Retenida'), USUARIOS_id_usuario, NULL)) STORED;
+
+-- uk_reserva_activa impedía que un usuario completara dos veces una reserva del
+-- mismo material. La unicidad se limita ahora a las reservas vigentes. El índice
+-- por usuario se crea antes porque la FK fk_reservas_usuarios lo necesita.
+CREATE INDEX idx_reservas_usuario_estado ON RESERVAS (USUARIOS_id_usuario, estado_reserva);
+ALTER TABLE RESERVAS DROP INDEX uk_reserva_activa;
+CREATE UNIQUE INDEX uk_reserva_vigente ON RESERVAS (usuario_vigente, MATERIALES_id_material);
+
+-- La cola se recorre con idx_reservas_material_estado (003): en InnoDB el índice
+-- secundario incluye id_reserva, así que WHERE material = ? AND estado = 'Pendiente'
+-- ORDER BY id_reserva LIMIT n es una lectura de rango sin ordenamiento adicional.
+
+-- Reservas retenidas cuyo plazo de retiro vence (expiración periódica).
+CREATE INDEX idx_reservas_estado_limite ON RESERVAS (estado_reserva, fecha_limite_retiro);
@@ -0,0 +1,13 @@
+-- Estado precalculado por las tareas programadas (flask tareas): el reporte de
+-- mora lee estas columnas en lugar de calcular la multa de cada préstamo activo.
+ALTER TABLE PRESTAMOS
+    ADD COLUMN vencido BOOLEAN DEFAULT FALSE NOT NULL,
+    ADD COLUMN dias_mora INT DEFAULT 0 NOT NULL,
+    ADD COLUMN multa_acumulada DECIMAL(10, 2) DEFAULT 0 NOT NULL,
+    ADD COLUMN multa_calculada_en DATE NULL;
+
+-- Reporte de mora: préstamos activos marcados como vencidos, por fecha esperada.
+CREATE INDEX idx_prestamos_estado_vencido ON PRESTAMOS (estado_prestamo, vencido, fecha_devolucion);
+
+-- Expiración de reservas pendientes antiguas.
+CREATE INDEX idx_reservas_estado_fecha ON RESERVAS (estado_reserva, fecha_reserva);
@@ -0,0 +1,14 @@
+-- Feed de cambios de circulación (/api/circulacion/cambios): una fila por préstamo,
+-- devolución, reserva o ajuste de stock, escrita en la misma transacción que el
+-- cambio. Los mesones leen solo las filas posteriores al último id_cambio visto.
+CREATE TABLE CAMBIOS_CIRCULACION (
+    id_cambio BIGINT AUTO_INCREMENT PRIMARY KEY,
+    tipo ENUM('prestamo', 'devolucion', 'reserva', 'stock') NOT NULL,
+    MATERIALES_id_material INT NOT NULL,
+    PRESTAMOS_id_prestamo INT NULL,
+    ejemplares_disponibles INT NOT NULL,
+    creado_en DATETIME NOT NULL
+);
+
+-- Purga nocturna de los cambios antiguos.
+CREATE INDEX idx_cambios_creado_en ON CAMBIOS_CIRCULACION (creado_en);
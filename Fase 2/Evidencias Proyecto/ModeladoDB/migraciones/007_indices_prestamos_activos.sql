@@ -0,0 +1,7 @@
+-- Listado paginado de préstamos activos (/api/circulacion/prestamos_activos).
+-- Sin filtros usa idx_prestamos_estado_vencimiento (003): InnoDB agrega
+-- id_prestamo al final del índice, así que el keyset (fecha_devolucion,
+-- id_prestamo) se resuelve sin ordenar. Estos cubren los filtros por usuario
+-- y por material con el mismo orden.
+CREATE INDEX idx_prestamos_usuario_estado_venc ON PRESTAMOS (USUARIOS_id_usuario, estado_prestamo, fecha_devolucion);
+CREATE INDEX idx_prestamos_material_estado_venc ON PRESTAMOS (MATERIALES_id_material, estado_prestamo, fecha_devolucion);
@@ -0,0 +1,6 @@
+-- El reporte de mora filtra los vencidos por fecha_devolucion < CURDATE()
+-- (idx_prestamos_estado_vencimiento, 003): la marca `vencido` y su índice ya
+-- no los lee ninguna consulta. dias_mora y multa_acumulada se mantienen.
+DROP INDEX idx_prestamos_estado_vencido ON PRESTAMOS;
+
+ALTER TABLE PRESTAMOS DROP COLUMN vencido;
@@ -1,9 +1,51 @@
 import mysql.connector
-from flask import redirect, url_for, Flask, render_template, request, jsonify, g
+from flask import redirect, url_for, Flask, render_template, request, jsonify, g, Response, session
 from configuracion import MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE 
+from configuracion import (
+    MYSQL_POOL_SIZE, MYSQL_POOL_OVERFLOW, MYSQL_POOL_TIMEOUT,
+    MYSQL_POOL_MAX_LIFETIME, MYSQL_POOL_PING_ON_BORROW, MYSQL_REPLICAS,
+    REPLICA_VERIFICAR_CADA, REPLICA_TOLERANCIA_ENDPOINTS, REPLICA_FIJAR_PRIMARIO, LISTAS_CACHE_TTL,
+    OPAC_LIMITE_RESULTADOS, LISTADO_LIMITE_DEFECTO, LISTADO_LIMITE_MAXIMO,
+    CIRCULACION_LOTE_MAXIMO, MULTA_TARIFA_DIARIA, MULTA_DIAS_GRACIA,
+    MULTA_TARIFAS_POR_TIPO, MULTA_MONTO_MAXIMO, METRICAS_TTL, USUARIOS_CACHE_TTL,
+    PASSWORD_HASH_METODO, HASH_WORKERS, HASH_MAX_PENDIENTES, HASH_TIMEOUT,
+    LOGIN_MAX_INTENTOS_RUT, LOGIN_MAX_INTENTOS_IP, LOGIN_VENTANA_INTENTOS,
+    IMPORTACION_TAMANO_LOTE, CONSULTA_LENTA_MS, RESERVA_DIAS_RETIRO,
+    RESERVA_DIAS_VIGENCIA, TAREAS_TAMANO_LOTE, TAREAS_PAUSA_LOTE,
+    TAREAS_INTERVALO_INCREMENTAL, TAREAS_HORA_NOCTURNA, SUGERENCIAS_LIMITE,
+    SUGERENCIAS_RECARGA, OPAC_CACHE_ENTRADAS, OPAC_CACHE_TTL, CIRCULACION_FEED_INTERVALO,
+    CIRCULACION_FEED_LATIDO, CIRCULACION_FEED_DURACION, CIRCULACION_FEED_GRACIA,
+    CIRCULACION_FEED_LOTE, CIRCULACION_CAMBIOS_DIAS
+)
+from conexiones import PoolConexiones, EnrutadorReplicas
+from cache import CacheVersionado, CacheTTL, CacheLRU
+from busqueda import consulta_booleana
+from multas import PoliticaMultas
+from metricas import MetricasDashboard
+from migraciones import aplicar_migraciones
+from hashing import ServicioHash, HashSaturadoError, LimitadorIntentos
+from importacion import ImportadorCatalogo, leer_csv, leer_jsonl
+from exportacion import filas_servidor, a_csv, a_jsonl, comprimir_gzip
+from instrumentacion import ConexionInstrumentada, MedicionPeticion, RegistroMetricas
+from reservas import retener_para_cola, consumir_retenciones
+from consultas import (
+    construir_case, campos_listado, sql_listado_materiales, sql_busqueda_opac,
+    SQL_TOTAL_MATERIALES, SQL_DETALLE_MATERIAL, sql_prestamos_activos, sql_conteo_prestamos_activos,
+    SQL_REPORTE_USO, SQL_REPORTE_MORA
+)
+from tareas import PlanificadorTareas, marcar_vencidos, expirar_reservas, refrescar_estadisticas
+from sugerencias import IndicePrefijos, TIPOS as TIPOS_SUGERENCIA
+from cambios import AvisoCambios, registrar_cambios, leer_cambios, tramo_confirmado, ultimo_cambio, purgar_cambios
+import threading
+import io
+import time
+import hashlib
+import json
+import click
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+from collections import Counter
+from datetime import date
 app = Flask(__name__)
 app.secret_key = 'tonecaps' 
 
@@ -11,6 +53,17 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+usuarios_cache = CacheTTL(ttl=USUARIOS_CACHE_TTL)
+
+servicio_hash = ServicioHash(
+    PASSWORD_HASH_METODO,
+    max_workers=HASH_WORKERS,
+    max_pendientes=HASH_MAX_PENDIENTES,
+    timeout=HASH_TIMEOUT
+)
+limitador_rut = LimitadorIntentos(LOGIN_MAX_INTENTOS_RUT, LOGIN_VENTANA_INTENTOS)
+limitador_ip = LimitadorIntentos(LOGIN_MAX_INTENTOS_IP, LOGIN_VENTANA_INTENTOS)
+
 class User(UserMixin):
     def __init__(self, id, nombre, rol, password_hash):
         self.id = id
@@ -19,23 +72,38 @@ class User(UserMixin):
         self.password_hash = password_hash
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return servicio_hash.verificar(self.password_hash, password)
 
 @login_manager.user_loader
 def load_user(user_id):
-    conn = get_db_connection()
-    if conn is None:
-        return None
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id_usuario, nombre, rol, password_hash FROM USUARIOS WHERE id_usuario = %s", (user_id,))
-        user_data = cursor.fetchone()
-        if user_data:
-            return User(user_data['id_usuario'], user_data['nombre'], user_data['rol'], user_data['password_hash'])
+        user_id = int(user_id)
+    except (TypeError, ValueError):
         return None
-    except Exception as e:
-        print(f"Error en load_user: {e}")
+
+    user_data = usuarios_cache.obtener(user_id)
+    if user_data is None:
+        # Si se bloquea o edita al usuario durante el SELECT, no se guarda lo leído.
+        version = usuarios_cache.version(user_id)
+        conn = get_db_connection()
+        if conn is None:
+            return None
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT id_usuario, nombre, rol, password_hash, estado_activo FROM USUARIOS WHERE id_usuario = %s", (user_id,))
+            user_data = cursor.fetchone()
+            cursor.close()
+        except Exception as e:
+            print(f"Error en load_user: {e}")
+            return None
+        if not user_data:
+            return None
+        usuarios_cache.guardar(user_id, user_data, version)
+
+    # Una cuenta bloqueada pierde la sesión en la siguiente petición.
+    if not user_data['estado_activo']:
         return None
+    return User(user_data['id_usuario'], user_data['nombre'], user_data['rol'], user_data['password_hash'])
 
 def role_required(role_name):
     def decorator(f):
@@ -64,11 +132,49 @@ db_config = {
     'database': MYSQL_DATABASE
 }
 
+db_pool = PoolConexiones(
+    db_config,
+    size=MYSQL_POOL_SIZE,
+    overflow=MYSQL_POOL_OVERFLOW,
+    timeout=MYSQL_POOL_TIMEOUT,
+    max_lifetime=MYSQL_POOL_MAX_LIFETIME,
+    ping_on_borrow=MYSQL_POOL_PING_ON_BORROW
+)
+
+enrutador_replicas = EnrutadorReplicas(
+    [
+        PoolConexiones(
+            dict(db_config, **replica),
+            size=MYSQL_POOL_SIZE,
+            overflow=MYSQL_POOL_OVERFLOW,
+            timeout=MYSQL_POOL_TIMEOUT,
+            max_lifetime=MYSQL_POOL_MAX_LIFETIME,
+            ping_on_borrow=MYSQL_POOL_PING_ON_BORROW
+        )
+        for replica in MYSQL_REPLICAS
+    ],
+    intervalo=REPLICA_VERIFICAR_CADA
+)
+
+registro_metricas = RegistroMetricas()
+
+def elegir_pool():
+    """Devuelve (pool, conexión) de una réplica si el endpoint lo permite, o None para usar el primario."""
+    tolerancia = REPLICA_TOLERANCIA_ENDPOINTS.get(request.endpoint)
+    if tolerancia is None or request.method != 'GET':
+        return None
+    # Quien acaba de escribir lee del primario para ver su propio cambio.
+    if session.get('primario_hasta', 0) > time.time():
+        return None
+    return enrutador_replicas.obtener(tolerancia)
+
 def get_db_connection():
-    """Establece la conexión a la base de datos."""
+    """Obtiene una conexión del pool para la petición actual, con sus consultas medidas."""
     try:
         if 'db' not in g:
-            g.db = mysql.connector.connect(**db_config)
+            elegido = elegir_pool()
+            g.db_pool, conexion = elegido if elegido else (db_pool, db_pool.obtener())
+            g.db = ConexionInstrumentada(conexion, g.get('medicion'), CONSULTA_LENTA_MS / 1000)
         return g.db
     except mysql.connector.Error as err:
         print(f"Error de conexión a MySQL. Por favor, verifica el archivo 'configuracion.py' y que MySQL esté activo: {err}")
@@ -76,10 +182,194 @@ def get_db_connection():
 
 @app.teardown_appcontext
 def close_db_connection(exception):
-    """Cierra la conexión a la base de datos."""
+    """Devuelve la conexión al pool en lugar de cerrarla."""
     db = g.pop('db', None)
-    if db is not None and db.is_connected():
-        db.close()
+    if db is not None:
+        g.pop('db_pool', db_pool).devolver(db.conexion)
+
+@app.before_request
+def iniciar_medicion():
+    g.medicion = MedicionPeticion()
+
+@app.after_request
+def registrar_medicion(response):
+    """Acumula la latencia de la petición por endpoint y agrega el encabezado Server-Timing."""
+    medicion = g.pop('medicion', None)
+    if medicion is None:
+        return response
+    duracion = time.perf_counter() - medicion.inicio
+    registro_metricas.registrar(request.endpoint or 'sin_ruta', request.method, response.status_code, duracion, medicion)
+    response.headers['Server-Timing'] = (
+        f'app;dur={duracion * 1000:.1f}, '
+        f'db;dur={medicion.tiempo_db * 1000:.1f};desc="{medicion.consultas} consultas, {medicion.filas} filas"'
+    )
+    return response
+
+@app.after_request
+def fijar_primario_tras_escritura(response):
+    if enrutador_replicas.pools and request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        session['primario_hasta'] = time.time() + REPLICA_FIJAR_PRIMARIO
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Métricas de latencia, base de datos y pool en formato Prometheus."""
+    return Response(registro_metricas.exportar(db_pool, {'opac': cache_opac}), mimetype='text/plain; version=0.0.4')
+
+listas_cache = CacheVersionado(ttl=LISTAS_CACHE_TTL)
+
+metricas_dashboard = MetricasDashboard(ttl=METRICAS_TTL)
+
+# Respuestas de búsqueda y detalle del OPAC. Se invalida con cada escritura de
+# catálogo (materiales, categorías, autores, editoriales); el stock disponible
+# no forma parte de lo cacheado porque se superpone en cada respuesta.
+cache_opac = CacheLRU(max_entradas=OPAC_CACHE_ENTRADAS, ttl=OPAC_CACHE_TTL)
+
+aviso_cambios = AvisoCambios()
+
+indice_sugerencias = IndicePrefijos()
+recargar_sugerencias = threading.Event()
+_hilo_sugerencias = None
+_hilo_sugerencias_lock = threading.Lock()
+
+def leer_indice_sugerencias():
+    conn = db_pool.obtener()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id_material, titulo, isbn, AUTOR_id_autor FROM MATERIALES")
+        materiales = cursor.fetchall()
+        cursor.execute("SELECT id_autor, nombre_autor FROM AUTOR")
+        autores = cursor.fetchall()
+        cursor.execute("SELECT id_usuario, nombre, rut FROM USUARIOS")
+        usuarios = cursor.fetchall()
+        cursor.close()
+    finally:
+        db_pool.devolver(conn)
+    return materiales, autores, usuarios
+
+def mantener_indice_sugerencias():
+    """Carga el índice de autocompletado y lo recarga cada SUGERENCIAS_RECARGA segundos."""
+    while True:
+        try:
+            indice_sugerencias.cargar(leer_indice_sugerencias)
+        except Exception as e:
+            print(f"Error al cargar el índice de sugerencias: {e}")
+        # Si la primera carga falló se reintenta pronto; /api/suggest responde 503 mientras tanto.
+        recargar_sugerencias.wait(SUGERENCIAS_RECARGA if indice_sugerencias.cargado else 5)
+        recargar_sugerencias.clear()
+
+def iniciar_indice_sugerencias():
+    """Arranca una sola vez el hilo del índice de autocompletado.
+
+    Se llama al levantar el servidor y, para los servidores WSGI que solo
+    importan `app`, antes de la primera petición. Los comandos `flask` y los
+    scripts que importan app.py no cargan el índice.
+    """
+    global _hilo_sugerencias
+    if _hilo_sugerencias is not None:
+        return
+    with _hilo_sugerencias_lock:
+        if _hilo_sugerencias is None:
+            _hilo_sugerencias = threading.Thread(target=mantener_indice_sugerencias, daemon=True)
+            _hilo_sugerencias.start()
+
+app.before_request(iniciar_indice_sugerencias)
+
+politica_multas = PoliticaMultas(
+    tarifa_diaria=MULTA_TARIFA_DIARIA,
+    dias_gracia=MULTA_DIAS_GRACIA,
+    tarifas_por_tipo=MULTA_TARIFAS_POR_TIPO,
+    monto_maximo=MULTA_MONTO_MAXIMO
+)
+
+def actualizar_texto_busqueda(cursor, material_id):
+    """Recalcula la columna indexada con FULLTEXT (título + autor) de un material."""
+    cursor.execute("""
+    UPDATE MATERIALES M
+    JOIN AUTOR A ON M.AUTOR_id_autor = A.id_autor
+    SET M.texto_busqueda = CONCAT_WS(' ', M.titulo, A.nombre_autor)
+    WHERE M.id_material = %s
+    """, (material_id,))
+
+def puede_cachear():
+    """Lo leído de una réplica no se cachea hasta que pase su tolerancia desde la última escritura de catálogo."""
+    if g.get('db_pool', db_pool) is db_pool:
+        return True
+    return time.monotonic() - cache_opac.invalidado_en > REPLICA_TOLERANCIA_ENDPOINTS.get(request.endpoint, 0)
+
+def superponer_disponibilidad(cursor, filas):
+    """Copia las filas cacheadas con el ejemplares_disponibles actual de cada material."""
+    if not filas:
+        return filas
+    marcadores = ', '.join(['%s'] * len(filas))
+    cursor.execute(
+        f"SELECT id_material, ejemplares_disponibles FROM MATERIALES WHERE id_material IN ({marcadores})",
+        tuple(f['id_material'] for f in filas)
+    )
+    disponibles = {fila['id_material']: fila['ejemplares_disponibles'] for fila in cursor.fetchall()}
+    return [dict(f, ejemplares_disponibles=disponibles.get(f['id_material'], f['ejemplares_disponibles'])) for f in filas]
+
+def vincular_categorias(cursor, material_id, categorias_ids):
+    """Inserta en un solo INSERT los vínculos material-categoría indicados."""
+    categorias_ids = list(dict.fromkeys(categorias_ids))
+    if not categorias_ids:
+        return
+    filas = ', '.join(['(%s, %s)'] * len(categorias_ids))
+    params = [valor for cat_id in categorias_ids for valor in (material_id, cat_id)]
+    cursor.execute(
+        "INSERT INTO MATERIALES_CATEGORIAS (MATERIALES_id_material, CATEGORIAS_id_categoria) VALUES " + filas,
+        tuple(params)
+    )
+
+def leer_lista_ids(data, campo):
+    """Valida una lista de IDs enteros enviada en el cuerpo de la petición."""
+    ids = data.get(campo) if data else None
+    if not isinstance(ids, list) or not ids:
+        return None, f'El campo {campo} debe ser una lista no vacía.'
+    if len(ids) > CIRCULACION_LOTE_MAXIMO:
+        return None, f'El lote no puede superar {CIRCULACION_LOTE_MAXIMO} elementos.'
+    try:
+        return [int(i) for i in ids], None
+    except (ValueError, TypeError):
+        return None, f'Los elementos de {campo} deben ser números enteros.'
+
+def registrar_estadisticas_prestamo(cursor, materiales_ids):
+    """Suma los préstamos nuevos a ESTADISTICAS_MATERIAL y ESTADISTICAS_MATERIAL_MES."""
+    conteo = Counter(materiales_ids)
+    mes = date.today().replace(day=1)
+
+    filas = ', '.join(['(%s, %s, %s, NOW())'] * len(conteo))
+    params = []
+    for material_id, cantidad in conteo.items():
+        params.extend([material_id, cantidad, cantidad])
+    cursor.execute(f"""
+    INSERT INTO ESTADISTICAS_MATERIAL (MATERIALES_id_material, total_prestamos, prestamos_activos, ultimo_prestamo)
+    VALUES {filas}
+    ON DUPLICATE KEY UPDATE
+        total_prestamos = total_prestamos + VALUES(total_prestamos),
+        prestamos_activos = prestamos_activos + VALUES(prestamos_activos),
+        ultimo_prestamo = VALUES(ultimo_prestamo)
+    """, tuple(params))
+
+    filas = ', '.join(['(%s, %s, %s)'] * len(conteo))
+    params = []
+    for material_id, cantidad in conteo.items():
+        params.extend([material_id, mes, cantidad])
+    cursor.execute(f"""
+    INSERT INTO ESTADISTICAS_MATERIAL_MES (MATERIALES_id_material, mes, prestamos)
+    VALUES {filas}
+    ON DUPLICATE KEY UPDATE prestamos = prestamos + VALUES(prestamos)
+    """, tuple(params))
+
+def registrar_estadisticas_devolucion(cursor, materiales_ids):
+    """Descuenta los préstamos activos de ESTADISTICAS_MATERIAL al devolver."""
+    conteo = Counter(materiales_ids)
+    caso, params = construir_case('MATERIALES_id_material', conteo)
+    marcadores = ', '.join(['%s'] * len(conteo))
+    cursor.execute(
+        f"UPDATE ESTADISTICAS_MATERIAL SET prestamos_activos = GREATEST(0, prestamos_activos - {caso}) WHERE MATERIALES_id_material IN ({marcadores})",
+        tuple(params) + tuple(conteo)
+    )
 
 ## Rutas HTML (Vistas)
 @app.route('/')
@@ -171,15 +461,13 @@ def guardar_material():
         cursor = conn.cursor()
         cursor.execute(sql_material, values_material)
         material_id = cursor.lastrowid
-        if categorias_ids:
-            sql_cat = "INSERT INTO MATERIALES_CATEGORIAS (MATERIALES_id_material, CATEGORIAS_id_categoria) VALUES (%s, %s)"
-            for cat_id in categorias_ids:
-                cursor.execute(sql_cat, (material_id, cat_id))
+        actualizar_texto_busqueda(cursor, material_id)
+        vincular_categorias(cursor, material_id, categorias_ids)
         
         conn.commit()
-        if 'db' in g:
-            g.db.close()
-            g.pop('db', None)
+        metricas_dashboard.material_agregado(material_id, data.get('titulo'))
+        cache_opac.invalidar()
+        indice_sugerencias.actualizar_material(material_id, data.get('titulo'), data.get('isbn'), autor_id)
 
         return jsonify({'message': 'Material catalogado y vinculado a categorías correctamente.', 'id': material_id}), 201
 
@@ -197,32 +485,33 @@ def listar_materiales():
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-    
-    sql = """
-    SELECT 
-        M.id_material,
-        M.titulo,
-        M.isbn,
-        M.ejemplares_totales,
-        M.ejemplares_disponibles,
-        M.anio_publicacion AS anio,
-        A.nombre_autor,
-        E.nombre_editorial
-    FROM 
-        MATERIALES M
-    JOIN 
-        AUTOR A ON M.AUTOR_id_autor = A.id_autor
-    JOIN 
-        EDITORIAL E ON M.EDITORIAL_id_editorial = E.id_editorial
-    ORDER BY M.id_material DESC
-    """
+
+    limite = request.args.get('limite', LISTADO_LIMITE_DEFECTO, type=int)
+    limite = max(1, min(limite, LISTADO_LIMITE_MAXIMO))
+    cursor_id = request.args.get('cursor', type=int)
+    incluir_total = request.args.get('total', '1') != '0'
+
+    campos, invalidos = campos_listado(request.args.get('fields'))
+    if invalidos:
+        return jsonify({'error': f'Campos no válidos: {", ".join(invalidos)}'}), 400
+    sql, params = sql_listado_materiales(campos, cursor_id, limite)
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(sql)
+        cursor.execute(sql, params)
         materiales = cursor.fetchall()
+
+        siguiente_cursor = None
+        if len(materiales) > limite:
+            materiales = materiales[:limite]
+            siguiente_cursor = materiales[-1]['id_material']
+
+        respuesta = {'materiales': materiales, 'siguiente_cursor': siguiente_cursor}
+        if incluir_total:
+            cursor.execute(SQL_TOTAL_MATERIALES)
+            respuesta['total'] = cursor.fetchone()['total']
         
-        return jsonify(materiales), 200
+        return jsonify(respuesta), 200
 
     except Exception as e:
         print(f"Error al listar materiales: {e}")
@@ -231,6 +520,44 @@ def listar_materiales():
         if conn and conn.is_connected():
             cursor.close()
 
+@app.route('/api/catalogacion/importar', methods=['POST'])
+@login_required
+@role_required('Bibliotecario')
+def importar_materiales():
+    archivo = request.files.get('archivo')
+    if archivo is None:
+        return jsonify({'error': 'Debe adjuntar un archivo CSV o JSONL en el campo "archivo".'}), 400
+
+    formato = request.form.get('formato') or archivo.filename.rsplit('.', 1)[-1].lower()
+    if formato not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Formato no soportado. Use csv o jsonl.'}), 400
+
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+
+    # El archivo se lee como flujo de texto: nunca se carga completo en memoria.
+    stream = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline='')
+    filas = leer_csv(stream) if formato == 'csv' else leer_jsonl(stream)
+
+    importador = None
+    try:
+        importador = ImportadorCatalogo(conn, tamano_lote=IMPORTACION_TAMANO_LOTE)
+        resumen = importador.importar(filas)
+    except (mysql.connector.Error, UnicodeDecodeError) as e:
+        print(f"Error en importación masiva: {e}")
+        return jsonify({'error': f'Error al importar el archivo: {e}'}), 400
+    finally:
+        if importador and importador.importadas:
+            metricas_dashboard.invalidar()
+        if importador and importador.tablas_apoyo_modificadas:
+            listas_cache.invalidar()
+        if importador and importador.importadas:
+            recargar_sugerencias.set()
+            cache_opac.invalidar()
+
+    return jsonify(resumen), 200
+
 @app.route('/api/catalogacion/obtener/<int:material_id>', methods=['GET'])
 @login_required
 @role_required('Bibliotecario')
@@ -303,21 +630,12 @@ def editar_material(material_id):
     if ejemplares_disponibles > ejemplares_totales:
         return jsonify({'error': 'El número de ejemplares disponibles no puede ser mayor al total de ejemplares.'}), 400
 
-    sql_material = """
-    UPDATE MATERIALES SET 
-        titulo = %s, anio_publicacion = %s, isbn = %s, 
-        ejemplares_totales = %s, ejemplares_disponibles = %s,
-        EDITORIAL_id_editorial = %s, AUTOR_id_autor = %s,
-        tipo = 'Libro', disponible = 'S' 
-    WHERE id_material = %s
-    """
-    
-    values_material = (
-        data.get('titulo'), data.get('anio'), data.get('isbn'), 
-        ejemplares_totales, ejemplares_disponibles,
-        data.get('editorial_id'), data.get('autor_id'),
-        material_id
-    )
+    nuevos_valores = {
+        'titulo': data.get('titulo'), 'anio_publicacion': anio, 'isbn': data.get('isbn'),
+        'ejemplares_totales': ejemplares_totales, 'ejemplares_disponibles': ejemplares_disponibles,
+        'EDITORIAL_id_editorial': editorial_id, 'AUTOR_id_autor': autor_id,
+        'tipo': 'Libro', 'disponible': 'S'
+    }
     
     categorias_ids_raw = data.get('categorias_ids', [])
     if categorias_ids_raw is None:
@@ -333,19 +651,48 @@ def editar_material(material_id):
         return jsonify({'error': 'Los IDs de categorías deben ser números enteros válidos.'}), 400
     
     try:
-        cursor = conn.cursor()
-        
-        cursor.execute(sql_material, values_material)
-        
-        cursor.execute("DELETE FROM MATERIALES_CATEGORIAS WHERE MATERIALES_id_material = %s", (material_id,))
+        cursor = conn.cursor(dictionary=True)
         
-        if categorias_ids:
-            sql_cat = "INSERT INTO MATERIALES_CATEGORIAS (MATERIALES_id_material, CATEGORIAS_id_categoria) VALUES (%s, %s)"
-            for cat_id in categorias_ids:
-                cursor.execute(sql_cat, (material_id, cat_id))
+        cursor.execute(
+            "SELECT " + ", ".join(nuevos_valores) + " FROM MATERIALES WHERE id_material = %s FOR UPDATE",
+            (material_id,)
+        )
+        actuales = cursor.fetchone()
+        if actuales is None:
+            conn.rollback()
+            return jsonify({'error': 'Material no encontrado'}), 404
+
+        # Solo se escriben las columnas que cambiaron; si ninguna cambió no hay UPDATE.
+        cambios = {campo: valor for campo, valor in nuevos_valores.items() if actuales[campo] != valor}
+        if cambios:
+            asignaciones = ', '.join(f"{campo} = %s" for campo in cambios)
+            cursor.execute(
+                f"UPDATE MATERIALES SET {asignaciones} WHERE id_material = %s",
+                tuple(cambios.values()) + (material_id,)
+            )
+            if 'titulo' in cambios or 'AUTOR_id_autor' in cambios:
+                actualizar_texto_busqueda(cursor, material_id)
+
+        cursor.execute(
+            "SELECT CATEGORIAS_id_categoria FROM MATERIALES_CATEGORIAS WHERE MATERIALES_id_material = %s",
+            (material_id,)
+        )
+        categorias_actuales = {fila['CATEGORIAS_id_categoria'] for fila in cursor.fetchall()}
+        categorias_nuevas = set(categorias_ids)
+
+        quitar = categorias_actuales - categorias_nuevas
+        if quitar:
+            marcadores = ', '.join(['%s'] * len(quitar))
+            cursor.execute(
+                f"DELETE FROM MATERIALES_CATEGORIAS WHERE MATERIALES_id_material = %s AND CATEGORIAS_id_categoria IN ({marcadores})",
+                (material_id,) + tuple(quitar)
+            )
+        vincular_categorias(cursor, material_id, sorted(categorias_nuevas - categorias_actuales))
         
         conn.commit()
-        if 'db' in g: g.db.close(); g.pop('db', None)
+        metricas_dashboard.material_editado(material_id, data.get('titulo'))
+        cache_opac.invalidar()
+        indice_sugerencias.actualizar_material(material_id, data.get('titulo'), data.get('isbn'), autor_id)
         
         return jsonify({'message': f'Material {material_id} actualizado y categorías vinculadas correctamente.'}), 200
 
@@ -380,9 +727,10 @@ def eliminar_material(material_id):
         cursor.execute(sql, (material_id,))
         conn.commit()
         
-        if 'db' in g: g.db.close(); g.pop('db', None)
-        
         if cursor.rowcount > 0:
+            metricas_dashboard.material_eliminado(material_id)
+            cache_opac.invalidar()
+            indice_sugerencias.quitar_material(material_id)
             return jsonify({'message': f'Material {material_id} eliminado correctamente.'}), 200
         else:
             return jsonify({'error': 'No se pudo eliminar el material.'}), 500
@@ -414,9 +762,9 @@ def guardar_autor():
         cursor = conn.cursor()
         cursor.execute(sql, (nombre,))
         conn.commit()
-        if 'db' in g:
-            g.db.close()
-            g.pop('db', None)
+        listas_cache.invalidar()
+        cache_opac.invalidar()
+        indice_sugerencias.actualizar_autor(cursor.lastrowid, nombre)
         return jsonify({'message': 'Autor registrado con éxito.', 'id': cursor.lastrowid}), 201
     except mysql.connector.Error as err:
         conn.rollback()
@@ -439,10 +787,10 @@ def eliminar_autor(autor_id):
         sql = "DELETE FROM AUTOR WHERE id_autor = %s"
         cursor.execute(sql, (autor_id,))
         conn.commit()
-        if 'db' in g:
-            g.db.close()
-            g.pop('db', None)
+        listas_cache.invalidar()
+        cache_opac.invalidar()
         if cursor.rowcount > 0:
+            indice_sugerencias.quitar_autor(autor_id)
             return jsonify({'message': f'Autor {autor_id} eliminado correctamente.'}), 200
         else:
             return jsonify({'error': 'Autor no encontrado o no se pudo eliminar.'}), 404
@@ -476,9 +824,8 @@ def guardar_editorial():
         cursor = conn.cursor()
         cursor.execute(sql, (nombre,))
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
+        listas_cache.invalidar()
+        cache_opac.invalidar()
         return jsonify({'message': 'Editorial registrada con éxito.', 'id': cursor.lastrowid}), 201
     except mysql.connector.Error as err:
         conn.rollback()
@@ -501,9 +848,8 @@ def eliminar_editorial(editorial_id):
         sql = "DELETE FROM EDITORIAL WHERE id_editorial = %s"
         cursor.execute(sql, (editorial_id,))
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
+        listas_cache.invalidar()
+        cache_opac.invalidar()
         if cursor.rowcount > 0:
             return jsonify({'message': f'Editorial {editorial_id} eliminada correctamente.'}), 200
         else:
@@ -539,9 +885,8 @@ def guardar_categoria():
         cursor = conn.cursor()
         cursor.execute(sql, (nombre, descripcion))
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
+        listas_cache.invalidar()
+        cache_opac.invalidar()
         return jsonify({'message': 'Categoría registrada con éxito.', 'id': cursor.lastrowid}), 201
     except mysql.connector.Error as err:
         conn.rollback()
@@ -564,9 +909,8 @@ def eliminar_categoria(categoria_id):
         sql = "DELETE FROM CATEGORIAS WHERE id_categoria = %s"
         cursor.execute(sql, (categoria_id,))
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
+        listas_cache.invalidar()
+        cache_opac.invalidar()
         if cursor.rowcount > 0:
             return jsonify({'message': f'Categoría {categoria_id} eliminada correctamente.'}), 200
         else:
@@ -595,9 +939,11 @@ def registrar_usuario():
     if not all(data.get(field) for field in required_fields):
         return jsonify({'error': 'Faltan campos obligatorios para el registro del usuario.'}), 400
     
-    from werkzeug.security import generate_password_hash
     password_claro = data.get('password')
-    hashed_password = generate_password_hash(password_claro, method='pbkdf2:sha256') 
+    try:
+        hashed_password = servicio_hash.generar(password_claro)
+    except HashSaturadoError:
+        return jsonify({'error': 'El servicio de autenticación está ocupado. Intente nuevamente.'}), 503, {'Retry-After': '2'}
 
     sql = """
     INSERT INTO USUARIOS (nombre, rut, correo, telefono, rol, password_hash)
@@ -613,7 +959,7 @@ def registrar_usuario():
         cursor = conn.cursor()
         cursor.execute(sql, values)
         conn.commit()
-        if 'db' in g: g.db.close(); g.pop('db', None) 
+        indice_sugerencias.actualizar_usuario(cursor.lastrowid, data.get('nombre'), data.get('rut'))
         return jsonify({'message': 'Usuario registrado con éxito.'}), 201
     except mysql.connector.Error as err:
         conn.rollback()
@@ -626,36 +972,42 @@ def registrar_usuario():
 
 @app.route('/api/listas_catalogacion', methods=['GET'])
 def cargar_listas_catalogacion():
-    if 'listas_cache' in g:
-        return jsonify(g.listas_cache), 200
+    listas = listas_cache.obtener()
 
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-    
-    data = {}
-    try:
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("SELECT id_autor, nombre_autor FROM AUTOR")
-        data['autores'] = cursor.fetchall() 
+    if listas is None:
+        conn = get_db_connection()
+        if conn is None:
+            return jsonify({'error': 'Error de conexión a la base de datos'}), 500
 
-        cursor.execute("SELECT id_editorial, nombre_editorial FROM EDITORIAL")
-        data['editoriales'] = cursor.fetchall() 
-        
-        cursor.execute("SELECT id_categoria, nombre_categoria FROM CATEGORIAS")
-        data['categorias'] = cursor.fetchall() 
-        
-        g.listas_cache = data 
-        
-        return jsonify(data), 200
+        version = listas_cache.version
+        data = {}
+        try:
+            cursor = conn.cursor(dictionary=True)
+            
+            cursor.execute("SELECT id_autor, nombre_autor FROM AUTOR")
+            data['autores'] = cursor.fetchall() 
 
-    except Exception as e:
-        print(f"Error al cargar listas de apoyo: {e}")
-        return jsonify({'error': 'Error en la consulta SQL'}), 500
-    finally:
-        if conn and conn.is_connected():
-            cursor.close()
+            cursor.execute("SELECT id_editorial, nombre_editorial FROM EDITORIAL")
+            data['editoriales'] = cursor.fetchall() 
+            
+            cursor.execute("SELECT id_categoria, nombre_categoria FROM CATEGORIAS")
+            data['categorias'] = cursor.fetchall() 
+
+        except Exception as e:
+            print(f"Error al cargar listas de apoyo: {e}")
+            return jsonify({'error': 'Error en la consulta SQL'}), 500
+        finally:
+            if conn and conn.is_connected():
+                cursor.close()
+
+        # El ETag depende del contenido para que sea igual en todos los workers.
+        etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        listas = listas_cache.guardar({'data': data, 'etag': etag}, version)
+
+    respuesta = jsonify(listas['data'])
+    respuesta.set_etag(listas['etag'])
+    respuesta.cache_control.no_cache = True
+    return respuesta.make_conditional(request)
 
 @app.route('/api/circulacion/prestamo', methods=['POST'])
 @login_required 
@@ -672,41 +1024,48 @@ def registrar_prestamo():
     try:
         cursor = conn.cursor(dictionary=True)
 
-        cursor.execute("SELECT id_usuario FROM USUARIOS WHERE rut = %s", (rut_usuario,))
-        usuario = cursor.fetchone()
-        if not usuario:
-            return jsonify({'error': 'Usuario no encontrado o RUT inválido.'}), 404
-        id_usuario = usuario['id_usuario']
-        
-        cursor.execute(
-            "SELECT ejemplares_disponibles FROM MATERIALES WHERE id_material = %s", 
-            (material_id,)
-        )
-        material = cursor.fetchone()
-        
-        if not material:
-            return jsonify({'error': 'Material no encontrado.'}), 404
+        # Si el usuario tiene un ejemplar retenido por su reserva, el préstamo sale
+        # de ese ejemplar y no del stock disponible.
+        sql_retencion = """
+        UPDATE RESERVAS SET estado_reserva = 'Completada'
+        WHERE usuario_vigente = (SELECT id_usuario FROM USUARIOS WHERE rut = %s)
+          AND MATERIALES_id_material = %s AND estado_reserva = 'Retenida'
+        """
+        cursor.execute(sql_retencion, (rut_usuario, material_id))
+
+        if cursor.rowcount == 0:
+            # El UPDATE condicional descuenta el stock y bloquea la fila del material
+            # en una sola operación: dos mesones no pueden prestar el mismo último ejemplar.
+            sql_stock_update = """
+            UPDATE MATERIALES SET ejemplares_disponibles = ejemplares_disponibles - 1
+            WHERE id_material = %s AND ejemplares_disponibles > 0
+            """
+            cursor.execute(sql_stock_update, (material_id,))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                cursor.execute("SELECT 1 FROM MATERIALES WHERE id_material = %s", (material_id,))
+                if not cursor.fetchone():
+                    return jsonify({'error': 'Material no encontrado.'}), 404
+                return jsonify({'error': 'No hay ejemplares disponibles para préstamo.'}), 400
 
-        if material['ejemplares_disponibles'] < 1:
-            return jsonify({'error': 'No hay ejemplares disponibles para préstamo.'}), 400
-            
         sql_prestamo = """
         INSERT INTO PRESTAMOS (fecha_prestamo, fecha_devolucion, estado_prestamo, USUARIOS_id_usuario, MATERIALES_id_material)
-        VALUES (NOW(), DATE_ADD(CURDATE(), INTERVAL 14 DAY), 'Activo', %s, %s)
+        SELECT NOW(), DATE_ADD(CURDATE(), INTERVAL 14 DAY), 'Activo', id_usuario, %s
+        FROM USUARIOS WHERE rut = %s
         """
-        cursor.execute(sql_prestamo, (id_usuario, material_id))
-        
-        sql_stock_update = """
-        UPDATE MATERIALES SET ejemplares_disponibles = ejemplares_disponibles - 1
-        WHERE id_material = %s
-        """
-        cursor.execute(sql_stock_update, (material_id,))
+        cursor.execute(sql_prestamo, (material_id, rut_usuario))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return jsonify({'error': 'Usuario no encontrado o RUT inválido.'}), 404
+        id_prestamo = cursor.lastrowid
+
+        registrar_estadisticas_prestamo(cursor, [material_id])
+        registrar_cambios(cursor, [('prestamo', material_id, id_prestamo)])
 
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
-        return jsonify({'message': 'Préstamo registrado con éxito. Stock actualizado.', 'id_prestamo': cursor.lastrowid}), 201
+        aviso_cambios.notificar()
+        metricas_dashboard.ajustar('prestamos_activos', 1)
+        return jsonify({'message': 'Préstamo registrado con éxito. Stock actualizado.', 'id_prestamo': id_prestamo}), 201
 
     except mysql.connector.Error as err:
         conn.rollback()
@@ -733,8 +1092,16 @@ def registrar_devolucion():
     try:
         cursor = conn.cursor(dictionary=True)
 
+        # FOR UPDATE, como en la devolución por lote: dos devoluciones simultáneas
+        # del mismo préstamo no pueden ver ambas el estado 'Activo'.
         cursor.execute(
-            "SELECT MATERIALES_id_material, estado_prestamo, fecha_devolucion FROM PRESTAMOS WHERE id_prestamo = %s",
+            """
+            SELECT P.MATERIALES_id_material, P.estado_prestamo, P.fecha_devolucion, M.tipo
+            FROM PRESTAMOS P
+            JOIN MATERIALES M ON P.MATERIALES_id_material = M.id_material
+            WHERE P.id_prestamo = %s
+            FOR UPDATE
+            """,
             (id_prestamo,)
         )
         prestamo = cursor.fetchone()
@@ -747,13 +1114,7 @@ def registrar_devolucion():
             
         material_id = prestamo['MATERIALES_id_material']
         
-        sql_multa = """
-        SELECT GREATEST(0, DATEDIFF(CURDATE(), %s)) AS dias_retraso
-        """
-        cursor.execute(sql_multa, (prestamo['fecha_devolucion'],))
-        dias_retraso = cursor.fetchone()['dias_retraso']
-        
-        monto_multa = dias_retraso * 500 
+        dias_retraso, monto_multa = politica_multas.calcular(prestamo['fecha_devolucion'], prestamo['tipo'])
         
         sql_prestamo_update = """
         UPDATE PRESTAMOS SET 
@@ -764,24 +1125,37 @@ def registrar_devolucion():
         """
         cursor.execute(sql_prestamo_update, (monto_multa, id_prestamo))
         
-        sql_stock_update = """
-        UPDATE MATERIALES SET ejemplares_disponibles = ejemplares_disponibles + 1
-        WHERE id_material = %s
-        """
-        cursor.execute(sql_stock_update, (material_id,))
+        # El ejemplar pasa a la primera reserva pendiente; solo vuelve al stock si la cola está vacía.
+        retenidas = retener_para_cola(cursor, material_id, 1, RESERVA_DIAS_RETIRO)
+        aviso_reserva = ''
+        if retenidas:
+            reserva = retenidas[0]
+            aviso_reserva = f" El ejemplar queda retenido para la reserva {reserva['id_reserva']} de {reserva['nombre']} ({reserva['rut']})."
+        else:
+            sql_stock_update = """
+            UPDATE MATERIALES SET ejemplares_disponibles = ejemplares_disponibles + 1
+            WHERE id_material = %s
+            """
+            cursor.execute(sql_stock_update, (material_id,))
+
+        registrar_estadisticas_devolucion(cursor, [material_id])
+        registrar_cambios(cursor, [('devolucion', material_id, id_prestamo)])
 
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
+        aviso_cambios.notificar()
+        metricas_dashboard.ajustar('prestamos_activos', -1)
         if monto_multa > 0:
              return jsonify({
-                 'message': f'Devolución registrada con éxito. ¡ATENCIÓN! Se generó una multa por {dias_retraso} días de retraso.',
+                 'message': f'Devolución registrada con éxito. ¡ATENCIÓN! Se generó una multa por {dias_retraso} días de retraso.' + aviso_reserva,
                  'multa': monto_multa,
-                 'dias_retraso': dias_retraso
+                 'dias_retraso': dias_retraso,
+                 'reserva_retenida': retenidas[0] if retenidas else None
              }), 200
         
-        return jsonify({'message': f'Devolución de Préstamo {id_prestamo} registrada con éxito. Sin multas.'}), 200
+        return jsonify({
+            'message': f'Devolución de Préstamo {id_prestamo} registrada con éxito. Sin multas.' + aviso_reserva,
+            'reserva_retenida': retenidas[0] if retenidas else None
+        }), 200
 
     except mysql.connector.Error as err:
         conn.rollback()
@@ -792,37 +1166,379 @@ def registrar_devolucion():
             cursor.close()
 
 
-@app.route('/api/circulacion/prestamos_activos', methods=['GET'])
-def listar_prestamos_activos():
+@app.route('/api/circulacion/prestamo_lote', methods=['POST'])
+@login_required 
+@role_required('Bibliotecario') 
+def registrar_prestamo_lote():
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-    
+
+    data = request.get_json()
+    rut_usuario = data.get('rut_usuario') if data else None
+    materiales_ids, error = leer_lista_ids(data, 'materiales_ids')
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+
+        cursor.execute("SELECT id_usuario FROM USUARIOS WHERE rut = %s", (rut_usuario,))
+        usuario = cursor.fetchone()
+        if not usuario:
+            return jsonify({'error': 'Usuario no encontrado o RUT inválido.'}), 404
+        id_usuario = usuario['id_usuario']
+
+        unicos = list(dict.fromkeys(materiales_ids))
+        # Los materiales con un ejemplar retenido para este usuario no descuentan stock.
+        # Se bloquean las reservas antes que MATERIALES, en el mismo orden que la devolución.
+        retenidos = consumir_retenciones(cursor, id_usuario, unicos)
+
+        marcadores = ', '.join(['%s'] * len(unicos))
+        # FOR UPDATE bloquea las filas para que otro mesón no preste los mismos ejemplares.
+        cursor.execute(
+            f"SELECT id_material, ejemplares_disponibles FROM MATERIALES WHERE id_material IN ({marcadores}) FOR UPDATE",
+            tuple(unicos)
+        )
+        stock = {m['id_material']: m['ejemplares_disponibles'] for m in cursor.fetchall()}
+
+        resultados = []
+        a_prestar = []
+        a_descontar = []
+        for material_id in materiales_ids:
+            if material_id not in stock:
+                resultados.append({'material_id': material_id, 'ok': False, 'error': 'Material no encontrado.'})
+            elif material_id in retenidos:
+                retenidos.discard(material_id)
+                a_prestar.append(material_id)
+                resultados.append({'material_id': material_id, 'ok': True, 'reserva': True})
+            elif stock[material_id] < 1:
+                resultados.append({'material_id': material_id, 'ok': False, 'error': 'No hay ejemplares disponibles para préstamo.'})
+            else:
+                stock[material_id] -= 1
+                a_prestar.append(material_id)
+                a_descontar.append(material_id)
+                resultados.append({'material_id': material_id, 'ok': True})
+
+        if a_prestar:
+            filas = ', '.join(["(NOW(), DATE_ADD(CURDATE(), INTERVAL 14 DAY), 'Activo', %s, %s)"] * len(a_prestar))
+            params = []
+            for material_id in a_prestar:
+                params.extend([id_usuario, material_id])
+            cursor.execute(
+                "INSERT INTO PRESTAMOS (fecha_prestamo, fecha_devolucion, estado_prestamo, USUARIOS_id_usuario, MATERIALES_id_material) VALUES " + filas,
+                tuple(params)
+            )
+            primer_id = cursor.lastrowid
+
+            descuentos = Counter(a_descontar)
+            if descuentos:
+                caso, params = construir_case('id_material', descuentos)
+                marcadores = ', '.join(['%s'] * len(descuentos))
+                cursor.execute(
+                    f"UPDATE MATERIALES SET ejemplares_disponibles = ejemplares_disponibles - {caso} WHERE id_material IN ({marcadores})",
+                    tuple(params) + tuple(descuentos)
+                )
+
+            prestados = list(dict.fromkeys(a_prestar))
+            marcadores = ', '.join(['%s'] * len(prestados))
+            cursor.execute(
+                f"SELECT id_prestamo, MATERIALES_id_material FROM PRESTAMOS WHERE id_prestamo >= %s AND USUARIOS_id_usuario = %s AND MATERIALES_id_material IN ({marcadores}) ORDER BY id_prestamo",
+                (primer_id, id_usuario) + tuple(prestados)
+            )
+            ids_por_material = {}
+            for fila in cursor.fetchall():
+                ids_por_material.setdefault(fila['MATERIALES_id_material'], []).append(fila['id_prestamo'])
+            for resultado in resultados:
+                if resultado['ok']:
+                    resultado['id_prestamo'] = ids_por_material[resultado['material_id']].pop(0)
+
+            registrar_estadisticas_prestamo(cursor, a_prestar)
+            registrar_cambios(cursor, [('prestamo', r['material_id'], r['id_prestamo']) for r in resultados if r['ok']])
+
+        conn.commit()
+        if a_prestar:
+            aviso_cambios.notificar()
+        metricas_dashboard.ajustar('prestamos_activos', len(a_prestar))
+        return jsonify({
+            'message': f'{len(a_prestar)} de {len(materiales_ids)} préstamos registrados.',
+            'resultados': resultados
+        }), 200
+
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Error SQL al registrar préstamos en lote: {err}")
+        return jsonify({'error': f'Error transaccional al registrar préstamos: {err.msg}'}), 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+
+@app.route('/api/circulacion/devolucion_lote', methods=['POST'])
+@login_required 
+@role_required('Bibliotecario') 
+def registrar_devolucion_lote():
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+
+    data = request.get_json()
+    prestamos_ids, error = leer_lista_ids(data, 'prestamos_ids')
+    if error:
+        return jsonify({'error': error}), 400
+    prestamos_ids = list(dict.fromkeys(prestamos_ids))
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+
+        marcadores = ', '.join(['%s'] * len(prestamos_ids))
+        cursor.execute(
+            f"""
+            SELECT P.id_prestamo, P.MATERIALES_id_material, P.estado_prestamo, P.fecha_devolucion, M.tipo
+            FROM PRESTAMOS P
+            JOIN MATERIALES M ON P.MATERIALES_id_material = M.id_material
+            WHERE P.id_prestamo IN ({marcadores}) FOR UPDATE
+            """,
+            tuple(prestamos_ids)
+        )
+        prestamos = {p['id_prestamo']: p for p in cursor.fetchall()}
+
+        hoy = date.today()
+        resultados = []
+        multas = {}
+        retenidas = []
+        devueltos_por_material = Counter()
+        for id_prestamo in prestamos_ids:
+            prestamo = prestamos.get(id_prestamo)
+            if not prestamo:
+                resultados.append({'id_prestamo': id_prestamo, 'ok': False, 'error': 'Préstamo no encontrado.'})
+                continue
+            if prestamo['estado_prestamo'] != 'Activo':
+                resultados.append({'id_prestamo': id_prestamo, 'ok': False, 'error': 'El préstamo ya fue devuelto o cancelado.'})
+                continue
+            dias_retraso, multas[id_prestamo] = politica_multas.calcular(prestamo['fecha_devolucion'], prestamo['tipo'], hoy)
+            devueltos_por_material[prestamo['MATERIALES_id_material']] += 1
+            resultados.append({'id_prestamo': id_prestamo, 'ok': True, 'multa': multas[id_prestamo], 'dias_retraso': dias_retraso})
+
+        if multas:
+            caso, params = construir_case('id_prestamo', multas)
+            marcadores = ', '.join(['%s'] * len(multas))
+            cursor.execute(
+                f"""
+                UPDATE PRESTAMOS SET 
+                    estado_prestamo = 'Devuelto', 
+                    fecha_devolucion_real = CURDATE(),
+                    monto_multa = {caso}
+                WHERE id_prestamo IN ({marcadores})
+                """,
+                tuple(params) + tuple(multas)
+            )
+
+            # Cada material atiende primero su cola de reservas; solo el resto vuelve al stock.
+            for material_id, copias in devueltos_por_material.items():
+                retenidas.extend(retener_para_cola(cursor, material_id, copias, RESERVA_DIAS_RETIRO))
+            liberados = devueltos_por_material - Counter(r['material_id'] for r in retenidas)
+
+            if liberados:
+                caso, params = construir_case('id_material', liberados)
+                marcadores = ', '.join(['%s'] * len(liberados))
+                cursor.execute(
+                    f"UPDATE MATERIALES SET ejemplares_disponibles = ejemplares_disponibles + {caso} WHERE id_material IN ({marcadores})",
+                    tuple(params) + tuple(liberados)
+                )
+
+            registrar_estadisticas_devolucion(cursor, list(devueltos_por_material.elements()))
+            registrar_cambios(cursor, [('devolucion', prestamos[i]['MATERIALES_id_material'], i) for i in multas])
+
+        conn.commit()
+        if multas:
+            aviso_cambios.notificar()
+        metricas_dashboard.ajustar('prestamos_activos', -len(multas))
+        return jsonify({
+            'message': f'{len(multas)} de {len(prestamos_ids)} devoluciones registradas.',
+            'multa_total': sum(multas.values()),
+            'reservas_retenidas': retenidas,
+            'resultados': resultados
+        }), 200
+
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Error SQL al registrar devoluciones en lote: {err}")
+        return jsonify({'error': f'Error transaccional al registrar devoluciones: {err.msg}'}), 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+
+@app.route('/api/circulacion/reservas/<int:material_id>', methods=['GET'])
+@login_required
+@role_required('Bibliotecario')
+def listar_cola_reservas(material_id):
+    """Cola de reservas vigentes de un material: primero las retenidas, luego las pendientes en orden."""
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+
     sql = """
-    SELECT 
-        P.id_prestamo,
-        P.fecha_prestamo,
-        P.fecha_devolucion,
-        P.estado_prestamo,
-        M.titulo AS titulo_material,
-        U.rut AS rut_usuario
-    FROM 
-        PRESTAMOS P
-    JOIN 
-        MATERIALES M ON P.MATERIALES_id_material = M.id_material
-    JOIN 
-        USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario
-    WHERE 
-        P.estado_prestamo = 'Activo'
-    ORDER BY P.fecha_devolucion ASC;
+    SELECT R.id_reserva, R.estado_reserva, R.fecha_reserva, R.fecha_limite_retiro, U.nombre, U.rut
+    FROM RESERVAS R
+    JOIN USUARIOS U ON R.USUARIOS_id_usuario = U.id_usuario
+    WHERE R.MATERIALES_id_material = %s AND R.estado_reserva IN ('Retenida', 'Pendiente')
+    ORDER BY R.estado_reserva = 'Pendiente', R.id_reserva
+    """
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(sql, (material_id,))
+        cola = cursor.fetchall()
+        for reserva in cola:
+            reserva['fecha_reserva'] = str(reserva['fecha_reserva'])
+            if reserva['fecha_limite_retiro']:
+                reserva['fecha_limite_retiro'] = str(reserva['fecha_limite_retiro'])
+        return jsonify(cola), 200
+    except Exception as e:
+        print(f"Error al obtener la cola de reservas: {e}")
+        return jsonify({'error': 'Error al obtener la cola de reservas'}), 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+
+@app.route('/api/circulacion/cambios', methods=['GET'])
+@login_required
+@role_required('Bibliotecario')
+def feed_cambios_circulacion():
+    """Server-Sent Events con los préstamos, devoluciones, reservas y stock que cambian.
+
+    El mesón abre el feed, recibe el evento 'inicio' y recién entonces carga la
+    lista de préstamos activos; después la parchea con cada evento 'cambio'.
+    El flujo se cierra cada CIRCULACION_FEED_DURACION segundos para liberar el
+    hilo, y EventSource reconecta solo enviando Last-Event-ID.
+    """
+    desde = request.headers.get('Last-Event-ID', request.args.get('desde'), type=int)
+
+    def leer(funcion, *args):
+        conn = db_pool.obtener()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            resultado = funcion(cursor, *args)
+            cursor.close()
+            return resultado
+        finally:
+            db_pool.devolver(conn)
+
+    def eventos(desde):
+        if desde is None:
+            desde = leer(ultimo_cambio, CIRCULACION_FEED_GRACIA)
+        yield f"retry: 1000\nid: {desde}\nevent: inicio\ndata: {json.dumps({'ultimo': desde})}\n\n"
+
+        fin = time.monotonic() + CIRCULACION_FEED_DURACION
+        ultimo_latido = time.monotonic()
+        visto = None
+        while time.monotonic() < fin:
+            try:
+                filas = tramo_confirmado(leer(leer_cambios, desde, CIRCULACION_FEED_LOTE), desde, CIRCULACION_FEED_GRACIA)
+            except mysql.connector.Error as e:
+                print(f"Error al leer el feed de circulación: {e}")
+                return
+            for fila in filas:
+                desde = fila.pop('id_cambio')
+                del fila['creado_en'], fila['ahora']
+                yield f"id: {desde}\nevent: cambio\ndata: {app.json.dumps(fila)}\n\n"
+            if len(filas) == CIRCULACION_FEED_LOTE:
+                continue
+            if time.monotonic() - ultimo_latido >= CIRCULACION_FEED_LATIDO:
+                ultimo_latido = time.monotonic()
+                yield ": latido\n\n"
+            # Un cambio confirmado en este proceso despierta el feed de inmediato;
+            # los de otros procesos se ven en la siguiente consulta periódica.
+            visto = aviso_cambios.esperar(visto, CIRCULACION_FEED_INTERVALO)
+
+    return Response(eventos(desde), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+SQL_PRESTAMOS_ACTIVOS = """
+SELECT 
+    P.id_prestamo,
+    P.fecha_prestamo,
+    P.fecha_devolucion,
+    P.estado_prestamo,
+    M.titulo AS titulo_material,
+    U.rut AS rut_usuario
+FROM 
+    PRESTAMOS P
+JOIN 
+    MATERIALES M ON P.MATERIALES_id_material = M.id_material
+JOIN 
+    USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario
+WHERE 
+    P.estado_prestamo = 'Activo'
+ORDER BY P.fecha_devolucion ASC;
+"""
+
+def estimar_filas(cursor, sql, params, tabla):
+    """Filas que el optimizador estima para `tabla` en la consulta, leídas de EXPLAIN sin ejecutarla."""
+    cursor.execute("EXPLAIN " + sql, params)
+    for fila in cursor.fetchall():
+        if fila['table'] == tabla:
+            return int((fila['rows'] or 0) * (fila['filtered'] or 100) / 100)
+    return 0
+
+@app.route('/api/circulacion/prestamos_activos', methods=['GET'])
+def listar_prestamos_activos():
+    """Préstamos activos por vencimiento, filtrados y paginados con keyset.
+
+    Filtros: rut, material_id, vence_desde y vence_hasta (AAAA-MM-DD) y
+    vencidos (1/0). El cursor es 'fecha_id' de la última fila recibida. Con
+    conteo=estimado (por defecto) el total sale de EXPLAIN y no depende de
+    cuántos préstamos haya abiertos; conteo=exacto ejecuta el COUNT(*) y
+    conteo=ninguno lo omite.
     """
+    conn = get_db_connection()
+    if conn is None:
+        return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+
+    limite = request.args.get('limite', LISTADO_LIMITE_DEFECTO, type=int)
+    limite = max(1, min(limite, LISTADO_LIMITE_MAXIMO))
+    conteo = request.args.get('conteo', 'estimado')
+    if conteo not in ('estimado', 'exacto', 'ninguno'):
+        return jsonify({'error': 'conteo debe ser estimado, exacto o ninguno.'}), 400
+
+    try:
+        filtros = {
+            'rut': request.args.get('rut', '').strip() or None,
+            'material_id': request.args.get('material_id', type=int),
+            'vence_desde': date.fromisoformat(request.args['vence_desde']) if request.args.get('vence_desde') else None,
+            'vence_hasta': date.fromisoformat(request.args['vence_hasta']) if request.args.get('vence_hasta') else None,
+            'vencidos': {'1': True, '0': False}.get(request.args.get('vencidos')),
+        }
+        despues_de = None
+        if request.args.get('cursor'):
+            fecha, id_prestamo = request.args['cursor'].split('_')
+            despues_de = (date.fromisoformat(fecha), int(id_prestamo))
+    except ValueError:
+        return jsonify({'error': 'Las fechas deben tener formato AAAA-MM-DD y el cursor, AAAA-MM-DD_id.'}), 400
+
+    sql, params = sql_prestamos_activos(filtros, despues_de, limite)
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(sql)
+        cursor.execute(sql, params)
         prestamos = cursor.fetchall()
+
+        siguiente_cursor = None
+        if len(prestamos) > limite:
+            prestamos = prestamos[:limite]
+            ultimo = prestamos[-1]
+            siguiente_cursor = f"{ultimo['fecha_devolucion'].isoformat()}_{ultimo['id_prestamo']}"
+
+        respuesta = {'prestamos': prestamos, 'siguiente_cursor': siguiente_cursor}
+        if conteo != 'ninguno':
+            sql_conteo, params_conteo = sql_conteo_prestamos_activos(filtros)
+            if conteo == 'exacto':
+                cursor.execute(sql_conteo, params_conteo)
+                respuesta['total'] = cursor.fetchone()['total']
+            else:
+                respuesta['total'] = estimar_filas(cursor, sql_conteo, params_conteo, 'P')
+            respuesta['total_estimado'] = conteo == 'estimado'
         
-        return jsonify(prestamos), 200
+        return jsonify(respuesta), 200
 
     except Exception as e:
         print(f"Error al listar préstamos activos: {e}")
@@ -831,6 +1547,26 @@ def listar_prestamos_activos():
         if conn and conn.is_connected():
             cursor.close()
 
+@app.route('/api/suggest', methods=['GET'])
+def sugerir():
+    """Autocompletado de títulos, autores, ISBN y RUT desde el índice en memoria."""
+    if not indice_sugerencias.cargado:
+        return jsonify({'error': 'El índice de sugerencias se está cargando.'}), 503, {'Retry-After': '2'}
+
+    texto = request.args.get('q', '').strip()
+    limite = max(1, min(request.args.get('limite', SUGERENCIAS_LIMITE, type=int), 50))
+    tipos_param = request.args.get('tipos')
+    tipos = [t.strip() for t in tipos_param.split(',') if t.strip()] if tipos_param else list(TIPOS_SUGERENCIA)
+    invalidos = [t for t in tipos if t not in TIPOS_SUGERENCIA]
+    if invalidos:
+        return jsonify({'error': f'Tipos no válidos: {", ".join(invalidos)}'}), 400
+
+    # Los RUT solo se sugieren al personal de biblioteca.
+    if not (current_user.is_authenticated and current_user.rol in ('Bibliotecario', 'Admin')):
+        tipos = [t for t in tipos if t != 'rut']
+
+    return jsonify({'q': texto, 'sugerencias': indice_sugerencias.buscar(texto, tipos, limite)}), 200
+
 @app.route('/api/opac/buscar', methods=['GET'])
 def buscar_materiales():
     conn = get_db_connection()
@@ -840,39 +1576,21 @@ def buscar_materiales():
     query_text = request.args.get('query', '')
     categoria_id = request.args.get('categoria_id', type=int)
     
-    base_sql = """
-    SELECT 
-        M.id_material, M.titulo, M.isbn, M.anio_publicacion, M.ejemplares_disponibles,
-        A.nombre_autor, E.nombre_editorial,
-        GROUP_CONCAT(C.nombre_categoria SEPARATOR ', ') AS categorias
-    FROM 
-        MATERIALES M
-    JOIN 
-        AUTOR A ON M.AUTOR_id_autor = A.id_autor
-    JOIN 
-        EDITORIAL E ON M.EDITORIAL_id_editorial = E.id_editorial
-    LEFT JOIN 
-        MATERIALES_CATEGORIAS MC ON M.id_material = MC.MATERIALES_id_material
-    LEFT JOIN 
-        CATEGORIAS C ON MC.CATEGORIAS_id_categoria = C.id_categoria
-    WHERE 1=1 
-    """
-    params = []
-    
-    if query_text:
-        base_sql += " AND (M.titulo LIKE %s OR A.nombre_autor LIKE %s)"
-        params.extend([f'%{query_text}%', f'%{query_text}%'])
-    
-    if categoria_id:
-        base_sql += " AND M.id_material IN (SELECT MATERIALES_id_material FROM MATERIALES_CATEGORIAS WHERE CATEGORIAS_id_categoria = %s)"
-        params.append(categoria_id)
-
-    base_sql += " GROUP BY M.id_material ORDER BY M.titulo ASC"
+    # La clave usa la expresión FULLTEXT ya normalizada: 'García ' y 'garcia' comparten entrada.
+    clave = ('buscar', consulta_booleana(query_text) or query_text.strip().casefold(), categoria_id)
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(base_sql, tuple(params))
-        resultados = cursor.fetchall()
+        resultados = cache_opac.obtener(clave)
+        if resultados is None:
+            version = cache_opac.version
+            base_sql, params = sql_busqueda_opac(query_text, categoria_id, OPAC_LIMITE_RESULTADOS)
+            cursor.execute(base_sql, params)
+            resultados = cursor.fetchall()
+            if puede_cachear():
+                cache_opac.guardar(clave, resultados, version)
+        else:
+            resultados = superponer_disponibilidad(cursor, resultados)
         
         return jsonify(resultados), 200
 
@@ -888,32 +1606,18 @@ def obtener_detalle_material(material_id):
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-
-    sql = """
-    SELECT 
-        M.id_material, M.titulo, M.isbn, M.anio_publicacion, 
-        M.ejemplares_totales, M.ejemplares_disponibles, M.tipo,
-        A.nombre_autor, E.nombre_editorial,
-        GROUP_CONCAT(C.nombre_categoria SEPARATOR ', ') AS categorias
-    FROM 
-        MATERIALES M
-    JOIN 
-        AUTOR A ON M.AUTOR_id_autor = A.id_autor
-    JOIN 
-        EDITORIAL E ON M.EDITORIAL_id_editorial = E.id_editorial
-    LEFT JOIN 
-        MATERIALES_CATEGORIAS MC ON M.id_material = MC.MATERIALES_id_material
-    LEFT JOIN 
-        CATEGORIAS C ON MC.CATEGORIAS_id_categoria = C.id_categoria
-    WHERE 
-        M.id_material = %s
-    GROUP BY M.id_material
-    """
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(sql, (material_id,))
-        detalle = cursor.fetchone()
+        detalle = cache_opac.obtener(('detalle', material_id))
+        if detalle is None:
+            version = cache_opac.version
+            cursor.execute(SQL_DETALLE_MATERIAL, (material_id,))
+            detalle = cursor.fetchone()
+            if detalle and puede_cachear():
+                cache_opac.guardar(('detalle', material_id), detalle, version)
+        else:
+            detalle = superponer_disponibilidad(cursor, [detalle])[0]
         
         if detalle:
             return jsonify(detalle), 200
@@ -954,7 +1658,7 @@ def registrar_reserva():
             return jsonify({'error': 'El material está disponible actualmente. No necesita reserva.'}), 400
 
         cursor.execute(
-            "SELECT id_reserva FROM RESERVAS WHERE USUARIOS_id_usuario = %s AND MATERIALES_id_material = %s AND estado_reserva = 'Pendiente'", 
+            "SELECT id_reserva FROM RESERVAS WHERE usuario_vigente = %s AND MATERIALES_id_material = %s", 
             (id_usuario, material_id)
         )
         if cursor.fetchone():
@@ -965,12 +1669,22 @@ def registrar_reserva():
         VALUES (CURDATE(), 'Pendiente', %s, %s)
         """
         cursor.execute(sql_reserva, (id_usuario, material_id))
+        id_reserva = cursor.lastrowid
+
+        cursor.execute(
+            "SELECT COUNT(*) AS posicion FROM RESERVAS WHERE MATERIALES_id_material = %s AND estado_reserva = 'Pendiente' AND id_reserva <= %s",
+            (material_id, id_reserva)
+        )
+        posicion = cursor.fetchone()['posicion']
+        registrar_cambios(cursor, [('reserva', material_id, None)])
 
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
-        return jsonify({'message': f'Reserva registrada con éxito para el material: {material["titulo"]}. Recibirás una notificación cuando esté disponible.'}), 201
+        aviso_cambios.notificar()
+        return jsonify({
+            'message': f'Reserva registrada con éxito para el material: {material["titulo"]}. Su posición en la cola es {posicion}. Recibirás una notificación cuando esté disponible.',
+            'id_reserva': id_reserva,
+            'posicion': posicion
+        }), 201
 
     except mysql.connector.Error as err:
         conn.rollback()
@@ -983,9 +1697,19 @@ def registrar_reserva():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         rut = data.get('rut')
         password = data.get('password')
+        ip = request.remote_addr
+
+        if not isinstance(rut, str) or not rut.strip() or not isinstance(password, str):
+            return jsonify({'error': 'RUT y contraseña son obligatorios.'}), 400
+
+        # El límite se revisa antes de calcular PBKDF2 para no gastar CPU en ataques.
+        # Solo cuentan los intentos fallidos: muchos usuarios tras un mismo NAT
+        # pueden iniciar sesión a la vez.
+        if not limitador_ip.permitido(ip) or not limitador_rut.permitido(rut):
+            return jsonify({'error': 'Demasiados intentos de inicio de sesión. Intente más tarde.'}), 429
         
         conn = get_db_connection()
         if conn is None:
@@ -993,20 +1717,41 @@ def login():
 
         try:
             cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT id_usuario, nombre, rol, password_hash FROM USUARIOS WHERE rut = %s", (rut,))
+            cursor.execute("SELECT id_usuario, nombre, rol, password_hash, estado_activo FROM USUARIOS WHERE rut = %s", (rut,))
             user_data = cursor.fetchone()
             
+            if user_data and not user_data['estado_activo']:
+                return jsonify({'error': 'Cuenta bloqueada. Contacte al administrador.'}), 403
+
             if user_data:
                 user = User(user_data['id_usuario'], user_data['nombre'], user_data['rol'], user_data['password_hash'])
                 
                 if user.check_password(password): 
+                    limitador_rut.reiniciar(rut)
+                    if servicio_hash.necesita_rehash(user.password_hash):
+                        # La contraseña ya es correcta: si el rehash no se puede hacer
+                        # ahora, se reintenta en el próximo inicio de sesión.
+                        try:
+                            nuevo_hash = servicio_hash.generar(password)
+                            cursor.execute("UPDATE USUARIOS SET password_hash = %s WHERE id_usuario = %s", (nuevo_hash, user.id))
+                            conn.commit()
+                            usuarios_cache.invalidar(user.id)
+                        except (HashSaturadoError, mysql.connector.Error) as e:
+                            conn.rollback()
+                            print(f"Rehash de contraseña omitido para el usuario {user.id}: {e}")
                     login_user(user)
                     return jsonify({'message': 'Inicio de sesión exitoso.', 'user': user.nombre, 'rol': user.rol}), 200
                 else:
+                    limitador_rut.registrar(rut)
+                    limitador_ip.registrar(ip)
                     return jsonify({'error': 'Credenciales inválidas.'}), 401
             
+            limitador_rut.registrar(rut)
+            limitador_ip.registrar(ip)
             return jsonify({'error': 'Usuario no encontrado.'}), 404
-            
+
+        except HashSaturadoError:
+            return jsonify({'error': 'El servicio de autenticación está ocupado. Intente nuevamente.'}), 503, {'Retry-After': '2'}
         except Exception as e:
             print(f"Error en login: {e}")
             return jsonify({'error': 'Error en el proceso de autenticación.'}), 500
@@ -1052,6 +1797,13 @@ def obtener_usuario(usuario_id):
         if conn and conn.is_connected():
             cursor.close()
 
+SQL_LISTAR_USUARIOS = """
+SELECT 
+    id_usuario, nombre, rut, correo, telefono, rol, estado_activo 
+FROM USUARIOS 
+ORDER BY rol DESC, nombre ASC
+"""
+
 @app.route('/api/admin/usuarios', methods=['GET'])
 @login_required
 @admin_required 
@@ -1060,16 +1812,9 @@ def listar_usuarios():
     if conn is None:
         return jsonify({'error': 'Error de conexión a la base de datos'}), 500
     
-    sql = """
-    SELECT 
-        id_usuario, nombre, rut, correo, telefono, rol, estado_activo 
-    FROM USUARIOS 
-    ORDER BY rol DESC, nombre ASC
-    """
-    
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(sql)
+        cursor.execute(SQL_LISTAR_USUARIOS)
         usuarios = cursor.fetchall()
         
         return jsonify(usuarios), 200
@@ -1117,9 +1862,8 @@ def editar_usuario(usuario_id):
             return jsonify({'error': 'Usuario no encontrado o no se realizaron cambios.'}), 404
         
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
+        usuarios_cache.invalidar(usuario_id)
+        indice_sugerencias.actualizar_usuario(usuario_id, nombre)
         return jsonify({'message': f'Usuario {usuario_id} ({nombre}) actualizado correctamente.'}), 200
 
     except mysql.connector.Error as err:
@@ -1153,9 +1897,7 @@ def bloquear_usuario(usuario_id):
             return jsonify({'error': 'Usuario no encontrado.'}), 404
 
         conn.commit()
-        if 'db' in g:
-            g.db.close() 
-            g.pop('db', None) 
+        usuarios_cache.invalidar(usuario_id)
         return jsonify({'message': f'Usuario {usuario_id} desactivado correctamente. Ya no podrá iniciar sesión.'}), 200
 
     except mysql.connector.Error as err:
@@ -1183,7 +1925,7 @@ def reactivar_usuario(usuario_id):
             return jsonify({'error': 'Usuario no encontrado.'}), 404
 
         conn.commit()
-        if 'db' in g: g.db.close(); g.pop('db', None)
+        usuarios_cache.invalidar(usuario_id)
         
         return jsonify({'message': f'Usuario {usuario_id} reactivado correctamente.'}), 200
 
@@ -1201,29 +1943,10 @@ def reporte_materiales_uso():
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-
-    sql = """
-    SELECT 
-        M.titulo AS titulo_material,
-        M.isbn,
-        A.nombre_autor,
-        COUNT(P.id_prestamo) AS total_prestamos_historico
-    FROM 
-        PRESTAMOS P
-    JOIN 
-        MATERIALES M ON P.MATERIALES_id_material = M.id_material
-    JOIN
-        AUTOR A ON M.AUTOR_id_autor = A.id_autor
-    GROUP BY 
-        M.id_material, M.titulo, M.isbn, A.nombre_autor
-    ORDER BY 
-        total_prestamos_historico DESC
-    LIMIT 10
-    """
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(sql)
+        cursor.execute(SQL_REPORTE_USO)
         reporte = cursor.fetchall()
         
         return jsonify(reporte), 200
@@ -1235,6 +1958,16 @@ def reporte_materiales_uso():
         if conn and conn.is_connected():
             cursor.close()
 
+def completar_mora(filas):
+    """Calcula la mora de las filas que marcar-vencidos aún no actualizó hoy."""
+    hoy = date.today()
+    for fila in filas:
+        tipo = fila.pop('tipo')
+        if fila['multa_calculada_en'] != hoy:
+            fila['dias_mora'], fila['multa_estimada'] = politica_multas.calcular(fila['fecha_esperada'], tipo, hoy)
+        fila['multa_estimada'] = float(fila['multa_estimada'])
+        yield fila
+
 @app.route('/api/admin/reportes/mora', methods=['GET'])
 @login_required
 @role_required('Bibliotecario')
@@ -1242,32 +1975,11 @@ def reporte_usuarios_mora():
     conn = get_db_connection()
     if conn is None:
         return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-
-    sql = """
-    SELECT 
-        U.nombre AS nombre_usuario,
-        U.rut,
-        M.titulo AS titulo_material,
-        P.fecha_devolucion AS fecha_esperada,
-        DATEDIFF(CURDATE(), P.fecha_devolucion) AS dias_mora,
-        (DATEDIFF(CURDATE(), P.fecha_devolucion) * 500) AS multa_estimada
-    FROM 
-        PRESTAMOS P
-    JOIN 
-        USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario
-    JOIN 
-        MATERIALES M ON P.MATERIALES_id_material = M.id_material
-    WHERE 
-        P.estado_prestamo = 'Activo' 
-        AND P.fecha_devolucion < CURDATE()
-    ORDER BY 
-        dias_mora DESC
-    """
     
     try:
         cursor = conn.cursor(dictionary=True)
-        cursor.execute(sql)
-        reporte = cursor.fetchall()
+        cursor.execute(SQL_REPORTE_MORA)
+        reporte = list(completar_mora(cursor.fetchall()))
         
         return jsonify(reporte), 200
 
@@ -1278,16 +1990,44 @@ def reporte_usuarios_mora():
         if conn and conn.is_connected():
             cursor.close()
 
+@app.route('/api/admin/pool', methods=['GET'])
+@login_required
+@admin_required
+def estadisticas_pool():
+    """Estadísticas del pool de conexiones (prestadas, inactivas, esperas)."""
+    estadisticas = db_pool.estadisticas()
+    if enrutador_replicas.pools:
+        estadisticas['replicas'] = enrutador_replicas.estadisticas()
+    return jsonify(estadisticas), 200
+
 @app.route('/api/admin/metrics', methods=['GET'])
 @login_required
 def obtener_metricas_dashboard():
+    try:
+        metricas = metricas_dashboard.obtener(cargar_metricas_dashboard)
+    except Exception as e:
+        print(f"Error al obtener métricas del dashboard: {e}")
+        return jsonify({'error': f'Error en la consulta SQL para métricas: {e}'}), 500
+
+    user_name = current_user.nombre if current_user.is_authenticated and hasattr(current_user, 'nombre') else 'Usuario Desconocido'
+    user_role = current_user.rol if current_user.is_authenticated and hasattr(current_user, 'rol') else 'N/A'
+    
+    return jsonify({
+        'total_materiales': metricas['total_materiales'],
+        'prestamos_activos': metricas['prestamos_activos'],
+        'ultimos_materiales': metricas['ultimos_materiales'],
+        'user_role': user_role,
+        'user_name': user_name
+    }), 200
+
+def cargar_metricas_dashboard():
+    """Lee desde la base de datos los contadores que mantiene metricas_dashboard."""
     conn = get_db_connection()
     if conn is None:
-        return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+        raise mysql.connector.Error(msg='Error de conexión a la base de datos')
 
+    cursor = conn.cursor(dictionary=True)
     try:
-        cursor = conn.cursor(dictionary=True)
-        
         cursor.execute("SELECT COUNT(id_material) AS total_materiales FROM MATERIALES")
         total_materiales = cursor.fetchone()['total_materiales']
         
@@ -1302,24 +2042,14 @@ def obtener_metricas_dashboard():
         """
         cursor.execute(sql_ultimos)
         ultimos_materiales = cursor.fetchall()
-    
-        user_name = current_user.nombre if current_user.is_authenticated and hasattr(current_user, 'nombre') else 'Usuario Desconocido'
-        user_role = current_user.rol if current_user.is_authenticated and hasattr(current_user, 'rol') else 'N/A'
-        
-        return jsonify({
-            'total_materiales': total_materiales,
-            'prestamos_activos': prestamos_activos,
-            'ultimos_materiales': ultimos_materiales,
-            'user_role': user_role,
-            'user_name': user_name
-        }), 200
-    
-    except Exception as e:
-        print(f"Error al obtener métricas del dashboard: {e}")
-        return jsonify({'error': f'Error en la consulta SQL para métricas: {e}'}), 500
     finally:
-        if conn and conn.is_connected():
-            cursor.close()
+        cursor.close()
+
+    return {
+        'total_materiales': total_materiales,
+        'prestamos_activos': prestamos_activos,
+        'ultimos_materiales': ultimos_materiales
+    }
 
 @app.route('/api/registro/estudiante', methods=['POST'])
 def registrar_estudiante():
@@ -1333,8 +2063,10 @@ def registrar_estudiante():
     if not all(data.get(field) for field in required_fields):
         return jsonify({'error': 'Faltan campos obligatorios.'}), 400
 
-    from werkzeug.security import generate_password_hash
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256') 
+    try:
+        hashed_password = servicio_hash.generar(data['password'])
+    except HashSaturadoError:
+        return jsonify({'error': 'El servicio de autenticación está ocupado. Intente nuevamente.'}), 503, {'Retry-After': '2'}
 
     sql = """
     INSERT INTO USUARIOS (nombre, rut, correo, telefono, rol, password_hash, estado_activo)
@@ -1350,6 +2082,7 @@ def registrar_estudiante():
         cursor = conn.cursor()
         cursor.execute(sql, values)
         conn.commit()
+        indice_sugerencias.actualizar_usuario(cursor.lastrowid, data['nombre'], data['rut'])
 
         return jsonify({'message': '¡Registro exitoso! Ya puedes iniciar sesión.'}), 201
     except mysql.connector.Error as err:
@@ -1362,8 +2095,205 @@ def registrar_estudiante():
         if conn and conn.is_connected():
             cursor.close()
 
+SQL_EXPORTAR_MATERIALES = """
+SELECT 
+    M.id_material, M.titulo, M.isbn, M.anio_publicacion, M.tipo,
+    M.ejemplares_totales, M.ejemplares_disponibles,
+    A.nombre_autor, E.nombre_editorial
+FROM 
+    MATERIALES M
+JOIN 
+    AUTOR A ON M.AUTOR_id_autor = A.id_autor
+JOIN 
+    EDITORIAL E ON M.EDITORIAL_id_editorial = E.id_editorial
+ORDER BY M.id_material
+"""
+
+SQL_EXPORTAR_PRESTAMOS = """
+SELECT 
+    P.id_prestamo, P.fecha_prestamo, P.fecha_devolucion, P.fecha_devolucion_real,
+    P.estado_prestamo, P.monto_multa,
+    P.MATERIALES_id_material AS id_material, M.titulo AS titulo_material,
+    U.rut AS rut_usuario
+FROM 
+    PRESTAMOS P
+JOIN 
+    MATERIALES M ON P.MATERIALES_id_material = M.id_material
+JOIN 
+    USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario
+ORDER BY P.id_prestamo
+"""
+
+# recurso -> (consulta, rol requerido, transformación de filas)
+EXPORTACIONES = {
+    'materiales': (SQL_EXPORTAR_MATERIALES, 'Bibliotecario', None),
+    'prestamos': (SQL_EXPORTAR_PRESTAMOS, 'Bibliotecario', None),
+    'prestamos_activos': (SQL_PRESTAMOS_ACTIVOS, 'Bibliotecario', None),
+    'mora': (SQL_REPORTE_MORA, 'Bibliotecario', completar_mora),
+    'usuarios': (SQL_LISTAR_USUARIOS, 'Admin', None),
+}
+
+@app.route('/api/exportar/<recurso>', methods=['GET'])
+@login_required
+def exportar(recurso):
+    """Exporta un listado completo en CSV o JSON Lines sin cargarlo en memoria."""
+    if recurso not in EXPORTACIONES:
+        return jsonify({'error': f'Recurso de exportación desconocido: {recurso}'}), 404
+    sql, rol, transformar = EXPORTACIONES[recurso]
+    if current_user.rol != 'Admin' and current_user.rol != rol:
+        return jsonify({'error': f'Acceso denegado. Se requiere el rol: {rol}.'}), 403
+
+    formato = request.args.get('formato', 'csv')
+    if formato not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Formato no soportado. Use csv o jsonl.'}), 400
+    usar_gzip = request.args.get('gzip') == '1'
+
+    filas = filas_servidor(db_pool, sql)
+    if transformar:
+        filas = transformar(filas)
+    partes = a_csv(filas) if formato == 'csv' else a_jsonl(filas)
+    if usar_gzip:
+        partes = comprimir_gzip(partes)
+
+    nombre = f'{recurso}_{date.today().isoformat()}.{formato}' + ('.gz' if usar_gzip else '')
+    tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    respuesta = Response(partes, mimetype='application/gzip' if usar_gzip else tipo)
+    respuesta.headers['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    return respuesta
+
+## Comandos de mantenimiento
+
+@app.cli.command('migrar')
+def migrar():
+    """Aplica las migraciones pendientes de ModeladoDB/migraciones."""
+    conn = db_pool.obtener()
+    try:
+        nuevas = aplicar_migraciones(conn)
+        for archivo in nuevas:
+            print(f"Migración aplicada: {archivo}")
+        if not nuevas:
+            print("La base de datos ya está al día.")
+    finally:
+        db_pool.devolver(conn)
+
+@app.cli.command('reindexar-busqueda')
+def reindexar_busqueda():
+    """Recalcula texto_busqueda de todo el catálogo en lotes."""
+    conn = db_pool.obtener()
+    try:
+        cursor = conn.cursor()
+        ultimo_id = 0
+        total = 0
+        while True:
+            cursor.execute("SELECT id_material FROM MATERIALES WHERE id_material > %s ORDER BY id_material LIMIT 1000", (ultimo_id,))
+            ids = [fila[0] for fila in cursor.fetchall()]
+            if not ids:
+                break
+            cursor.execute("""
+            UPDATE MATERIALES M
+            JOIN AUTOR A ON M.AUTOR_id_autor = A.id_autor
+            SET M.texto_busqueda = CONCAT_WS(' ', M.titulo, A.nombre_autor)
+            WHERE M.id_material BETWEEN %s AND %s
+            """, (ids[0], ids[-1]))
+            conn.commit()
+            ultimo_id = ids[-1]
+            total += len(ids)
+            print(f"Reindexados {total} materiales...")
+        cursor.close()
+    finally:
+        db_pool.devolver(conn)
+
+@app.cli.command('reconstruir-estadisticas')
+def reconstruir_estadisticas():
+    """Recalcula las tablas de estadísticas de préstamo a partir de PRESTAMOS."""
+    conn = db_pool.obtener()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM ESTADISTICAS_MATERIAL_MES")
+        cursor.execute("DELETE FROM ESTADISTICAS_MATERIAL")
+        cursor.execute("""
+        INSERT INTO ESTADISTICAS_MATERIAL (MATERIALES_id_material, total_prestamos, prestamos_activos, ultimo_prestamo)
+        SELECT MATERIALES_id_material, COUNT(*), SUM(estado_prestamo = 'Activo'), MAX(fecha_prestamo)
+        FROM PRESTAMOS
+        GROUP BY MATERIALES_id_material
+        """)
+        print(f"Estadísticas de {cursor.rowcount} materiales reconstruidas.")
+        cursor.execute("""
+        INSERT INTO ESTADISTICAS_MATERIAL_MES (MATERIALES_id_material, mes, prestamos)
+        SELECT MATERIALES_id_material,
+               MAKEDATE(YEAR(fecha_prestamo), 1) + INTERVAL (MONTH(fecha_prestamo) - 1) MONTH AS mes,
+               COUNT(*)
+        FROM PRESTAMOS
+        GROUP BY MATERIALES_id_material, mes
+        """)
+        conn.commit()
+        cursor.close()
+    finally:
+        db_pool.devolver(conn)
+
+@app.cli.command('importar-catalogo')
+@click.argument('ruta')
+@click.option('--lote', default=IMPORTACION_TAMANO_LOTE, help='Filas por transacción.')
+def importar_catalogo(ruta, lote):
+    """Importa materiales desde un archivo CSV o JSONL mostrando el avance."""
+    def progreso(resumen):
+        print(f"Leídas {resumen['leidas']} | importadas {resumen['importadas']} | "
+              f"rechazadas {resumen['rechazadas']} | {resumen['filas_por_segundo']} filas/s")
+
+    conn = db_pool.obtener()
+    try:
+        with open(ruta, encoding='utf-8-sig', newline='') as stream:
+            filas = leer_jsonl(stream) if ruta.lower().endswith('.jsonl') else leer_csv(stream)
+            resumen = ImportadorCatalogo(conn, tamano_lote=lote, progreso=progreso).importar(filas)
+    finally:
+        db_pool.devolver(conn)
+
+    print(f"Importación terminada en {resumen['segundos']} s.")
+    for rechazo in resumen['rechazos']:
+        print(f"  Línea {rechazo['linea']} (ISBN {rechazo['isbn']}): {rechazo['motivo']}")
+
+def crear_planificador():
+    """Planificador con las tareas incrementales y nocturnas del SIGB."""
+    def tarea_vencidos(conn):
+        return marcar_vencidos(conn, politica_multas, TAREAS_TAMANO_LOTE, TAREAS_PAUSA_LOTE)
+
+    def tarea_reservas(conn):
+        return expirar_reservas(conn, TAREAS_TAMANO_LOTE, RESERVA_DIAS_RETIRO, RESERVA_DIAS_VIGENCIA, TAREAS_PAUSA_LOTE)
+
+    def tarea_estadisticas(conn):
+        return refrescar_estadisticas(conn, TAREAS_TAMANO_LOTE, TAREAS_PAUSA_LOTE)
+
+    def tarea_cambios(conn):
+        return purgar_cambios(conn, CIRCULACION_CAMBIOS_DIAS, TAREAS_TAMANO_LOTE)
+
+    return PlanificadorTareas(
+        db_pool,
+        incrementales=[('marcar-vencidos', tarea_vencidos), ('expirar-reservas', tarea_reservas)],
+        nocturnas=[('marcar-vencidos', tarea_vencidos), ('expirar-reservas', tarea_reservas),
+                   ('refrescar-estadisticas', tarea_estadisticas), ('purgar-cambios', tarea_cambios)],
+        intervalo=TAREAS_INTERVALO_INCREMENTAL,
+        hora_nocturna=TAREAS_HORA_NOCTURNA
+    )
+
+@app.cli.command('tareas')
+@click.option('--ejecutar', 'nombre', type=click.Choice(['marcar-vencidos', 'expirar-reservas', 'refrescar-estadisticas', 'purgar-cambios']),
+              help='Ejecuta una sola tarea y termina (para cron).')
+def tareas(nombre):
+    """Worker de tareas programadas: vencimientos, multas, reservas y estadísticas."""
+    planificador = crear_planificador()
+    if nombre:
+        funciones = dict(planificador.nocturnas)
+        planificador.ejecutar(nombre, funciones[nombre])
+        return
+    print("Worker de tareas iniciado. Ctrl+C para detener.")
+    try:
+        planificador.ejecutar_siempre()
+    except KeyboardInterrupt:
+        planificador.detener.set()
+
 ## Inicio de la Aplicación
 
 if __name__ == '__main__':
     print("Iniciando servidor Flask...")
+    iniciar_indice_sugerencias()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,493 @@
+"""Benchmark reproducible de la API del SIGB.
+
+Tiene dos pasos. El primero, `sembrar`, carga datos sintéticos sobre el
+esquema de ModeladoDB. El segundo, `carga`, ejecuta una mezcla de
+operaciones (búsquedas OPAC, detalle, préstamos, devoluciones, reportes
+y logins) desde varios hilos. Al final informa p50/p95/p99 y operaciones
+por segundo de cada operación y guarda el resultado en JSON para
+compararlo entre commits.
+
+La aplicación corre en el mismo proceso, con el cliente de pruebas de
+Flask y la base MySQL/MariaDB configurada en configuracion.py. No hace
+falta levantar el servidor ni usar contenedores.
+
+Uso:
+    python benchmark.py sembrar --materiales 500000 --usuarios 50000 --prestamos 5000000 [--crear-esquema]
+    python benchmark.py carga [--hilos 8] [--duracion 60] [--salida resultado.json] [--comparar anterior.json]
+
+--crear-esquema ejecuta 'Script SQL DB Biblioteca.sql', que BORRA y vuelve
+a crear db_biblioteca, y luego aplica las migraciones. La carga modifica
+préstamos y stock: para comparar commits con rigor, vuelva a sembrar con la
+misma semilla antes de cada corrida.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+from werkzeug.security import generate_password_hash
+
+from configuracion import PASSWORD_HASH_METODO
+from migraciones import aplicar_migraciones, separar_sentencias
+
+SCRIPT_ESQUEMA = os.path.join(os.path.dirname(__file__), '..', 'ModeladoDB', 'Script SQL DB Biblioteca.sql')
+
+RUT_PERSONAL = '99999999-9'
+PASSWORD_DEFECTO = 'benchmark'
+TAMANO_LOTE = 5000
+
+PALABRAS = [
+    'historia', 'ciencia', 'sombras', 'memoria', 'ciudad', 'mar', 'tiempo', 'guerra', 'amor', 'noche',
+    'sistemas', 'datos', 'redes', 'algoritmos', 'química', 'física', 'biología', 'economía', 'derecho', 'arte',
+    'silencio', 'viaje', 'montaña', 'río', 'fuego', 'invierno', 'verano', 'jardín', 'espejo', 'camino',
+    'ingeniería', 'cálculo', 'estructuras', 'energía', 'materiales', 'programación', 'lógica', 'filosofía', 'poesía', 'teatro',
+    'chile', 'andes', 'pacífico', 'sur', 'norte', 'desierto', 'bosque', 'isla', 'puerto', 'frontera',
+]
+NOMBRES = ['Ana', 'Luis', 'Carmen', 'José', 'María', 'Pedro', 'Isabel', 'Jorge', 'Rosa', 'Diego', 'Elena', 'Pablo']
+APELLIDOS = ['González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Sepúlveda',
+             'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres', 'Araya', 'Flores', 'Espinoza', 'Valenzuela']
+
+# Operación -> peso en la mezcla de carga.
+MEZCLA = {
+    'buscar': 40,
+    'detalle': 25,
+    'prestamo': 10,
+    'devolucion': 10,
+    'reporte': 10,
+    'login': 5,
+}
+
+
+def digito_verificador(numero):
+    suma, factor = 0, 2
+    for digito in reversed(str(numero)):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+
+def conectar():
+    from app import db_config
+    return mysql.connector.connect(**db_config)
+
+
+## Generación de datos
+
+def crear_esquema():
+    """Recrea la base con el script de ModeladoDB y aplica las migraciones."""
+    from app import db_config
+    config = {clave: valor for clave, valor in db_config.items() if clave != 'database'}
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+    with open(SCRIPT_ESQUEMA, encoding='utf-8') as archivo:
+        for sentencia in separar_sentencias(archivo.read()):
+            cursor.execute(sentencia)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    conn = conectar()
+    for migracion in aplicar_migraciones(conn):
+        print(f"Migración aplicada: {migracion}")
+    conn.close()
+
+
+def insertar_en_lotes(conn, sql, filas, etiqueta):
+    cursor = conn.cursor()
+    lote = []
+    total = 0
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            cursor.executemany(sql, lote)
+            conn.commit()
+            total += len(lote)
+            lote = []
+            if total % (TAMANO_LOTE * 20) == 0:
+                print(f"  {etiqueta}: {total}")
+    if lote:
+        cursor.executemany(sql, lote)
+        conn.commit()
+        total += len(lote)
+    cursor.close()
+    print(f"  {etiqueta}: {total} insertados")
+
+
+def ids_desde(conn, tabla, columna, minimo):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {columna} FROM {tabla} WHERE {columna} > %s ORDER BY {columna}", (minimo,))
+    ids = [fila[0] for fila in cursor.fetchall()]
+    cursor.close()
+    return ids
+
+
+def ultimo_id(conn, tabla, columna):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COALESCE(MAX({columna}), 0) FROM {tabla}")
+    valor = cursor.fetchone()[0]
+    cursor.close()
+    return valor
+
+
+def sembrar(materiales, usuarios, prestamos, semilla, password):
+    rnd = random.Random(semilla)
+    conn = conectar()
+    cursor = conn.cursor()
+    # Las comprobaciones se desactivan solo en esta sesión para acelerar la carga.
+    cursor.execute("SET SESSION unique_checks = 0")
+    cursor.execute("SET SESSION foreign_key_checks = 0")
+    cursor.close()
+    inicio = time.monotonic()
+
+    print("Generando tablas de apoyo...")
+    cantidad_autores = max(10, materiales // 20)
+    base_autor = ultimo_id(conn, 'AUTOR', 'id_autor')
+    nombres_autores = [f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}" for _ in range(cantidad_autores)]
+    insertar_en_lotes(conn, "INSERT INTO AUTOR (nombre_autor) VALUES (%s)", ((n,) for n in nombres_autores), 'autores')
+    autores = list(zip(ids_desde(conn, 'AUTOR', 'id_autor', base_autor), nombres_autores))
+
+    base_editorial = ultimo_id(conn, 'EDITORIAL', 'id_editorial')
+    insertar_en_lotes(conn, "INSERT INTO EDITORIAL (nombre_editorial) VALUES (%s)",
+                      ((f"Editorial {rnd.choice(APELLIDOS)} {i}",) for i in range(200)), 'editoriales')
+    editoriales = ids_desde(conn, 'EDITORIAL', 'id_editorial', base_editorial)
+
+    base_categoria = ultimo_id(conn, 'CATEGORIAS', 'id_categoria')
+    insertar_en_lotes(conn, "INSERT INTO CATEGORIAS (nombre_categoria, descripcion) VALUES (%s, %s)",
+                      ((f"{p.capitalize()} {i}", 'Categoría sintética de benchmark.') for i, p in enumerate(PALABRAS[:30])),
+                      'categorías')
+    categorias = ids_desde(conn, 'CATEGORIAS', 'id_categoria', base_categoria)
+
+    print("Generando usuarios...")
+    password_hash = generate_password_hash(password, method=PASSWORD_HASH_METODO)
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM USUARIOS WHERE rut = %s", (RUT_PERSONAL,))
+    if cursor.fetchone() is None:
+        cursor.execute(
+            "INSERT INTO USUARIOS (nombre, rut, correo, telefono, rol, password_hash, estado_activo) "
+            "VALUES ('Personal Benchmark', %s, 'benchmark@biblioteca.cl', '900000000', 'Bibliotecario', %s, TRUE)",
+            (RUT_PERSONAL, password_hash)
+        )
+        conn.commit()
+    cursor.close()
+
+    base_usuario = ultimo_id(conn, 'USUARIOS', 'id_usuario')
+    insertar_en_lotes(
+        conn,
+        "INSERT INTO USUARIOS (nombre, rut, correo, telefono, rol, password_hash, estado_activo) "
+        "VALUES (%s, %s, %s, %s, 'Estudiante', %s, TRUE)",
+        ((f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)}",
+          f"{base_usuario + 70000000 + i}-{digito_verificador(base_usuario + 70000000 + i)}",
+          f"bench{base_usuario + i}@estudiante.cl", '900000000', password_hash)
+         for i in range(usuarios)),
+        'usuarios'
+    )
+    ids_usuarios = ids_desde(conn, 'USUARIOS', 'id_usuario', base_usuario)
+
+    print("Generando materiales...")
+    base_material = ultimo_id(conn, 'MATERIALES', 'id_material')
+
+    def filas_materiales():
+        for i in range(materiales):
+            titulo = ' '.join(rnd.sample(PALABRAS, rnd.randint(2, 5))).capitalize()[:100]
+            autor_id, autor = rnd.choice(autores)
+            ejemplares = rnd.randint(1, 10)
+            yield (titulo, rnd.randint(1950, 2025), f"BENCH-{base_material + i + 1}", ejemplares, ejemplares,
+                   rnd.choice(editoriales), autor_id, f"{titulo} {autor}")
+
+    insertar_en_lotes(
+        conn,
+        "INSERT INTO MATERIALES (titulo, anio_publicacion, isbn, ejemplares_totales, ejemplares_disponibles, "
+        "tipo, disponible, EDITORIAL_id_editorial, AUTOR_id_autor, texto_busqueda) "
+        "VALUES (%s, %s, %s, %s, %s, 'Libro', 'S', %s, %s, %s)",
+        filas_materiales(), 'materiales'
+    )
+    ids_materiales = ids_desde(conn, 'MATERIALES', 'id_material', base_material)
+
+    insertar_en_lotes(
+        conn,
+        "INSERT INTO MATERIALES_CATEGORIAS (MATERIALES_id_material, CATEGORIAS_id_categoria) VALUES (%s, %s)",
+        ((material_id, categoria_id) for material_id in ids_materiales
+         for categoria_id in rnd.sample(categorias, rnd.randint(1, 3))),
+        'categorías de materiales'
+    )
+
+    print("Generando préstamos...")
+    hoy = date.today()
+
+    def filas_prestamos():
+        for _ in range(prestamos):
+            dias = rnd.randint(0, 730)
+            fecha_prestamo = datetime.combine(hoy - timedelta(days=dias), datetime.min.time()) + timedelta(minutes=rnd.randint(480, 1200))
+            fecha_devolucion = fecha_prestamo.date() + timedelta(days=14)
+            if dias < 30 and rnd.random() < 0.5:
+                yield (fecha_prestamo, fecha_devolucion, 'Activo', None, 0, rnd.choice(ids_usuarios), rnd.choice(ids_materiales))
+            else:
+                real = min(hoy, fecha_prestamo.date() + timedelta(days=rnd.randint(1, 20)))
+                atraso = max(0, (real - fecha_devolucion).days)
+                yield (fecha_prestamo, fecha_devolucion, 'Devuelto', real, atraso * 500,
+                       rnd.choice(ids_usuarios), rnd.choice(ids_materiales))
+
+    insertar_en_lotes(
+        conn,
+        "INSERT INTO PRESTAMOS (fecha_prestamo, fecha_devolucion, estado_prestamo, fecha_devolucion_real, "
+        "monto_multa, USUARIOS_id_usuario, MATERIALES_id_material) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+        filas_prestamos(), 'préstamos'
+    )
+
+    print("Ajustando stock, estadísticas e índices...")
+    cursor = conn.cursor()
+    cursor.execute("""
+    UPDATE MATERIALES M
+    JOIN (SELECT MATERIALES_id_material, COUNT(*) AS activos FROM PRESTAMOS
+          WHERE estado_prestamo = 'Activo' GROUP BY MATERIALES_id_material) P
+      ON P.MATERIALES_id_material = M.id_material
+    SET M.ejemplares_disponibles = GREATEST(M.ejemplares_totales - P.activos, 0)
+    WHERE M.id_material > %s
+    """, (base_material,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    from app import app
+    app.test_cli_runner().invoke(args=['reconstruir-estadisticas'])
+
+    conn = conectar()
+    cursor = conn.cursor()
+    cursor.execute("ANALYZE TABLE AUTOR, EDITORIAL, CATEGORIAS, USUARIOS, MATERIALES, MATERIALES_CATEGORIAS, PRESTAMOS, ESTADISTICAS_MATERIAL")
+    cursor.fetchall()
+    cursor.close()
+    conn.close()
+    print(f"Datos sintéticos generados en {time.monotonic() - inicio:.0f} s.")
+
+
+## Carga de trabajo
+
+class Carga:
+    """Estado compartido por los hilos y una función por operación de la mezcla."""
+
+    def __init__(self, app, semilla, rut_personal, password):
+        self.app = app
+        self.semilla = semilla
+        self.rut_personal = rut_personal
+        self.password = password
+        self._lock = threading.Lock()
+
+        conn = conectar()
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(id_material), MAX(id_material) FROM MATERIALES")
+        self.rango_materiales = cursor.fetchone()
+        cursor.execute("SELECT rut FROM USUARIOS WHERE rol = 'Estudiante' AND estado_activo = TRUE ORDER BY id_usuario LIMIT 20000")
+        self.ruts = [fila[0] for fila in cursor.fetchall()]
+        cursor.execute("SELECT id_prestamo FROM PRESTAMOS WHERE estado_prestamo = 'Activo' ORDER BY id_prestamo LIMIT 20000")
+        activos = [fila[0] for fila in cursor.fetchall()]
+        cursor.execute("SELECT MIN(id_categoria), MAX(id_categoria) FROM CATEGORIAS")
+        self.rango_categorias = cursor.fetchone()
+        cursor.close()
+        conn.close()
+
+        if not self.ruts or self.rango_materiales[0] is None:
+            sys.exit("La base no tiene datos suficientes; ejecute primero 'python benchmark.py sembrar'.")
+        random.Random(semilla).shuffle(activos)
+        self.prestamos_activos = deque(activos)
+
+    def cliente(self, rnd):
+        cliente = self.app.test_client()
+        # Cada cliente usa una IP distinta para no toparse con el límite de intentos por IP.
+        cliente.environ_base['REMOTE_ADDR'] = f"10.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}"
+        return cliente
+
+    def cliente_personal(self, rnd):
+        cliente = self.cliente(rnd)
+        respuesta = cliente.post('/login', json={'rut': self.rut_personal, 'password': self.password})
+        if respuesta.status_code != 200:
+            sys.exit(f"No se pudo iniciar sesión como {self.rut_personal}: {respuesta.status_code} {respuesta.get_data(as_text=True)}")
+        return cliente
+
+    def buscar(self, cliente, rnd):
+        texto = ' '.join(rnd.sample(PALABRAS, rnd.choice((1, 1, 2))))
+        params = {'query': texto}
+        if rnd.random() < 0.2:
+            params['categoria_id'] = rnd.randint(*self.rango_categorias)
+        return cliente.get('/api/opac/buscar', query_string=params).status_code
+
+    def detalle(self, cliente, rnd):
+        return cliente.get(f'/api/opac/detalle/{rnd.randint(*self.rango_materiales)}').status_code
+
+    def prestamo(self, cliente, rnd):
+        respuesta = cliente.post('/api/circulacion/prestamo', json={
+            'rut_usuario': rnd.choice(self.ruts), 'material_id': rnd.randint(*self.rango_materiales)
+        })
+        if respuesta.status_code == 201:
+            with self._lock:
+                self.prestamos_activos.append(respuesta.get_json()['id_prestamo'])
+        return respuesta.status_code
+
+    def devolucion(self, cliente, rnd):
+        with self._lock:
+            id_prestamo = self.prestamos_activos.popleft() if self.prestamos_activos else None
+        if id_prestamo is None:
+            return self.prestamo(cliente, rnd)
+        return cliente.post('/api/circulacion/devolucion', json={'id_prestamo': id_prestamo}).status_code
+
+    def reporte(self, cliente, rnd):
+        ruta = rnd.choice(('/api/admin/reportes/uso', '/api/admin/reportes/mora', '/api/admin/metrics'))
+        return cliente.get(ruta).status_code
+
+    def login(self, cliente, rnd):
+        nuevo = self.cliente(rnd)
+        return nuevo.post('/login', json={'rut': rnd.choice(self.ruts), 'password': self.password}).status_code
+
+
+def percentil(ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def ejecutar(carga, hilos, duracion, calentamiento):
+    muestras = {operacion: [] for operacion in MEZCLA}
+    operaciones, pesos = list(MEZCLA), list(MEZCLA.values())
+
+    def trabajador(indice, hasta, medir):
+        rnd = random.Random(carga.semilla * 1000 + indice)
+        cliente = carga.cliente_personal(rnd)
+        while time.perf_counter() < hasta:
+            operacion = rnd.choices(operaciones, pesos)[0]
+            inicio = time.perf_counter()
+            estado = getattr(carga, operacion)(cliente, rnd)
+            if medir:
+                # list.append es atómico: no hace falta un lock por muestra.
+                muestras[operacion].append((time.perf_counter() - inicio, estado))
+
+    for medir, segundos in ((False, calentamiento), (True, duracion)):
+        if segundos <= 0:
+            continue
+        hasta = time.perf_counter() + segundos
+        threads = [threading.Thread(target=trabajador, args=(i, hasta, medir)) for i in range(hilos)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return muestras
+
+
+def resumir(muestras, duracion):
+    resultado = {}
+    for operacion, datos in muestras.items():
+        if not datos:
+            continue
+        latencias = sorted(latencia * 1000 for latencia, _ in datos)
+        estados = {}
+        for _, estado in datos:
+            estados[str(estado)] = estados.get(str(estado), 0) + 1
+        resultado[operacion] = {
+            'operaciones': len(datos),
+            'por_segundo': round(len(datos) / duracion, 2),
+            'p50_ms': round(percentil(latencias, 50), 2),
+            'p95_ms': round(percentil(latencias, 95), 2),
+            'p99_ms': round(percentil(latencias, 99), 2),
+            'max_ms': round(latencias[-1], 2),
+            'estados': estados,
+        }
+    return resultado
+
+
+def escala_actual():
+    conn = conectar()
+    cursor = conn.cursor()
+    escala = {}
+    for tabla in ('MATERIALES', 'USUARIOS', 'PRESTAMOS'):
+        cursor.execute(f"SELECT COUNT(*) FROM {tabla}")
+        escala[tabla.lower()] = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return escala
+
+
+def commit_actual():
+    try:
+        salida = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return salida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def imprimir(resultado, anterior=None):
+    print(f"\n{'operación':<12}{'ops':>8}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  estados")
+    for operacion, datos in resultado['operaciones'].items():
+        linea = (f"{operacion:<12}{datos['operaciones']:>8}{datos['por_segundo']:>9}"
+                 f"{datos['p50_ms']:>9}{datos['p95_ms']:>9}{datos['p99_ms']:>9}  {datos['estados']}")
+        previo = (anterior or {}).get('operaciones', {}).get(operacion)
+        if previo and previo['p95_ms']:
+            linea += f"  (p95 {(datos['p95_ms'] / previo['p95_ms'] - 1) * 100:+.1f}% vs {anterior.get('commit')})"
+        print(linea)
+
+
+def carga(args):
+    from app import app
+    instancia = Carga(app, args.semilla, args.rut, args.password)
+    inicio = time.perf_counter()
+    muestras = ejecutar(instancia, args.hilos, args.duracion, args.calentamiento)
+    print(f"Carga terminada en {time.perf_counter() - inicio:.0f} s.")
+
+    resultado = {
+        'commit': commit_actual(),
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'parametros': {'hilos': args.hilos, 'duracion': args.duracion, 'semilla': args.semilla, 'mezcla': MEZCLA},
+        'escala': escala_actual(),
+        'operaciones': resumir(muestras, args.duracion),
+    }
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+    imprimir(resultado, anterior)
+
+    salida = args.salida or f"benchmark_{resultado['commit'] or 'sin_commit'}.json"
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la API del SIGB.')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p_sembrar = subparsers.add_parser('sembrar', help='Genera datos sintéticos.')
+    p_sembrar.add_argument('--materiales', type=int, default=50000)
+    p_sembrar.add_argument('--usuarios', type=int, default=5000)
+    p_sembrar.add_argument('--prestamos', type=int, default=500000)
+    p_sembrar.add_argument('--semilla', type=int, default=42)
+    p_sembrar.add_argument('--password', default=PASSWORD_DEFECTO)
+    p_sembrar.add_argument('--crear-esquema', action='store_true', help='Borra y recrea la base antes de sembrar.')
+
+    p_carga = subparsers.add_parser('carga', help='Ejecuta la mezcla de operaciones y mide latencias.')
+    p_carga.add_argument('--hilos', type=int, default=8)
+    p_carga.add_argument('--duracion', type=float, default=60, help='Segundos medidos.')
+    p_carga.add_argument('--calentamiento', type=float, default=10, help='Segundos previos sin medir.')
+    p_carga.add_argument('--semilla', type=int, default=42)
+    p_carga.add_argument('--rut', default=RUT_PERSONAL, help='RUT del bibliotecario que opera la carga.')
+    p_carga.add_argument('--password', default=PASSWORD_DEFECTO)
+    p_carga.add_argument('--salida', help='Archivo JSON de resultados.')
+    p_carga.add_argument('--comparar', help='JSON de una corrida anterior para comparar el p95.')
+
+    args = parser.parse_args()
+    if args.comando == 'sembrar':
+        if args.crear_esquema:
+            crear_esquema()
+        sembrar(args.materiales, args.usuarios, args.prestamos, args.semilla, args.password)
+    else:
+        carga(args)
+
+
+if __name__ == '__main__':
+    main()
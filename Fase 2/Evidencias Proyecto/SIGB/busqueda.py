@@ -0,0 +1,32 @@
+import re
+import unicodedata
+
+# Largo mínimo de token indexado por InnoDB (innodb_ft_min_token_size).
+LARGO_MINIMO_TOKEN = 3
+
+
+def normalizar(texto):
+    """Pasa el texto a minúsculas y elimina tildes ('García' -> 'garcia')."""
+    if not texto:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return sin_tildes.casefold()
+
+
+def tokenizar(texto):
+    """Separa el texto normalizado en palabras, descartando operadores FULLTEXT."""
+    return re.findall(r'\w+', normalizar(texto))
+
+
+def consulta_booleana(texto):
+    """Construye la expresión MATCH ... IN BOOLEAN MODE para el texto ingresado.
+
+    Cada palabra es obligatoria y admite coincidencia por prefijo, de modo que
+    'garcia marq' encuentra 'Gabriel García Márquez'. Devuelve None si no
+    queda ninguna palabra indexable.
+    """
+    tokens = [t for t in tokenizar(texto) if len(t) >= LARGO_MINIMO_TOKEN]
+    if not tokens:
+        return None
+    return ' '.join(f'+{t}*' for t in tokens)
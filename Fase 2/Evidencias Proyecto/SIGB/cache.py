@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheVersionado:
+    """Cache en memoria de un único valor con TTL y contador de versión.
+
+    Cada invalidación incrementa la versión; un valor calculado a partir de
+    una versión anterior se descarta al guardarlo, de modo que una escritura
+    concurrente con la carga nunca deja datos obsoletos en la cache.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._valor = None
+        self._expira = 0.0
+
+    def obtener(self):
+        with self._lock:
+            if self._valor is not None and time.monotonic() < self._expira:
+                return self._valor
+            return None
+
+    def guardar(self, valor, version):
+        with self._lock:
+            if version == self.version:
+                self._valor = valor
+                self._expira = time.monotonic() + self.ttl
+        return valor
+
+    def invalidar(self):
+        with self._lock:
+            self.version += 1
+            self._valor = None
+
+
+class CacheTTL:
+    """Cache en memoria clave -> valor con expiración por entrada.
+
+    Como CacheVersionado, pero la versión es por clave: se toma con
+    `version(clave)` antes de leer la base y `guardar` descarta el valor si
+    esa clave se invalidó mientras tanto.
+    """
+
+    def __init__(self, ttl, max_entradas=10000):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._datos = {}
+        self._invalidaciones = 0
+        self._invalidada_en = {}
+        # Al olvidar invalidaciones antiguas se recuerda la mayor olvidada:
+        # una lectura anterior a ella no se guarda.
+        self._piso = 0
+
+    def version(self, clave):
+        with self._lock:
+            return self._invalidaciones
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if time.monotonic() >= expira:
+                del self._datos[clave]
+                return None
+            return valor
+
+    def guardar(self, clave, valor, version=None):
+        with self._lock:
+            if version is not None and (version < self._piso or self._invalidada_en.get(clave, 0) > version):
+                return valor
+            if len(self._datos) >= self.max_entradas and clave not in self._datos:
+                ahora = time.monotonic()
+                self._datos = {c: e for c, e in self._datos.items() if e[1] > ahora}
+                if len(self._datos) >= self.max_entradas:
+                    self._datos.pop(next(iter(self._datos)))
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+        return valor
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._invalidaciones += 1
+            self._invalidada_en.pop(clave, None)
+            self._invalidada_en[clave] = self._invalidaciones
+            if len(self._invalidada_en) > self.max_entradas:
+                # La primera clave del dict es la de invalidación más antigua.
+                self._piso = self._invalidada_en.pop(next(iter(self._invalidada_en)))
+
+
+class CacheLRU:
+    """Cache clave -> valor de tamaño acotado que desaloja la entrada menos usada.
+
+    Igual que CacheVersionado, cada invalidación incrementa la versión y vacía
+    la cache; un valor leído antes de la invalidación se descarta al guardarlo.
+    El TTL acota cuánto tarda en verse una escritura hecha por otro proceso.
+    """
+
+    def __init__(self, max_entradas, ttl):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.invalidado_en = float('-inf')
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or time.monotonic() >= entrada[1]:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor, version):
+        with self._lock:
+            if version != self.version:
+                return valor
+            self._datos[clave] = (valor, time.monotonic() + self.ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+        return valor
+
+    def invalidar(self):
+        with self._lock:
+            self.version += 1
+            self.invalidado_en = time.monotonic()
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'aciertos': self.aciertos, 'fallos': self.fallos, 'desalojos': self.desalojos,
+                'entradas': len(self._datos), 'version': self.version
+            }
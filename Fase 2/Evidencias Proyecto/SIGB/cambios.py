@@ -0,0 +1,114 @@
+import threading
+
+
+def registrar_cambios(cursor, cambios):
+    """Agrega al feed de circulación los cambios [(tipo, material_id, id_prestamo)].
+
+    Debe llamarse dentro de la transacción del cambio y después de ajustar el
+    stock: cada fila guarda ejemplares_disponibles tal como queda al confirmar.
+    """
+    if not cambios:
+        return
+    filas = ', '.join(
+        ["(%s, %s, %s, (SELECT ejemplares_disponibles FROM MATERIALES WHERE id_material = %s), NOW())"] * len(cambios)
+    )
+    params = []
+    for tipo, material_id, id_prestamo in cambios:
+        params.extend([tipo, material_id, id_prestamo, material_id])
+    cursor.execute(
+        "INSERT INTO CAMBIOS_CIRCULACION (tipo, MATERIALES_id_material, PRESTAMOS_id_prestamo, ejemplares_disponibles, creado_en) VALUES " + filas,
+        tuple(params)
+    )
+
+
+def leer_cambios(cursor, desde, limite):
+    """Cambios posteriores a `desde`, con los datos del préstamo para agregar su fila en el mesón."""
+    cursor.execute(
+        """
+        SELECT
+            C.id_cambio, C.tipo, C.MATERIALES_id_material AS material_id, C.ejemplares_disponibles,
+            C.PRESTAMOS_id_prestamo AS id_prestamo, P.fecha_prestamo, P.fecha_devolucion,
+            M.titulo AS titulo_material, U.rut AS rut_usuario, C.creado_en, NOW() AS ahora
+        FROM CAMBIOS_CIRCULACION C
+        LEFT JOIN PRESTAMOS P ON C.PRESTAMOS_id_prestamo = P.id_prestamo
+        LEFT JOIN MATERIALES M ON C.MATERIALES_id_material = M.id_material
+        LEFT JOIN USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario
+        WHERE C.id_cambio > %s
+        ORDER BY C.id_cambio
+        LIMIT %s
+        """,
+        (desde, limite)
+    )
+    return cursor.fetchall()
+
+
+def tramo_confirmado(filas, desde, gracia):
+    """Primeras filas sin huecos de id_cambio a partir de `desde`.
+
+    Un hueco puede ser una transacción que tomó su id y aún no confirma; si el
+    feed avanzara sobre él, ese cambio no se entregaría nunca. El hueco solo se
+    salta cuando la fila siguiente tiene más de `gracia` segundos (el id quedó
+    libre por un rollback).
+    """
+    confirmadas = []
+    esperado = desde + 1
+    for fila in filas:
+        if fila['id_cambio'] != esperado and (fila['ahora'] - fila['creado_en']).total_seconds() < gracia:
+            break
+        confirmadas.append(fila)
+        esperado = fila['id_cambio'] + 1
+    return confirmadas
+
+
+def ultimo_cambio(cursor, gracia):
+    """Punto de partida de un feed nuevo.
+
+    Se toma el último cambio con más de `gracia` segundos, así el feed
+    entrega de nuevo los más recientes en vez de saltarse alguno aún sin
+    confirmar; aplicarlos dos veces no altera la tabla del mesón.
+    """
+    cursor.execute(
+        "SELECT COALESCE(MAX(id_cambio), 0) AS ultimo FROM CAMBIOS_CIRCULACION WHERE creado_en < NOW() - INTERVAL %s SECOND",
+        (gracia,)
+    )
+    return cursor.fetchone()['ultimo']
+
+
+def purgar_cambios(conn, dias, tamano_lote):
+    """Borra por lotes los cambios con más de `dias` días; un mesón tan atrasado recarga la lista."""
+    cursor = conn.cursor()
+    borrados = 0
+    while True:
+        cursor.execute(
+            "DELETE FROM CAMBIOS_CIRCULACION WHERE creado_en < NOW() - INTERVAL %s DAY ORDER BY id_cambio LIMIT %s",
+            (dias, tamano_lote)
+        )
+        conn.commit()
+        borrados += cursor.rowcount
+        if cursor.rowcount < tamano_lote:
+            break
+    cursor.close()
+    return {'cambios_purgados': borrados}
+
+
+class AvisoCambios:
+    """Despierta a los feeds de este proceso cuando se confirma un cambio.
+
+    Los cambios confirmados por otros procesos se ven en la siguiente consulta
+    periódica del feed.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._contador = 0
+
+    def notificar(self):
+        with self._cond:
+            self._contador += 1
+            self._cond.notify_all()
+
+    def esperar(self, visto, timeout):
+        """Espera hasta que el contador cambie respecto de `visto` o pase `timeout`; devuelve el contador."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._contador != visto, timeout)
+            return self._contador
@@ -0,0 +1,270 @@
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+
+class PoolAgotadoError(mysql.connector.Error):
+    """Se lanza cuando no se obtiene una conexión dentro del tiempo de espera."""
+
+
+class PoolConexiones:
+    """Pool de conexiones MySQL compartido por todo el proceso.
+
+    Mantiene hasta `size` conexiones inactivas y permite `overflow` conexiones
+    extra en momentos de carga; las de overflow se cierran al devolverse si el
+    pool ya está lleno. Cada conexión se valida con un ping al prestarla y se
+    recicla al superar `max_lifetime` segundos.
+    """
+
+    def __init__(self, db_config, size=5, overflow=10, timeout=10, max_lifetime=1800, ping_on_borrow=True):
+        self.db_config = db_config
+        self.size = size
+        self.overflow = overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_on_borrow = ping_on_borrow
+
+        self._cond = threading.Condition()
+        self._inactivas = deque()
+        self._creadas_en = {}
+        self._prestadas = 0
+
+        self._total_prestamos = 0
+        self._total_esperas = 0
+        self._tiempo_espera_total = 0.0
+        self._tiempo_espera_max = 0.0
+        self._timeouts = 0
+        self._descartadas = 0
+
+    def _abiertas(self):
+        return self._prestadas + len(self._inactivas)
+
+    def _crear(self):
+        conn = mysql.connector.connect(**self.db_config)
+        with self._cond:
+            self._creadas_en[id(conn)] = time.monotonic()
+        return conn
+
+    def _descartar(self, conn):
+        """Saca la conexión de las cuentas del pool; se llama con el lock tomado."""
+        self._creadas_en.pop(id(conn), None)
+        self._descartadas += 1
+
+    @staticmethod
+    def _cerrar(conn):
+        # Fuera del lock: cerrar una conexión caída puede tardar hasta el timeout de red.
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def _vencida(self, conn):
+        creada = self._creadas_en.get(id(conn), 0)
+        return self.max_lifetime and time.monotonic() - creada > self.max_lifetime
+
+    def _sana(self, conn):
+        if not self.ping_on_borrow:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def obtener(self):
+        """Presta una conexión del pool, esperando si se alcanzó el límite."""
+        inicio = time.monotonic()
+        espero = False
+        while True:
+            with self._cond:
+                while not self._inactivas and self._abiertas() >= self.size + self.overflow:
+                    restante = self.timeout - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        self._timeouts += 1
+                        raise PoolAgotadoError(msg='No hay conexiones disponibles en el pool.')
+                    espero = True
+                    self._cond.wait(restante)
+
+                # Se reserva el cupo antes de validar o conectar fuera del lock.
+                conn = self._inactivas.pop() if self._inactivas else None
+                self._prestadas += 1
+
+            if conn is None:
+                try:
+                    conn = self._crear()
+                except mysql.connector.Error:
+                    with self._cond:
+                        self._prestadas -= 1
+                        self._cond.notify()
+                    raise
+            elif self._vencida(conn) or not self._sana(conn):
+                with self._cond:
+                    self._prestadas -= 1
+                    self._descartar(conn)
+                    self._cond.notify()
+                self._cerrar(conn)
+                continue
+
+            with self._cond:
+                self._registrar_prestamo(inicio, espero)
+            return conn
+
+    def _registrar_prestamo(self, inicio, espero):
+        self._total_prestamos += 1
+        if espero:
+            espera = time.monotonic() - inicio
+            self._total_esperas += 1
+            self._tiempo_espera_total += espera
+            self._tiempo_espera_max = max(self._tiempo_espera_max, espera)
+
+    def devolver(self, conn, descartar=False):
+        """Devuelve una conexión al pool, descartando transacciones pendientes.
+
+        Con `descartar=True` la conexión se cierra en vez de reutilizarse (por
+        ejemplo, si quedó un resultado sin leer).
+        """
+        reutilizable = not descartar
+        if reutilizable:
+            try:
+                if conn.is_connected():
+                    if conn.in_transaction:
+                        conn.rollback()
+                else:
+                    reutilizable = False
+            except mysql.connector.Error:
+                reutilizable = False
+
+        with self._cond:
+            self._prestadas -= 1
+            cerrar = not (reutilizable and len(self._inactivas) < self.size and not self._vencida(conn))
+            if cerrar:
+                self._descartar(conn)
+            else:
+                self._inactivas.append(conn)
+            self._cond.notify()
+        if cerrar:
+            self._cerrar(conn)
+
+    def estadisticas(self):
+        """Resumen del estado del pool para dimensionarlo."""
+        with self._cond:
+            return {
+                'size': self.size,
+                'overflow': self.overflow,
+                'prestadas': self._prestadas,
+                'inactivas': len(self._inactivas),
+                'total_prestamos': self._total_prestamos,
+                'total_esperas': self._total_esperas,
+                'espera_promedio_ms': round(self._tiempo_espera_total / self._total_esperas * 1000, 2) if self._total_esperas else 0.0,
+                'espera_max_ms': round(self._tiempo_espera_max * 1000, 2),
+                'timeouts': self._timeouts,
+                'descartadas': self._descartadas,
+            }
+
+    def cerrar(self):
+        """Cierra todas las conexiones inactivas."""
+        with self._cond:
+            inactivas = list(self._inactivas)
+            self._inactivas.clear()
+            for conn in inactivas:
+                self._descartar(conn)
+            self._cond.notify_all()
+        for conn in inactivas:
+            self._cerrar(conn)
+
+
+class EnrutadorReplicas:
+    """Reparte lecturas entre réplicas según el retraso que tolera cada endpoint.
+
+    El retraso de cada réplica (Seconds_Behind_Source) se consulta como mucho
+    cada `intervalo` segundos. Una réplica sin replicación activa, inalcanzable
+    o más atrasada que la tolerancia pedida no se usa; en ese caso `obtener`
+    devuelve None y la lectura va al primario.
+    """
+
+    def __init__(self, pools, intervalo=5):
+        self.pools = pools
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._retrasos = [None] * len(pools)
+        self._verificar_en = [0.0] * len(pools)
+        self._siguiente = 0
+        self._lecturas = [0] * len(pools)
+        self._rechazos = 0
+
+    def _medir_retraso(self, pool):
+        conn = pool.obtener()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+                campo = 'Seconds_Behind_Source'
+            except mysql.connector.Error:
+                # MySQL anterior a 8.0.22.
+                cursor.execute("SHOW SLAVE STATUS")
+                campo = 'Seconds_Behind_Master'
+            canales = cursor.fetchall()
+            cursor.close()
+        finally:
+            pool.devolver(conn)
+        retrasos = [canal.get(campo) for canal in canales]
+        if not retrasos or None in retrasos:
+            return None
+        return max(retrasos)
+
+    def retraso(self, indice):
+        """Retraso en segundos de la réplica, o None si no está replicando."""
+        ahora = time.monotonic()
+        with self._lock:
+            verificar = ahora >= self._verificar_en[indice]
+            if verificar:
+                # Solo un hilo mide; los demás usan el último valor conocido.
+                self._verificar_en[indice] = ahora + self.intervalo
+        if verificar:
+            try:
+                retraso = self._medir_retraso(self.pools[indice])
+            except mysql.connector.Error as e:
+                print(f"Réplica {indice} no disponible: {e}")
+                retraso = None
+            with self._lock:
+                self._retrasos[indice] = retraso
+        return self._retrasos[indice]
+
+    def obtener(self, tolerancia):
+        """Devuelve (pool, conexión) de una réplica con retraso <= tolerancia, o None."""
+        if not self.pools:
+            return None
+        with self._lock:
+            inicio = self._siguiente
+            self._siguiente = (inicio + 1) % len(self.pools)
+        for paso in range(len(self.pools)):
+            indice = (inicio + paso) % len(self.pools)
+            retraso = self.retraso(indice)
+            if retraso is None or retraso > tolerancia:
+                continue
+            try:
+                conn = self.pools[indice].obtener()
+            except mysql.connector.Error as e:
+                print(f"Réplica {indice} no disponible: {e}")
+                with self._lock:
+                    self._retrasos[indice] = None
+                continue
+            with self._lock:
+                self._lecturas[indice] += 1
+            return self.pools[indice], conn
+        with self._lock:
+            self._rechazos += 1
+        return None
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'replicas': [
+                    {'host': pool.db_config.get('host'), 'port': pool.db_config.get('port', 3306),
+                     'retraso_s': self._retrasos[i], 'lecturas': self._lecturas[i], 'pool': pool.estadisticas()}
+                    for i, pool in enumerate(self.pools)
+                ],
+                'lecturas_enviadas_al_primario': self._rechazos,
+            }
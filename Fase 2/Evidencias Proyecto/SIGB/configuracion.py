@@ -1,4 +1,98 @@
 MYSQL_HOST = 'localhost'
 MYSQL_USER = 'caps'
 MYSQL_PASSWORD = 'tone'
-MYSQL_DATABASE = 'db_biblioteca'
\ No newline at end of file
+MYSQL_DATABASE = 'db_biblioteca'
+
+MYSQL_POOL_SIZE = 5
+MYSQL_POOL_OVERFLOW = 10
+MYSQL_POOL_TIMEOUT = 10
+MYSQL_POOL_MAX_LIFETIME = 1800
+MYSQL_POOL_PING_ON_BORROW = True
+
+# Réplicas de solo lectura (mismo usuario y base que el primario). Para probar en
+# local basta una segunda instancia replicando en otro puerto, por ejemplo:
+# MYSQL_REPLICAS = [{'host': '127.0.0.1', 'port': 3307}]
+MYSQL_REPLICAS = []
+# Segundos entre mediciones del retraso de cada réplica.
+REPLICA_VERIFICAR_CADA = 5
+# Endpoints GET que pueden leer de una réplica -> retraso máximo tolerado en segundos.
+# Circulación no aparece: sus lecturas deben ver las propias escrituras.
+REPLICA_TOLERANCIA_ENDPOINTS = {
+    'reporte_materiales_uso': 300,
+    'reporte_usuarios_mora': 300,
+    'buscar_materiales': 10,
+    'obtener_detalle_material': 10,
+    'listar_materiales': 10,
+}
+# Tras una escritura, segundos que la sesión lee solo del primario.
+REPLICA_FIJAR_PRIMARIO = 10
+
+LISTAS_CACHE_TTL = 300
+
+OPAC_LIMITE_RESULTADOS = 200
+
+LISTADO_LIMITE_DEFECTO = 50
+LISTADO_LIMITE_MAXIMO = 200
+
+CIRCULACION_LOTE_MAXIMO = 100
+
+MULTA_TARIFA_DIARIA = 500
+MULTA_DIAS_GRACIA = 0
+MULTA_TARIFAS_POR_TIPO = {}
+MULTA_MONTO_MAXIMO = None
+
+METRICAS_TTL = 60
+
+USUARIOS_CACHE_TTL = 30
+
+PASSWORD_HASH_METODO = 'pbkdf2:sha256:1000000'
+HASH_WORKERS = 2
+HASH_MAX_PENDIENTES = 8
+HASH_TIMEOUT = 10
+
+LOGIN_MAX_INTENTOS_RUT = 5
+LOGIN_MAX_INTENTOS_IP = 30
+LOGIN_VENTANA_INTENTOS = 300
+
+IMPORTACION_TAMANO_LOTE = 1000
+
+# Consultas más lentas que este umbral se registran en el log (sin sus parámetros).
+CONSULTA_LENTA_MS = 200
+
+# Días que un ejemplar devuelto queda retenido para la siguiente reserva de la cola.
+RESERVA_DIAS_RETIRO = 3
+
+# Días que una reserva puede quedar pendiente antes de expirar.
+RESERVA_DIAS_VIGENCIA = 60
+
+# Tareas programadas (flask tareas): filas por lote, pausa entre lotes en segundos,
+# intervalo de las tareas incrementales en segundos y hora local de las nocturnas.
+TAREAS_TAMANO_LOTE = 500
+TAREAS_PAUSA_LOTE = 0.05
+TAREAS_INTERVALO_INCREMENTAL = 900
+TAREAS_HORA_NOCTURNA = 2
+
+# Autocompletado (/api/suggest): sugerencias por tipo y segundos entre recargas
+# completas del índice en memoria.
+SUGERENCIAS_LIMITE = 8
+SUGERENCIAS_RECARGA = 600
+
+# Pool de aiomysql del servidor asíncrono del OPAC (opac_async.py).
+OPAC_ASYNC_POOL_MIN = 2
+OPAC_ASYNC_POOL_MAX = 50
+
+# Cache LRU de respuestas de búsqueda y detalle del OPAC: entradas máximas y
+# segundos de vida (acota lo que tarda en verse una escritura de otro proceso).
+OPAC_CACHE_ENTRADAS = 2000
+OPAC_CACHE_TTL = 300
+
+# Feed de cambios de circulación (/api/circulacion/cambios): segundos entre
+# consultas, entre latidos y de vida de cada conexión SSE; segundos de gracia
+# antes de saltar un hueco de id_cambio; cambios por consulta; y días que se
+# conservan los cambios antes de la purga nocturna.
+CIRCULACION_FEED_INTERVALO = 1
+CIRCULACION_FEED_LATIDO = 15
+CIRCULACION_FEED_DURACION = 300
+CIRCULACION_FEED_GRACIA = 5
+CIRCULACION_FEED_LOTE = 200
+CIRCULACION_CAMBIOS_DIAS = 2
@@ -0,0 +1,239 @@
+from busqueda import consulta_booleana
+
+
+def construir_case(columna, valores):
+    """Arma un CASE columna WHEN ... THEN ... END para UPDATE de varias filas."""
+    sql = "CASE " + columna + " " + " ".join("WHEN %s THEN %s" for _ in valores) + " END"
+    params = []
+    for clave, valor in valores.items():
+        params.extend([clave, valor])
+    return sql, params
+
+
+# Campos permitidos en /api/catalogacion/listar y la tabla que requiere cada uno.
+CAMPOS_LISTADO_MATERIALES = {
+    'id_material': ('M.id_material', None),
+    'titulo': ('M.titulo', None),
+    'isbn': ('M.isbn', None),
+    'ejemplares_totales': ('M.ejemplares_totales', None),
+    'ejemplares_disponibles': ('M.ejemplares_disponibles', None),
+    'anio': ('M.anio_publicacion AS anio', None),
+    'nombre_autor': ('A.nombre_autor', 'JOIN AUTOR A ON M.AUTOR_id_autor = A.id_autor'),
+    'nombre_editorial': ('E.nombre_editorial', 'JOIN EDITORIAL E ON M.EDITORIAL_id_editorial = E.id_editorial'),
+}
+
+SQL_TOTAL_MATERIALES = "SELECT COUNT(*) AS total FROM MATERIALES"
+
+
+def campos_listado(campos_param):
+    """Valida el parámetro fields del listado; devuelve (campos, inválidos)."""
+    if not campos_param:
+        return list(CAMPOS_LISTADO_MATERIALES), []
+    campos = [c.strip() for c in campos_param.split(',') if c.strip()]
+    invalidos = [c for c in campos if c not in CAMPOS_LISTADO_MATERIALES]
+    if 'id_material' not in campos:
+        campos.insert(0, 'id_material')
+    return campos, invalidos
+
+
+def sql_listado_materiales(campos, cursor_id, limite):
+    """Página del listado de materiales por id descendente, con una fila extra para saber si hay siguiente."""
+    columnas = [CAMPOS_LISTADO_MATERIALES[c][0] for c in campos]
+    joins = []
+    for c in campos:
+        join = CAMPOS_LISTADO_MATERIALES[c][1]
+        if join and join not in joins:
+            joins.append(join)
+
+    sql = f"SELECT {', '.join(columnas)} FROM MATERIALES M {' '.join(joins)}"
+    params = []
+    if cursor_id:
+        sql += " WHERE M.id_material < %s"
+        params.append(cursor_id)
+    sql += " ORDER BY M.id_material DESC LIMIT %s"
+    params.append(limite + 1)
+    return sql, tuple(params)
+
+
+def sql_busqueda_opac(texto, categoria_id, limite):
+    """Búsqueda del OPAC: candidatos sobre MATERIALES y luego el detalle con los JOIN."""
+    # Primero se seleccionan los IDs candidatos sobre MATERIALES (índice FULLTEXT)
+    # y solo después se arma el detalle con los JOIN y el GROUP_CONCAT.
+    candidatos_sql = "SELECT id_material, titulo"
+    where_sql = " FROM MATERIALES WHERE 1=1"
+    params = []
+    orden_sql = " ORDER BY titulo ASC"
+
+    expresion = consulta_booleana(texto)
+    if expresion:
+        candidatos_sql += ", MATCH(texto_busqueda) AGAINST (%s IN BOOLEAN MODE) AS relevancia"
+        params.append(expresion)
+        where_sql += " AND MATCH(texto_busqueda) AGAINST (%s IN BOOLEAN MODE)"
+        params.append(expresion)
+        orden_sql = " ORDER BY relevancia DESC, titulo ASC"
+    elif texto.strip():
+        # Palabras más cortas que el mínimo de FULLTEXT: prefijo del título (idx_materiales_titulo).
+        candidatos_sql += ", 0 AS relevancia"
+        where_sql += " AND titulo LIKE %s"
+        params.append(f'{texto.strip()}%')
+    else:
+        candidatos_sql += ", 0 AS relevancia"
+
+    if categoria_id:
+        where_sql += " AND id_material IN (SELECT MATERIALES_id_material FROM MATERIALES_CATEGORIAS WHERE CATEGORIAS_id_categoria = %s)"
+        params.append(categoria_id)
+
+    candidatos_sql += where_sql + orden_sql + " LIMIT %s"
+    params.append(limite)
+
+    sql = f"""
+    SELECT 
+        M.id_material, M.titulo, M.isbn, M.anio_publicacion, M.ejemplares_disponibles,
+        A.nombre_autor, E.nombre_editorial,
+        GROUP_CONCAT(C.nombre_categoria SEPARATOR ', ') AS categorias
+    FROM 
+        ({candidatos_sql}) R
+    JOIN 
+        MATERIALES M ON M.id_material = R.id_material
+    JOIN 
+        AUTOR A ON M.AUTOR_id_autor = A.id_autor
+    JOIN 
+        EDITORIAL E ON M.EDITORIAL_id_editorial = E.id_editorial
+    LEFT JOIN 
+        MATERIALES_CATEGORIAS MC ON M.id_material = MC.MATERIALES_id_material
+    LEFT JOIN 
+        CATEGORIAS C ON MC.CATEGORIAS_id_categoria = C.id_categoria
+    GROUP BY M.id_material, R.relevancia
+    ORDER BY R.relevancia DESC, M.titulo ASC
+    """
+    return sql, tuple(params)
+
+
+SQL_DETALLE_MATERIAL = """
+SELECT 
+    M.id_material, M.titulo, M.isbn, M.anio_publicacion, 
+    M.ejemplares_totales, M.ejemplares_disponibles, M.tipo,
+    A.nombre_autor, E.nombre_editorial,
+    GROUP_CONCAT(C.nombre_categoria SEPARATOR ', ') AS categorias
+FROM 
+    MATERIALES M
+JOIN 
+    AUTOR A ON M.AUTOR_id_autor = A.id_autor
+JOIN 
+    EDITORIAL E ON M.EDITORIAL_id_editorial = E.id_editorial
+LEFT JOIN 
+    MATERIALES_CATEGORIAS MC ON M.id_material = MC.MATERIALES_id_material
+LEFT JOIN 
+    CATEGORIAS C ON MC.CATEGORIAS_id_categoria = C.id_categoria
+WHERE 
+    M.id_material = %s
+GROUP BY M.id_material
+"""
+
+
+def condiciones_prestamos_activos(filtros):
+    """WHERE de préstamos activos según los filtros (rut, material_id, vence_desde, vence_hasta, vencidos)."""
+    condiciones = ["P.estado_prestamo = 'Activo'"]
+    params = []
+    if filtros.get('rut'):
+        condiciones.append("U.rut = %s")
+        params.append(filtros['rut'])
+    if filtros.get('material_id'):
+        condiciones.append("P.MATERIALES_id_material = %s")
+        params.append(filtros['material_id'])
+    if filtros.get('vence_desde'):
+        condiciones.append("P.fecha_devolucion >= %s")
+        params.append(filtros['vence_desde'])
+    if filtros.get('vence_hasta'):
+        condiciones.append("P.fecha_devolucion <= %s")
+        params.append(filtros['vence_hasta'])
+    if filtros.get('vencidos') is True:
+        condiciones.append("P.fecha_devolucion < CURDATE()")
+    elif filtros.get('vencidos') is False:
+        condiciones.append("P.fecha_devolucion >= CURDATE()")
+    return condiciones, params
+
+
+def sql_prestamos_activos(filtros, despues_de, limite):
+    """Página de préstamos activos por (fecha_devolucion, id_prestamo), con una fila extra para saber si hay siguiente."""
+    condiciones, params = condiciones_prestamos_activos(filtros)
+    if despues_de:
+        fecha, id_prestamo = despues_de
+        condiciones.append("(P.fecha_devolucion > %s OR (P.fecha_devolucion = %s AND P.id_prestamo > %s))")
+        params.extend([fecha, fecha, id_prestamo])
+    sql = f"""
+    SELECT 
+        P.id_prestamo,
+        P.fecha_prestamo,
+        P.fecha_devolucion,
+        P.estado_prestamo,
+        M.titulo AS titulo_material,
+        U.rut AS rut_usuario
+    FROM 
+        PRESTAMOS P
+    JOIN 
+        MATERIALES M ON P.MATERIALES_id_material = M.id_material
+    JOIN 
+        USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario
+    WHERE 
+        {' AND '.join(condiciones)}
+    ORDER BY P.fecha_devolucion ASC, P.id_prestamo ASC
+    LIMIT %s
+    """
+    params.append(limite + 1)
+    return sql, tuple(params)
+
+
+def sql_conteo_prestamos_activos(filtros):
+    """COUNT(*) de los préstamos activos filtrados; solo une USUARIOS si se filtra por RUT."""
+    condiciones, params = condiciones_prestamos_activos(filtros)
+    join = " JOIN USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario" if filtros.get('rut') else ""
+    return f"SELECT COUNT(*) AS total FROM PRESTAMOS P{join} WHERE {' AND '.join(condiciones)}", tuple(params)
+
+
+# Los diez materiales más prestados, desde los contadores de ESTADISTICAS_MATERIAL.
+SQL_REPORTE_USO = """
+SELECT 
+    M.titulo AS titulo_material,
+    M.isbn,
+    A.nombre_autor,
+    EST.total_prestamos AS total_prestamos_historico
+FROM 
+    ESTADISTICAS_MATERIAL EST
+JOIN 
+    MATERIALES M ON EST.MATERIALES_id_material = M.id_material
+JOIN
+    AUTOR A ON M.AUTOR_id_autor = A.id_autor
+WHERE 
+    EST.total_prestamos > 0
+ORDER BY 
+    EST.total_prestamos DESC
+LIMIT 10
+"""
+
+
+# Los vencidos se filtran por fecha (idx_prestamos_estado_vencimiento) para no
+# depender de que haya corrido marcar-vencidos. La multa precalculada por esa
+# tarea se usa cuando es de hoy; si no, la calcula completar_mora (app.py).
+SQL_REPORTE_MORA = """
+SELECT 
+    U.nombre AS nombre_usuario,
+    U.rut,
+    M.titulo AS titulo_material,
+    M.tipo,
+    P.fecha_devolucion AS fecha_esperada,
+    P.dias_mora,
+    P.multa_acumulada AS multa_estimada,
+    P.multa_calculada_en
+FROM 
+    PRESTAMOS P
+JOIN 
+    USUARIOS U ON P.USUARIOS_id_usuario = U.id_usuario
+JOIN 
+    MATERIALES M ON P.MATERIALES_id_material = M.id_material
+WHERE 
+    P.estado_prestamo = 'Activo' 
+    AND P.fecha_devolucion < CURDATE()
+ORDER BY 
+    P.fecha_devolucion ASC
+"""
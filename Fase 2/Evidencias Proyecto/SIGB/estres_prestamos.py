@@ -0,0 +1,74 @@
+"""Prueba de estrés del préstamo concurrente sobre un mismo material.
+
+Lanza muchos hilos que piden préstamos del mismo material contra la base
+configurada en configuracion.py y verifica que el stock nunca quede negativo
+y que se registren exactamente tantos préstamos como ejemplares había.
+
+Uso: python estres_prestamos.py <rut_bibliotecario> <password> <rut_usuario> [hilos] [ejemplares]
+"""
+import sys
+import threading
+
+import mysql.connector
+
+from app import app, db_config
+
+
+def main():
+    rut_staff, password, rut_usuario = sys.argv[1:4]
+    hilos = int(sys.argv[4]) if len(sys.argv) > 4 else 50
+    ejemplares = int(sys.argv[5]) if len(sys.argv) > 5 else 5
+
+    conn = mysql.connector.connect(**db_config)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id_autor FROM AUTOR LIMIT 1")
+    autor_id = cursor.fetchone()[0]
+    cursor.execute("SELECT id_editorial FROM EDITORIAL LIMIT 1")
+    editorial_id = cursor.fetchone()[0]
+    cursor.execute("""
+    INSERT INTO MATERIALES (titulo, anio_publicacion, isbn, ejemplares_totales, ejemplares_disponibles,
+        tipo, disponible, EDITORIAL_id_editorial, AUTOR_id_autor)
+    VALUES ('Prueba de estrés', 2024, UUID_SHORT(), %s, %s, 'Libro', 'S', %s, %s)
+    """, (ejemplares, ejemplares, editorial_id, autor_id))
+    material_id = cursor.lastrowid
+    conn.commit()
+
+    resultados = []
+    barrera = threading.Barrier(hilos)
+
+    def prestar(i):
+        cliente = app.test_client()
+        # Cada cliente con su propia IP, como en benchmark.py, para no chocar con el límite por IP del login.
+        cliente.environ_base['REMOTE_ADDR'] = f"10.0.{i // 254}.{i % 254 + 1}"
+        cliente.post('/login', json={'rut': rut_staff, 'password': password})
+        barrera.wait()
+        r = cliente.post('/api/circulacion/prestamo', json={'rut_usuario': rut_usuario, 'material_id': material_id})
+        resultados.append(r.status_code)
+
+    threads = [threading.Thread(target=prestar, args=(i,)) for i in range(hilos)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    cursor.execute("SELECT ejemplares_disponibles FROM MATERIALES WHERE id_material = %s", (material_id,))
+    stock_final = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM PRESTAMOS WHERE MATERIALES_id_material = %s", (material_id,))
+    prestamos = cursor.fetchone()[0]
+
+    print(f"Respuestas: 201={resultados.count(201)} 400={resultados.count(400)} otras={len(resultados) - resultados.count(201) - resultados.count(400)}")
+    print(f"Stock final: {stock_final} | Préstamos registrados: {prestamos}")
+
+    cursor.execute("DELETE FROM PRESTAMOS WHERE MATERIALES_id_material = %s", (material_id,))
+    cursor.execute("DELETE FROM MATERIALES WHERE id_material = %s", (material_id,))
+    conn.commit()
+    conn.close()
+
+    if stock_final < 0 or prestamos != min(hilos, ejemplares):
+        print("FALLO: el stock quedó inconsistente.")
+        sys.exit(1)
+    print("OK: el stock nunca bajó de cero.")
+
+
+if __name__ == '__main__':
+    main()
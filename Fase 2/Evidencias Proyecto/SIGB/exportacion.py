@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+import zlib
+
+TAMANO_BLOQUE = 1000
+
+
+def filas_servidor(pool, sql, params=()):
+    """Recorre el resultado con un cursor sin buffer sobre una conexión propia del pool.
+
+    Las filas se leen de a TAMANO_BLOQUE, así la memoria no depende del total.
+    La conexión se devuelve al pool cuando el generador termina o se cierra.
+    """
+    conn = pool.obtener()
+    completo = False
+    try:
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(sql, params)
+        while True:
+            bloque = cursor.fetchmany(TAMANO_BLOQUE)
+            if not bloque:
+                break
+            yield from bloque
+        cursor.close()
+        completo = True
+    finally:
+        # Si el cliente cortó la descarga quedan filas sin leer: vaciarlas costaría
+        # tanto como la exportación, así que la conexión se descarta.
+        pool.devolver(conn, descartar=not completo)
+
+
+def a_jsonl(filas):
+    for fila in filas:
+        yield json.dumps(fila, default=str, ensure_ascii=False) + '\n'
+
+
+def a_csv(filas):
+    buffer = io.StringIO()
+    escritor = None
+    for fila in filas:
+        if escritor is None:
+            escritor = csv.DictWriter(buffer, fieldnames=list(fila))
+            escritor.writeheader()
+        escritor.writerow(fila)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def comprimir_gzip(partes):
+    """Comprime en formato gzip a medida que se generan las partes."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for parte in partes:
+        datos = compresor.compress(parte.encode('utf-8'))
+        if datos:
+            yield datos
+    yield compresor.flush()
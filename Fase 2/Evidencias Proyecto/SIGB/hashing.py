@@ -0,0 +1,127 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoTimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashSaturadoError(Exception):
+    """Se lanza cuando la cola de hashing está llena y la petición debe reintentarse."""
+
+
+def verificar_hash(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def generar_hash(password, metodo):
+    return generate_password_hash(password, method=metodo)
+
+
+class ServicioHash:
+    """Ejecuta PBKDF2 en un pool de procesos, fuera de los hilos que atienden peticiones.
+
+    Como mucho `max_pendientes` operaciones pueden estar en cola o en curso; las
+    demás se rechazan de inmediato con HashSaturadoError para que una ráfaga de
+    logins no bloquee al resto de los endpoints.
+    """
+
+    def __init__(self, metodo, max_workers=2, max_pendientes=8, timeout=10):
+        self.metodo = metodo
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._cupos = threading.BoundedSemaphore(max_pendientes)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _ejecutar(self, funcion, *args):
+        if not self._cupos.acquire(blocking=False):
+            raise HashSaturadoError('Demasiadas verificaciones de contraseña en curso.')
+        try:
+            with self._lock:
+                # Se crea al primer uso para no lanzar procesos al importar app.py. Como
+                # ya hay hilos atendiendo peticiones, los procesos no se crean con fork:
+                # heredarían locks tomados por otros hilos.
+                if self._executor is None:
+                    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context(metodo)
+                    )
+            futuro = self._executor.submit(funcion, *args)
+        except Exception:
+            self._cupos.release()
+            raise
+        futuro.add_done_callback(lambda _: self._cupos.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeoutError:
+            raise HashSaturadoError('La verificación de contraseña superó el tiempo de espera.')
+
+    def verificar(self, password_hash, password):
+        return self._ejecutar(verificar_hash, password_hash, password)
+
+    def generar(self, password):
+        return self._ejecutar(generar_hash, password, self.metodo)
+
+    def necesita_rehash(self, password_hash):
+        """Indica si el hash se generó con un método o costo distinto al configurado."""
+        return password_hash.split('$', 1)[0] != self.metodo
+
+
+class LimitadorIntentos:
+    """Cuenta intentos por clave (RUT o IP) en una ventana deslizante de tiempo.
+
+    Las claves vienen del cliente, así que cada `barrido_cada` registros se
+    eliminan las que ya no tienen intentos vigentes, y nunca se guardan más de
+    `max_claves`: al superarlo se descartan las más antiguas.
+    """
+
+    def __init__(self, max_intentos, ventana, max_claves=50000, barrido_cada=1000):
+        self.max_intentos = max_intentos
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self.barrido_cada = barrido_cada
+        self._lock = threading.Lock()
+        self._intentos = {}
+        self._registros = 0
+
+    def _barrer(self, ahora):
+        for clave in list(self._intentos):
+            self._vigentes(clave, ahora)
+        # Los dict conservan el orden de inserción: las primeras claves son las más antiguas.
+        # Se deja un margen del 10% para no volver a barrer en cada registro.
+        if len(self._intentos) > self.max_claves:
+            while len(self._intentos) > self.max_claves - self.max_claves // 10:
+                del self._intentos[next(iter(self._intentos))]
+
+    def _vigentes(self, clave, ahora):
+        intentos = self._intentos.get(clave)
+        if intentos is None:
+            return None
+        while intentos and ahora - intentos[0] > self.ventana:
+            intentos.popleft()
+        if not intentos:
+            del self._intentos[clave]
+            return None
+        return intentos
+
+    def permitido(self, clave):
+        with self._lock:
+            intentos = self._vigentes(clave, time.monotonic())
+            return intentos is None or len(intentos) < self.max_intentos
+
+    def registrar(self, clave):
+        with self._lock:
+            ahora = time.monotonic()
+            intentos = self._vigentes(clave, ahora)
+            if intentos is None:
+                intentos = self._intentos[clave] = deque()
+            intentos.append(ahora)
+            self._registros += 1
+            if self._registros % self.barrido_cada == 0 or len(self._intentos) > self.max_claves:
+                self._barrer(ahora)
+
+    def reiniciar(self, clave):
+        with self._lock:
+            self._intentos.pop(clave, None)
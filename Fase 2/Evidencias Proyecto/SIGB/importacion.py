@@ -0,0 +1,269 @@
+import csv
+import json
+import time
+
+import mysql.connector
+
+from busqueda import normalizar
+
+# Cantidad máxima de rechazos que se detallan en el resumen; el resto solo se cuenta.
+MAX_RECHAZOS_DETALLADOS = 1000
+
+# Largo máximo de cada campo según las columnas de la base (titulo, isbn,
+# nombre_autor, nombre_editorial, nombre_categoria). Una fila más larga se
+# rechaza sola en vez de hacer fallar el INSERT de todo su lote.
+LARGOS_MAXIMOS = {'titulo': 100, 'isbn': 20, 'autor': 150, 'editorial': 150, 'categoria': 50}
+
+
+def leer_csv(stream):
+    """Recorre un CSV con encabezado (titulo, isbn, anio, ejemplares, autor, editorial, categorias).
+
+    Las categorías de una fila se separan con ';'.
+    """
+    for fila in csv.DictReader(stream):
+        categorias = fila.get('categorias') or ''
+        fila['categorias'] = [c.strip() for c in categorias.split(';') if c.strip()]
+        yield fila
+
+
+def leer_jsonl(stream):
+    """Recorre un archivo JSON Lines con un material por línea."""
+    for linea in stream:
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            yield {'_error': 'JSON inválido'}
+            continue
+        yield fila if isinstance(fila, dict) else {'_error': 'Cada línea debe ser un objeto JSON.'}
+
+
+def _texto(valor):
+    """Texto sin espacios de los extremos; los números se aceptan (un ISBN en JSON puede venir sin comillas)."""
+    if valor is None:
+        return ''
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return str(valor)
+    if isinstance(valor, str):
+        return valor.strip()
+    return None
+
+
+def validar_fila(fila):
+    """Normaliza una fila de entrada; devuelve (material, None) o (None, motivo)."""
+    if fila.get('_error'):
+        return None, fila['_error']
+    titulo, isbn, autor, editorial = (_texto(fila.get(campo)) for campo in ('titulo', 'isbn', 'autor', 'editorial'))
+    if None in (titulo, isbn, autor, editorial):
+        return None, 'Los campos titulo, isbn, autor y editorial deben ser texto.'
+    if not all([titulo, isbn, autor, editorial]):
+        return None, 'Faltan campos obligatorios (titulo, isbn, autor, editorial).'
+    for campo, valor in (('titulo', titulo), ('isbn', isbn), ('autor', autor), ('editorial', editorial)):
+        if len(valor) > LARGOS_MAXIMOS[campo]:
+            return None, f'El campo {campo} supera los {LARGOS_MAXIMOS[campo]} caracteres.'
+    try:
+        anio = int(fila.get('anio'))
+        ejemplares = int(fila.get('ejemplares') or 1)
+    except (ValueError, TypeError):
+        return None, 'El año y los ejemplares deben ser números enteros.'
+    categorias = fila.get('categorias') or []
+    if isinstance(categorias, str):
+        categorias = [c.strip() for c in categorias.split(';') if c.strip()]
+    if not isinstance(categorias, list) or not all(isinstance(c, str) for c in categorias):
+        return None, 'Las categorías deben ser una lista de textos.'
+    categorias = [c.strip() for c in categorias if c.strip()]
+    if any(len(c) > LARGOS_MAXIMOS['categoria'] for c in categorias):
+        return None, f"Cada categoría admite hasta {LARGOS_MAXIMOS['categoria']} caracteres."
+    return {
+        'titulo': titulo, 'isbn': isbn, 'anio': anio, 'ejemplares': ejemplares,
+        'autor': autor, 'editorial': editorial, 'categorias': categorias
+    }, None
+
+
+class ImportadorCatalogo:
+    """Importa materiales en lotes con INSERT de varias filas, un commit por lote.
+
+    Autores, editoriales y categorías se resuelven por nombre con diccionarios
+    en memoria y se crean cuando no existen. La memoria usada depende del
+    tamaño del lote y de las tablas de apoyo, no del tamaño del archivo.
+    """
+
+    def __init__(self, conn, tamano_lote=1000, progreso=None):
+        self.conn = conn
+        self.tamano_lote = tamano_lote
+        self.progreso = progreso
+        self.leidas = 0
+        self.importadas = 0
+        self.rechazadas = 0
+        self.rechazos = []
+        self.tablas_apoyo_modificadas = False
+        self._inicio = None
+        self._creados_en_lote = []
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT nombre_autor, id_autor FROM AUTOR")
+        self.autores = {normalizar(nombre): id_ for nombre, id_ in cursor.fetchall()}
+        cursor.execute("SELECT nombre_editorial, id_editorial FROM EDITORIAL")
+        self.editoriales = {normalizar(nombre): id_ for nombre, id_ in cursor.fetchall()}
+        cursor.execute("SELECT nombre_categoria, id_categoria FROM CATEGORIAS")
+        self.categorias = {normalizar(nombre): id_ for nombre, id_ in cursor.fetchall()}
+        cursor.close()
+
+    def importar(self, filas):
+        self._inicio = time.monotonic()
+        lote = []
+        try:
+            for fila in filas:
+                self.leidas += 1
+                material, motivo = validar_fila(fila)
+                if motivo:
+                    self._rechazar(self.leidas, fila.get('isbn'), motivo)
+                    continue
+                material['linea'] = self.leidas
+                lote.append(material)
+                if len(lote) >= self.tamano_lote:
+                    self._procesar_lote(lote)
+                    lote = []
+        except (csv.Error, UnicodeDecodeError) as e:
+            # El archivo no se puede seguir leyendo: se importa lo ya leído y el
+            # resumen indica dónde se detuvo, con los rechazos anteriores.
+            self.leidas += 1
+            self._rechazar(self.leidas, None, f'No se pudo leer el archivo desde esta fila: {e}')
+        if lote:
+            self._procesar_lote(lote)
+        return self.resumen()
+
+    def resumen(self):
+        duracion = time.monotonic() - self._inicio if self._inicio else 0.0
+        return {
+            'leidas': self.leidas,
+            'importadas': self.importadas,
+            'rechazadas': self.rechazadas,
+            'rechazos': self.rechazos,
+            'segundos': round(duracion, 2),
+            'filas_por_segundo': round(self.leidas / duracion, 1) if duracion else 0.0
+        }
+
+    def _rechazar(self, linea, isbn, motivo):
+        self.rechazadas += 1
+        if len(self.rechazos) < MAX_RECHAZOS_DETALLADOS:
+            self.rechazos.append({'linea': linea, 'isbn': isbn, 'motivo': motivo})
+
+    def _resolver(self, cursor, cache, nombres, sql_insert, sql_select, valores_extra=()):
+        """Crea en un solo INSERT los nombres que no están en `cache` y agrega sus IDs.
+
+        Las claves de la cache se normalizan como la collation de MySQL (sin
+        mayúsculas ni tildes) para no duplicar 'García' y 'garcia'.
+        """
+        nuevos = {}
+        for nombre in nombres:
+            clave = normalizar(nombre)
+            if clave not in cache and clave not in nuevos:
+                nuevos[clave] = nombre
+        if not nuevos:
+            return
+        filas = ', '.join(['(' + ', '.join(['%s'] * (1 + len(valores_extra))) + ')'] * len(nuevos))
+        params = []
+        for nombre in nuevos.values():
+            params.extend((nombre,) + tuple(valores_extra))
+        cursor.execute(sql_insert + filas, tuple(params))
+        marcadores = ', '.join(['%s'] * len(nuevos))
+        cursor.execute(sql_select.format(marcadores), tuple(nuevos.values()))
+        for nombre, id_ in cursor.fetchall():
+            cache[normalizar(nombre)] = id_
+        self._creados_en_lote.append((cache, list(nuevos)))
+        self.tablas_apoyo_modificadas = True
+
+    def _procesar_lote(self, lote):
+        cursor = self.conn.cursor()
+        self._creados_en_lote = []
+        try:
+            # ISBN repetidos dentro del lote o ya existentes en la base.
+            vistos = set()
+            unicos = []
+            for material in lote:
+                if material['isbn'] in vistos:
+                    self._rechazar(material['linea'], material['isbn'], 'ISBN duplicado en el archivo.')
+                else:
+                    vistos.add(material['isbn'])
+                    unicos.append(material)
+
+            marcadores = ', '.join(['%s'] * len(unicos))
+            cursor.execute(f"SELECT isbn FROM MATERIALES WHERE isbn IN ({marcadores})", tuple(vistos))
+            existentes = {fila[0] for fila in cursor.fetchall()}
+            lote = []
+            for material in unicos:
+                if material['isbn'] in existentes:
+                    self._rechazar(material['linea'], material['isbn'], 'El ISBN ya existe en el catálogo.')
+                else:
+                    lote.append(material)
+            if not lote:
+                self.conn.commit()
+                return
+
+            self._resolver(
+                cursor, self.autores, [m['autor'] for m in lote],
+                "INSERT INTO AUTOR (nombre_autor) VALUES ",
+                "SELECT nombre_autor, id_autor FROM AUTOR WHERE nombre_autor IN ({})"
+            )
+            self._resolver(
+                cursor, self.editoriales, [m['editorial'] for m in lote],
+                "INSERT INTO EDITORIAL (nombre_editorial) VALUES ",
+                "SELECT nombre_editorial, id_editorial FROM EDITORIAL WHERE nombre_editorial IN ({})"
+            )
+            self._resolver(
+                cursor, self.categorias, [c for m in lote for c in m['categorias']],
+                "INSERT INTO CATEGORIAS (nombre_categoria, descripcion) VALUES ",
+                "SELECT nombre_categoria, id_categoria FROM CATEGORIAS WHERE nombre_categoria IN ({})",
+                valores_extra=('Creada por importación masiva.',)
+            )
+
+            filas = ', '.join(["(%s, %s, %s, %s, %s, 'Libro', 'S', %s, %s, %s)"] * len(lote))
+            params = []
+            for m in lote:
+                params.extend([
+                    m['titulo'], m['anio'], m['isbn'], m['ejemplares'], m['ejemplares'],
+                    self.editoriales[normalizar(m['editorial'])], self.autores[normalizar(m['autor'])],
+                    f"{m['titulo']} {m['autor']}"
+                ])
+            cursor.execute(
+                """
+                INSERT INTO MATERIALES (
+                    titulo, anio_publicacion, isbn, ejemplares_totales, ejemplares_disponibles,
+                    tipo, disponible, EDITORIAL_id_editorial, AUTOR_id_autor, texto_busqueda
+                ) VALUES """ + filas,
+                tuple(params)
+            )
+
+            con_categorias = [m for m in lote if m['categorias']]
+            if con_categorias:
+                marcadores = ', '.join(['%s'] * len(con_categorias))
+                cursor.execute(
+                    f"SELECT isbn, id_material FROM MATERIALES WHERE isbn IN ({marcadores})",
+                    tuple(m['isbn'] for m in con_categorias)
+                )
+                ids = dict(cursor.fetchall())
+                pares = {(ids[m['isbn']], self.categorias[normalizar(c)]) for m in con_categorias for c in m['categorias']}
+                filas = ', '.join(['(%s, %s)'] * len(pares))
+                params = [valor for par in pares for valor in par]
+                cursor.execute(
+                    "INSERT INTO MATERIALES_CATEGORIAS (MATERIALES_id_material, CATEGORIAS_id_categoria) VALUES " + filas,
+                    tuple(params)
+                )
+
+            self.conn.commit()
+            self.importadas += len(lote)
+        except mysql.connector.Error as err:
+            self.conn.rollback()
+            # Los autores/editoriales/categorías creados en este lote se deshicieron.
+            for cache, nombres in self._creados_en_lote:
+                for nombre in nombres:
+                    cache.pop(nombre, None)
+            for material in lote:
+                self._rechazar(material['linea'], material['isbn'], f'Error SQL en el lote: {err.msg}')
+        finally:
+            cursor.close()
+            if self.progreso:
+                self.progreso(self.resumen())
@@ -0,0 +1,211 @@
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger('sigb.consultas')
+
+# Límites (en segundos) de los histogramas de latencia.
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histograma:
+    """Histograma acumulado con los mismos límites que usa Prometheus."""
+
+    def __init__(self, buckets=BUCKETS_SEGUNDOS):
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.suma += valor
+        self.total += 1
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, conteo in zip(self.buckets, self.conteos):
+            acumulado += conteo
+            yield f'{nombre}_bucket{_etiquetas(etiquetas, le=repr(limite))} {acumulado}'
+        yield f'{nombre}_bucket{_etiquetas(etiquetas, le="+Inf")} {self.total}'
+        yield f'{nombre}_sum{_etiquetas(etiquetas)} {self.suma:.6f}'
+        yield f'{nombre}_count{_etiquetas(etiquetas)} {self.total}'
+
+
+def _etiquetas(etiquetas, **extra):
+    pares = list(etiquetas) + list(extra.items())
+    if not pares:
+        return ''
+    texto = ','.join('{}="{}"'.format(clave, str(valor).replace('\\', '\\\\').replace('"', '\\"')) for clave, valor in pares)
+    return '{' + texto + '}'
+
+
+def sql_para_log(sql, params):
+    """Compacta la sentencia y reemplaza los parámetros por su tipo.
+
+    Los valores nunca se escriben en el log: pueden ser RUT, correos o hashes.
+    """
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    if params is None:
+        return sql
+    if isinstance(params, dict):
+        tipos = {clave: type(valor).__name__ for clave, valor in params.items()}
+    else:
+        tipos = [type(valor).__name__ for valor in params]
+    return f'{sql} -- parámetros redactados: {tipos}'
+
+
+class MedicionPeticion:
+    """Acumula el tiempo de base de datos, consultas y filas de una petición."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.tiempo_db = 0.0
+        self.consultas = 0
+        self.filas = 0
+        self.consultas_lentas = 0
+
+
+class CursorInstrumentado:
+    """Envuelve un cursor de mysql.connector y mide execute y fetch*.
+
+    Con cursores sin buffer las filas llegan al leerlas, así que el tiempo de
+    los fetch también se cuenta como tiempo de base de datos.
+    """
+
+    def __init__(self, cursor, medicion, umbral_lenta):
+        self._cursor = cursor
+        self._medicion = medicion
+        self._umbral_lenta = umbral_lenta
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _medir(self, duracion, filas=0):
+        if self._medicion is not None:
+            self._medicion.tiempo_db += duracion
+            self._medicion.filas += filas
+
+    def _ejecutar(self, metodo, sql, params):
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, params)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self._medir(duracion)
+            if self._medicion is not None:
+                self._medicion.consultas += 1
+            if duracion >= self._umbral_lenta:
+                if self._medicion is not None:
+                    self._medicion.consultas_lentas += 1
+                logger.warning('Consulta lenta (%.1f ms): %s', duracion * 1000, sql_para_log(sql, params))
+
+    def execute(self, sql, params=None):
+        return self._ejecutar(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, lista_params):
+        return self._ejecutar(self._cursor.executemany, sql, lista_params)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = self._cursor.fetchone()
+        self._medir(time.perf_counter() - inicio, 1 if fila is not None else 0)
+        return fila
+
+    def fetchmany(self, size=1):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchmany(size)
+        self._medir(time.perf_counter() - inicio, len(filas))
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchall()
+        self._medir(time.perf_counter() - inicio, len(filas))
+        return filas
+
+
+class ConexionInstrumentada:
+    """Conexión del pool cuyos cursores se miden; el resto se delega sin cambios."""
+
+    def __init__(self, conexion, medicion, umbral_lenta):
+        self.conexion = conexion
+        self._medicion = medicion
+        self._umbral_lenta = umbral_lenta
+
+    def __getattr__(self, nombre):
+        return getattr(self.conexion, nombre)
+
+    def cursor(self, *args, **kwargs):
+        return CursorInstrumentado(self.conexion.cursor(*args, **kwargs), self._medicion, self._umbral_lenta)
+
+
+class RegistroMetricas:
+    """Métricas por endpoint: latencia, tiempo de BD, consultas y filas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._peticiones = {}
+        self._latencia = {}
+        self._tiempo_db = {}
+        self._consultas = {}
+        self._filas = {}
+        self._lentas = {}
+
+    def registrar(self, endpoint, metodo, estado, duracion, medicion):
+        clave = (('endpoint', endpoint), ('method', metodo))
+        with self._lock:
+            clave_estado = clave + (('status', estado),)
+            self._peticiones[clave_estado] = self._peticiones.get(clave_estado, 0) + 1
+            self._latencia.setdefault(clave, Histograma()).observar(duracion)
+            self._tiempo_db.setdefault(clave, Histograma()).observar(medicion.tiempo_db)
+            self._consultas[clave] = self._consultas.get(clave, 0) + medicion.consultas
+            self._filas[clave] = self._filas.get(clave, 0) + medicion.filas
+            self._lentas[clave] = self._lentas.get(clave, 0) + medicion.consultas_lentas
+
+    def exportar(self, pool=None, caches=None):
+        """Devuelve las métricas en el formato de texto de Prometheus.
+
+        `caches` es un dict nombre -> cache con estadisticas() (aciertos,
+        fallos, desalojos y entradas).
+        """
+        lineas = []
+        with self._lock:
+            lineas += ['# HELP sigb_http_requests_total Peticiones atendidas.',
+                       '# TYPE sigb_http_requests_total counter']
+            lineas += [f'sigb_http_requests_total{_etiquetas(c)} {v}' for c, v in sorted(self._peticiones.items())]
+            lineas += ['# HELP sigb_http_request_duration_seconds Latencia de las peticiones.',
+                       '# TYPE sigb_http_request_duration_seconds histogram']
+            for clave, histograma in sorted(self._latencia.items()):
+                lineas += histograma.lineas('sigb_http_request_duration_seconds', clave)
+            lineas += ['# HELP sigb_db_duration_seconds Tiempo de base de datos por petición.',
+                       '# TYPE sigb_db_duration_seconds histogram']
+            for clave, histograma in sorted(self._tiempo_db.items()):
+                lineas += histograma.lineas('sigb_db_duration_seconds', clave)
+            for nombre, ayuda, datos in (
+                ('sigb_db_queries_total', 'Consultas ejecutadas.', self._consultas),
+                ('sigb_db_rows_total', 'Filas leídas de la base de datos.', self._filas),
+                ('sigb_db_slow_queries_total', 'Consultas que superaron el umbral de lentitud.', self._lentas),
+            ):
+                lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter']
+                lineas += [f'{nombre}{_etiquetas(c)} {v}' for c, v in sorted(datos.items())]
+        if pool is not None:
+            for campo, valor in pool.estadisticas().items():
+                if isinstance(valor, (int, float)):
+                    lineas += [f'# TYPE sigb_db_pool_{campo} gauge', f'sigb_db_pool_{campo} {valor}']
+        if caches:
+            estadisticas = {nombre: cache.estadisticas() for nombre, cache in sorted(caches.items())}
+            for campo, nombre, tipo in (('aciertos', 'sigb_cache_hits_total', 'counter'),
+                                        ('fallos', 'sigb_cache_misses_total', 'counter'),
+                                        ('desalojos', 'sigb_cache_evictions_total', 'counter'),
+                                        ('entradas', 'sigb_cache_entries', 'gauge')):
+                lineas.append(f'# TYPE {nombre} {tipo}')
+                lineas += [f'{nombre}{_etiquetas([("cache", c)])} {e[campo]}' for c, e in estadisticas.items()]
+        return '\n'.join(lineas) + '\n'
@@ -0,0 +1,68 @@
+import threading
+import time
+
+
+class MetricasDashboard:
+    """Contadores del dashboard mantenidos en memoria.
+
+    Las escrituras de catalogación y circulación ajustan los contadores con
+    deltas; cada `ttl` segundos se vuelven a leer desde la base de datos para
+    corregir lo que hayan escrito otros procesos.
+    """
+
+    def __init__(self, ttl, cantidad_ultimos=5):
+        self.ttl = ttl
+        self.cantidad_ultimos = cantidad_ultimos
+        self._lock = threading.Lock()
+        self._datos = None
+        self._expira = 0.0
+
+    def obtener(self, cargar):
+        """Devuelve una copia de las métricas, recargándolas con `cargar()` si vencieron."""
+        with self._lock:
+            if self._datos is not None and time.monotonic() < self._expira:
+                return self._copia()
+
+        datos = cargar()
+        with self._lock:
+            self._datos = datos
+            self._expira = time.monotonic() + self.ttl
+            return self._copia()
+
+    def _copia(self):
+        copia = dict(self._datos)
+        copia['ultimos_materiales'] = list(self._datos['ultimos_materiales'])
+        return copia
+
+    def ajustar(self, campo, delta):
+        with self._lock:
+            if self._datos is not None:
+                self._datos[campo] = max(0, self._datos[campo] + delta)
+
+    def material_agregado(self, material_id, titulo):
+        with self._lock:
+            if self._datos is not None:
+                self._datos['total_materiales'] += 1
+                ultimos = [{'titulo': titulo, 'fecha_ingreso': material_id}] + self._datos['ultimos_materiales']
+                self._datos['ultimos_materiales'] = ultimos[:self.cantidad_ultimos]
+
+    def material_editado(self, material_id, titulo):
+        with self._lock:
+            if self._datos is not None:
+                for material in self._datos['ultimos_materiales']:
+                    if material['fecha_ingreso'] == material_id:
+                        material['titulo'] = titulo
+
+    def material_eliminado(self, material_id):
+        with self._lock:
+            if self._datos is None:
+                return
+            self._datos['total_materiales'] = max(0, self._datos['total_materiales'] - 1)
+            ultimos = self._datos['ultimos_materiales']
+            if any(m['fecha_ingreso'] == material_id for m in ultimos):
+                # Falta el siguiente material más reciente: se fuerza la recarga.
+                self._expira = 0.0
+
+    def invalidar(self):
+        with self._lock:
+            self._expira = 0.0
@@ -0,0 +1,55 @@
+import os
+import re
+
+DIRECTORIO_MIGRACIONES = os.path.join(os.path.dirname(__file__), '..', 'ModeladoDB', 'migraciones')
+
+
+def listar_migraciones(directorio=DIRECTORIO_MIGRACIONES):
+    """Devuelve [(version, ruta)] de los archivos NNN_nombre.sql ordenados por versión."""
+    migraciones = []
+    for archivo in os.listdir(directorio):
+        coincidencia = re.match(r'^(\d+)_.+\.sql$', archivo)
+        if coincidencia:
+            migraciones.append((coincidencia.group(1), os.path.join(directorio, archivo)))
+    return sorted(migraciones)
+
+
+def separar_sentencias(sql):
+    """Separa un script en sentencias por ';', ignorando los comentarios de línea."""
+    lineas = [l for l in sql.splitlines() if not l.strip().startswith('--')]
+    return [s.strip() for s in '\n'.join(lineas).split(';') if s.strip()]
+
+
+def aplicar_migraciones(conn, directorio=DIRECTORIO_MIGRACIONES):
+    """Aplica en orden las migraciones pendientes y las registra en SCHEMA_MIGRACIONES.
+
+    MySQL confirma implícitamente cada sentencia DDL, por lo que una migración
+    que falla a medias debe corregirse a mano antes de volver a ejecutar.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS SCHEMA_MIGRACIONES (
+        version VARCHAR(10) PRIMARY KEY,
+        archivo VARCHAR(200) NOT NULL,
+        aplicada_en DATETIME NOT NULL
+    )
+    """)
+    cursor.execute("SELECT version FROM SCHEMA_MIGRACIONES")
+    aplicadas = {fila[0] for fila in cursor.fetchall()}
+
+    nuevas = []
+    for version, ruta in listar_migraciones(directorio):
+        if version in aplicadas:
+            continue
+        with open(ruta, encoding='utf-8') as f:
+            sentencias = separar_sentencias(f.read())
+        for sentencia in sentencias:
+            cursor.execute(sentencia)
+        cursor.execute(
+            "INSERT INTO SCHEMA_MIGRACIONES (version, archivo, aplicada_en) VALUES (%s, %s, NOW())",
+            (version, os.path.basename(ruta))
+        )
+        conn.commit()
+        nuevas.append(os.path.basename(ruta))
+    cursor.close()
+    return nuevas
@@ -0,0 +1,34 @@
+from datetime import date, datetime
+
+
+class PoliticaMultas:
+    """Cálculo de multas por atraso, sin acceso a la base de datos.
+
+    `tarifa_diaria` se cobra por cada día de atraso que supere `dias_gracia`;
+    `tarifas_por_tipo` permite una tarifa distinta según MATERIALES.tipo y
+    `monto_maximo` (None = sin tope) limita el total de una multa.
+    """
+
+    def __init__(self, tarifa_diaria=500, dias_gracia=0, tarifas_por_tipo=None, monto_maximo=None):
+        self.tarifa_diaria = tarifa_diaria
+        self.dias_gracia = dias_gracia
+        self.tarifas_por_tipo = tarifas_por_tipo or {}
+        self.monto_maximo = monto_maximo
+
+    def dias_retraso(self, fecha_devolucion, hoy=None):
+        hoy = hoy or date.today()
+        if isinstance(fecha_devolucion, datetime):
+            fecha_devolucion = fecha_devolucion.date()
+        return max(0, (hoy - fecha_devolucion).days)
+
+    def tarifa(self, tipo=None):
+        return self.tarifas_por_tipo.get(tipo, self.tarifa_diaria)
+
+    def calcular(self, fecha_devolucion, tipo=None, hoy=None):
+        """Devuelve (dias_retraso, monto) para un préstamo con la fecha esperada dada."""
+        dias = self.dias_retraso(fecha_devolucion, hoy)
+        dias_cobrables = max(0, dias - self.dias_gracia)
+        monto = dias_cobrables * self.tarifa(tipo)
+        if self.monto_maximo is not None:
+            monto = min(monto, self.monto_maximo)
+        return dias, monto
@@ -0,0 +1,143 @@
+"""Servidor ASGI de solo lectura para los endpoints públicos del OPAC.
+
+Atiende /api/opac/buscar, /api/opac/detalle/<id> y /api/catalogacion/listar
+con aiomysql y su propio pool, usando las mismas consultas que app.py
+(módulo consultas). Corre junto a la aplicación Flask, que sigue atendiendo
+todo lo demás; el proxy reparte las rutas:
+
+    uvicorn opac_async:app --port 5001 --workers 2
+
+    location ~ ^/api/(opac/buscar|opac/detalle/|catalogacion/listar) {
+        proxy_pass http://127.0.0.1:5001;
+    }
+"""
+import json
+import re
+from urllib.parse import parse_qs
+
+import aiomysql
+
+from configuracion import (
+    MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, OPAC_LIMITE_RESULTADOS,
+    LISTADO_LIMITE_DEFECTO, LISTADO_LIMITE_MAXIMO, OPAC_ASYNC_POOL_MIN, OPAC_ASYNC_POOL_MAX
+)
+from consultas import (
+    campos_listado, sql_listado_materiales, sql_busqueda_opac, SQL_TOTAL_MATERIALES, SQL_DETALLE_MATERIAL
+)
+
+pool = None
+
+
+def _entero(valor, defecto=None):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return defecto
+
+
+async def _consultar(sql, params, una=False):
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchone() if una else await cursor.fetchall()
+
+
+async def buscar_materiales(args):
+    sql, params = sql_busqueda_opac(args.get('query', ''), _entero(args.get('categoria_id')), OPAC_LIMITE_RESULTADOS)
+    try:
+        return 200, await _consultar(sql, params)
+    except aiomysql.Error as e:
+        print(f"Error al realizar la búsqueda en OPAC (async): {e}")
+        return 500, {'error': 'Error en la consulta SQL de búsqueda'}
+
+
+async def obtener_detalle_material(material_id):
+    try:
+        detalle = await _consultar(SQL_DETALLE_MATERIAL, (material_id,), una=True)
+    except aiomysql.Error as e:
+        print(f"Error al obtener detalle del material (async): {e}")
+        return 500, {'error': 'Error en la consulta SQL de detalle.'}
+    if detalle:
+        return 200, detalle
+    return 404, {'error': 'Material no encontrado.'}
+
+
+async def listar_materiales(args):
+    limite = max(1, min(_entero(args.get('limite'), LISTADO_LIMITE_DEFECTO), LISTADO_LIMITE_MAXIMO))
+    campos, invalidos = campos_listado(args.get('fields'))
+    if invalidos:
+        return 400, {'error': f'Campos no válidos: {", ".join(invalidos)}'}
+    sql, params = sql_listado_materiales(campos, _entero(args.get('cursor')), limite)
+    try:
+        materiales = await _consultar(sql, params)
+        siguiente_cursor = None
+        if len(materiales) > limite:
+            materiales = materiales[:limite]
+            siguiente_cursor = materiales[-1]['id_material']
+        respuesta = {'materiales': materiales, 'siguiente_cursor': siguiente_cursor}
+        if args.get('total', '1') != '0':
+            respuesta['total'] = (await _consultar(SQL_TOTAL_MATERIALES, (), una=True))['total']
+        return 200, respuesta
+    except aiomysql.Error as e:
+        print(f"Error al listar materiales (async): {e}")
+        return 500, {'error': 'Error en la consulta SQL de listado'}
+
+
+async def _responder(send, estado, cuerpo):
+    datos = json.dumps(cuerpo, ensure_ascii=False, default=str).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': estado,
+        'headers': [(b'content-type', b'application/json; charset=utf-8'),
+                    (b'content-length', str(len(datos)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': datos})
+
+
+async def _lifespan(receive, send):
+    global pool
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            try:
+                pool = await aiomysql.create_pool(
+                    host=MYSQL_HOST, user=MYSQL_USER, password=MYSQL_PASSWORD, db=MYSQL_DATABASE,
+                    minsize=OPAC_ASYNC_POOL_MIN, maxsize=OPAC_ASYNC_POOL_MAX,
+                    autocommit=True, charset='utf8mb4'
+                )
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            if pool is not None:
+                pool.close()
+                await pool.wait_closed()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] not in ('GET', 'HEAD'):
+        await _responder(send, 405, {'error': 'Método no permitido.'})
+        return
+
+    # Como request.args de Flask: se toma el primer valor de cada parámetro.
+    args = {clave: valores[0] for clave, valores in parse_qs(scope['query_string'].decode('latin-1')).items()}
+    ruta = scope['path'].rstrip('/')
+    detalle = re.fullmatch(r'/api/opac/detalle/(\d+)', ruta)
+    if ruta == '/api/opac/buscar':
+        estado, cuerpo = await buscar_materiales(args)
+    elif detalle:
+        estado, cuerpo = await obtener_detalle_material(int(detalle.group(1)))
+    elif ruta == '/api/catalogacion/listar':
+        estado, cuerpo = await listar_materiales(args)
+    else:
+        estado, cuerpo = 404, {'error': 'Ruta no atendida por el servidor asíncrono.'}
+    await _responder(send, estado, cuerpo)
@@ -0,0 +1,69 @@
+def retener_para_cola(cursor, material_id, copias, dias_retiro):
+    """Asigna hasta `copias` ejemplares devueltos a las reservas pendientes más antiguas.
+
+    Las reservas promovidas pasan a 'Retenida' con un plazo de retiro y esos
+    ejemplares no vuelven al stock disponible. Debe llamarse dentro de la
+    transacción de la devolución con un cursor dictionary=True; devuelve las
+    reservas retenidas en orden.
+    """
+    cursor.execute(
+        """
+        SELECT id_reserva, USUARIOS_id_usuario AS id_usuario
+        FROM RESERVAS
+        WHERE MATERIALES_id_material = %s AND estado_reserva = 'Pendiente'
+        ORDER BY id_reserva
+        LIMIT %s
+        FOR UPDATE
+        """,
+        (material_id, copias)
+    )
+    retenidas = cursor.fetchall()
+    if retenidas:
+        marcadores = ', '.join(['%s'] * len(retenidas))
+        cursor.execute(
+            f"""
+            UPDATE RESERVAS SET
+                estado_reserva = 'Retenida',
+                fecha_retencion = CURDATE(),
+                fecha_limite_retiro = DATE_ADD(CURDATE(), INTERVAL %s DAY)
+            WHERE id_reserva IN ({marcadores})
+            """,
+            (dias_retiro,) + tuple(r['id_reserva'] for r in retenidas)
+        )
+        cursor.execute(
+            f"SELECT id_usuario, nombre, rut FROM USUARIOS WHERE id_usuario IN ({marcadores})",
+            tuple(r['id_usuario'] for r in retenidas)
+        )
+        usuarios = {u['id_usuario']: u for u in cursor.fetchall()}
+        for reserva in retenidas:
+            reserva['material_id'] = material_id
+            reserva['nombre'] = usuarios[reserva['id_usuario']]['nombre']
+            reserva['rut'] = usuarios[reserva['id_usuario']]['rut']
+    return retenidas
+
+
+def consumir_retenciones(cursor, id_usuario, materiales_ids):
+    """Marca como completadas las reservas retenidas del usuario para esos materiales.
+
+    Devuelve el conjunto de materiales cuyo préstamo sale de un ejemplar
+    retenido y por lo tanto no descuenta stock disponible.
+    """
+    if not materiales_ids:
+        return set()
+    marcadores = ', '.join(['%s'] * len(materiales_ids))
+    cursor.execute(
+        f"""
+        SELECT id_reserva, MATERIALES_id_material
+        FROM RESERVAS
+        WHERE usuario_vigente = %s AND estado_reserva = 'Retenida' AND MATERIALES_id_material IN ({marcadores})
+        FOR UPDATE
+        """,
+        (id_usuario,) + tuple(materiales_ids)
+    )
+    filas = cursor.fetchall()
+    if not filas:
+        return set()
+    ids = [fila['id_reserva'] for fila in filas]
+    marcadores = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"UPDATE RESERVAS SET estado_reserva = 'Completada' WHERE id_reserva IN ({marcadores})", tuple(ids))
+    return {fila['MATERIALES_id_material'] for fila in filas}
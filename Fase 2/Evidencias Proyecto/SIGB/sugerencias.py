@@ -0,0 +1,174 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+from busqueda import normalizar, tokenizar, LARGO_MINIMO_TOKEN
+
+TIPOS = ('titulo', 'autor', 'isbn', 'rut')
+
+# Entradas recorridas como máximo por tipo en una búsqueda, para acotar la
+# latencia cuando un prefijo muy corto coincide con gran parte del índice.
+MAXIMO_ESCANEO = 2000
+
+
+def claves_texto(texto):
+    """Claves de un título o nombre: el texto completo y cada sufijo que parte en una palabra.
+
+    Así 'soled' encuentra 'Cien años de soledad' y 'garcia marq' encuentra
+    'Gabriel García Márquez'. Los sufijos que parten en palabras cortas
+    ('de', 'la') no se indexan.
+    """
+    tokens = tokenizar(texto)
+    claves = {' '.join(tokens)} if tokens else set()
+    for i in range(1, len(tokens)):
+        if len(tokens[i]) >= LARGO_MINIMO_TOKEN:
+            claves.add(' '.join(tokens[i:]))
+    return claves
+
+
+def compactar(codigo):
+    """Deja solo dígitos y la letra verificadora ('12.345.678-K' -> '12345678k')."""
+    return re.sub(r'[^0-9kx]', '', normalizar(codigo or ''))
+
+
+class IndicePrefijos:
+    """Índice en memoria de títulos, autores, ISBN y RUT para autocompletar.
+
+    Cada tipo es una lista ordenada de (clave, id) donde se busca por prefijo
+    con bisect, sin consultar MySQL. Las escrituras de la aplicación lo
+    actualizan en el momento; la recarga completa periódica recoge lo que
+    hayan escrito otros procesos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claves = {tipo: [] for tipo in TIPOS}
+        self._docs = {tipo: {} for tipo in TIPOS}
+        self._diario = None
+        self.cargado = False
+
+    def cargar(self, leer):
+        """Reconstruye el índice con las filas de MATERIALES, AUTOR y USUARIOS que devuelve `leer()`.
+
+        Las escrituras que lleguen mientras se leen las filas quedan en un
+        diario y se aplican sobre el índice nuevo antes de reemplazar al actual.
+        """
+        with self._lock:
+            self._diario = []
+        try:
+            materiales, autores, usuarios = leer()
+            docs = {tipo: {} for tipo in TIPOS}
+            for m in materiales:
+                docs['titulo'][m['id_material']] = (m['titulo'], m['AUTOR_id_autor'], claves_texto(m['titulo']))
+                if compactar(m['isbn']):
+                    docs['isbn'][m['id_material']] = (m['isbn'], m['titulo'], {compactar(m['isbn'])})
+            for a in autores:
+                docs['autor'][a['id_autor']] = (a['nombre_autor'], None, claves_texto(a['nombre_autor']))
+            for u in usuarios:
+                if compactar(u['rut']):
+                    docs['rut'][u['id_usuario']] = (u['rut'], u['nombre'], {compactar(u['rut'])})
+            claves = {
+                tipo: sorted((clave, doc_id) for doc_id, doc in docs[tipo].items() for clave in doc[2])
+                for tipo in TIPOS
+            }
+        except BaseException:
+            with self._lock:
+                self._diario = None
+            raise
+
+        with self._lock:
+            diario, self._diario = self._diario, None
+            self._claves, self._docs = claves, docs
+            for operacion, argumentos in diario:
+                operacion(*argumentos)
+            self.cargado = True
+
+    def _poner(self, tipo, doc_id, texto, detalle, claves):
+        if self._diario is not None:
+            self._diario.append((self._poner, (tipo, doc_id, texto, detalle, claves)))
+        self._quitar(tipo, doc_id, registrar=False)
+        if claves:
+            self._docs[tipo][doc_id] = (texto, detalle, claves)
+            for clave in claves:
+                insort(self._claves[tipo], (clave, doc_id))
+
+    def _quitar(self, tipo, doc_id, registrar=True):
+        if registrar and self._diario is not None:
+            self._diario.append((self._quitar, (tipo, doc_id)))
+        doc = self._docs[tipo].pop(doc_id, None)
+        if doc is None:
+            return
+        lista = self._claves[tipo]
+        for clave in doc[2]:
+            i = bisect_left(lista, (clave, doc_id))
+            if i < len(lista) and lista[i] == (clave, doc_id):
+                del lista[i]
+
+    def actualizar_material(self, material_id, titulo, isbn, autor_id):
+        with self._lock:
+            self._poner('titulo', material_id, titulo, autor_id, claves_texto(titulo))
+            isbn_compacto = compactar(isbn)
+            self._poner('isbn', material_id, isbn, titulo, {isbn_compacto} if isbn_compacto else set())
+
+    def quitar_material(self, material_id):
+        with self._lock:
+            self._quitar('titulo', material_id)
+            self._quitar('isbn', material_id)
+
+    def actualizar_autor(self, autor_id, nombre):
+        with self._lock:
+            self._poner('autor', autor_id, nombre, None, claves_texto(nombre))
+
+    def quitar_autor(self, autor_id):
+        with self._lock:
+            self._quitar('autor', autor_id)
+
+    def actualizar_usuario(self, usuario_id, nombre, rut=None):
+        """Indexa o renombra un usuario; sin `rut` se conserva el ya indexado."""
+        with self._lock:
+            if rut is None:
+                actual = self._docs['rut'].get(usuario_id)
+                if actual is None:
+                    return
+                rut = actual[0]
+            rut_compacto = compactar(rut)
+            self._poner('rut', usuario_id, rut, nombre, {rut_compacto} if rut_compacto else set())
+
+    def _escanear(self, tipo, prefijo, limite):
+        lista = self._claves[tipo]
+        vistos = []
+        i = bisect_left(lista, (prefijo,))
+        fin = min(len(lista), i + MAXIMO_ESCANEO)
+        while i < fin and len(vistos) < limite:
+            clave, doc_id = lista[i]
+            if not clave.startswith(prefijo):
+                break
+            if doc_id not in vistos:
+                vistos.append(doc_id)
+            i += 1
+        return vistos
+
+    def buscar(self, texto, tipos=TIPOS, limite=8):
+        """Sugerencias por tipo para el texto ingresado, en orden alfabético de clave."""
+        prefijo_texto = ' '.join(tokenizar(texto))
+        prefijo_codigo = compactar(texto) if re.search(r'\d', texto or '') else ''
+        resultado = {}
+        with self._lock:
+            for tipo in tipos:
+                prefijo = prefijo_codigo if tipo in ('isbn', 'rut') else prefijo_texto
+                if not prefijo:
+                    resultado[tipo] = []
+                    continue
+                sugerencias = []
+                for doc_id in self._escanear(tipo, prefijo, limite):
+                    texto_doc, detalle, _ = self._docs[tipo][doc_id]
+                    if tipo == 'titulo':
+                        autor = self._docs['autor'].get(detalle)
+                        detalle = autor[0] if autor else None
+                    sugerencias.append({'id': doc_id, 'texto': texto_doc, 'detalle': detalle})
+                resultado[tipo] = sugerencias
+        return resultado
+
+    def estadisticas(self):
+        with self._lock:
+            return {tipo: len(self._docs[tipo]) for tipo in TIPOS}
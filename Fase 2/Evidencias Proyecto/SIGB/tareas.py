@@ -0,0 +1,281 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from cambios import registrar_cambios
+from consultas import construir_case
+from reservas import retener_para_cola
+
+
+def marcar_vencidos(conn, politica, tamano_lote, pausa=0.0):
+    """Guarda los días de mora y la multa acumulada a hoy de los préstamos activos vencidos.
+
+    Recorre los vencidos por (fecha_devolucion, id_prestamo) en lotes con un
+    commit por lote. Los préstamos ya calculados hoy se saltan, así que la
+    tarea puede repetirse durante el día sin volver a escribir.
+    """
+    cursor = conn.cursor(dictionary=True)
+    hoy = date.today()
+    ultima_fecha, ultimo_id = date(1000, 1, 1), 0
+    actualizados = 0
+    while True:
+        cursor.execute(
+            """
+            SELECT P.id_prestamo, P.fecha_devolucion, P.multa_calculada_en, M.tipo
+            FROM PRESTAMOS P
+            JOIN MATERIALES M ON P.MATERIALES_id_material = M.id_material
+            WHERE P.estado_prestamo = 'Activo' AND P.fecha_devolucion < %s
+              AND (P.fecha_devolucion > %s OR (P.fecha_devolucion = %s AND P.id_prestamo > %s))
+            ORDER BY P.fecha_devolucion, P.id_prestamo
+            LIMIT %s
+            """,
+            (hoy, ultima_fecha, ultima_fecha, ultimo_id, tamano_lote)
+        )
+        lote = cursor.fetchall()
+        if not lote:
+            break
+        ultima_fecha, ultimo_id = lote[-1]['fecha_devolucion'], lote[-1]['id_prestamo']
+
+        pendientes = [p for p in lote if p['multa_calculada_en'] != hoy]
+        if pendientes:
+            dias, multas = {}, {}
+            for prestamo in pendientes:
+                dias[prestamo['id_prestamo']], multas[prestamo['id_prestamo']] = politica.calcular(
+                    prestamo['fecha_devolucion'], prestamo['tipo'], hoy
+                )
+            caso_dias, params_dias = construir_case('id_prestamo', dias)
+            caso_multa, params_multa = construir_case('id_prestamo', multas)
+            marcadores = ', '.join(['%s'] * len(dias))
+            # La condición sobre estado_prestamo evita pisar un préstamo devuelto
+            # en el mesón entre la lectura y esta escritura.
+            cursor.execute(
+                f"""
+                UPDATE PRESTAMOS SET
+                    dias_mora = {caso_dias},
+                    multa_acumulada = {caso_multa},
+                    multa_calculada_en = %s
+                WHERE id_prestamo IN ({marcadores}) AND estado_prestamo = 'Activo'
+                """,
+                tuple(params_dias) + tuple(params_multa) + (hoy,) + tuple(dias)
+            )
+            actualizados += cursor.rowcount
+        conn.commit()
+        if pausa:
+            time.sleep(pausa)
+    cursor.close()
+    return {'prestamos_vencidos_actualizados': actualizados}
+
+
+def expirar_reservas(conn, tamano_lote, dias_retiro, dias_vigencia, pausa=0.0):
+    """Expira las retenciones no retiradas y las reservas pendientes demasiado antiguas.
+
+    El ejemplar de una retención expirada pasa a la siguiente reserva de la
+    cola del material o, si no hay nadie esperando, vuelve al stock.
+    """
+    cursor = conn.cursor(dictionary=True)
+    retenciones = reasignadas = pendientes = 0
+    while True:
+        cursor.execute(
+            """
+            SELECT id_reserva, MATERIALES_id_material
+            FROM RESERVAS
+            WHERE estado_reserva = 'Retenida' AND fecha_limite_retiro < CURDATE()
+            ORDER BY fecha_limite_retiro, id_reserva
+            LIMIT %s
+            FOR UPDATE
+            """,
+            (tamano_lote,)
+        )
+        lote = cursor.fetchall()
+        if not lote:
+            conn.commit()
+            break
+        marcadores = ', '.join(['%s'] * len(lote))
+        cursor.execute(
+            f"UPDATE RESERVAS SET estado_reserva = 'Expirada' WHERE id_reserva IN ({marcadores})",
+            tuple(r['id_reserva'] for r in lote)
+        )
+        copias = {}
+        for reserva in lote:
+            copias[reserva['MATERIALES_id_material']] = copias.get(reserva['MATERIALES_id_material'], 0) + 1
+        liberados = []
+        for material_id, cantidad in copias.items():
+            promovidas = retener_para_cola(cursor, material_id, cantidad, dias_retiro)
+            reasignadas += len(promovidas)
+            if cantidad > len(promovidas):
+                cursor.execute(
+                    "UPDATE MATERIALES SET ejemplares_disponibles = ejemplares_disponibles + %s WHERE id_material = %s",
+                    (cantidad - len(promovidas), material_id)
+                )
+                liberados.append(('stock', material_id, None))
+        registrar_cambios(cursor, liberados)
+        conn.commit()
+        retenciones += len(lote)
+        if pausa:
+            time.sleep(pausa)
+
+    limite = date.today() - timedelta(days=dias_vigencia)
+    while True:
+        cursor.execute(
+            """
+            UPDATE RESERVAS SET estado_reserva = 'Expirada'
+            WHERE estado_reserva = 'Pendiente' AND fecha_reserva < %s
+            ORDER BY fecha_reserva
+            LIMIT %s
+            """,
+            (limite, tamano_lote)
+        )
+        conn.commit()
+        pendientes += cursor.rowcount
+        if cursor.rowcount < tamano_lote:
+            break
+        if pausa:
+            time.sleep(pausa)
+    cursor.close()
+    return {'retenciones_expiradas': retenciones, 'retenciones_reasignadas': reasignadas, 'pendientes_expiradas': pendientes}
+
+
+def refrescar_estadisticas(conn, tamano_lote, pausa=0.0):
+    """Recalcula ESTADISTICAS_MATERIAL y el mes en curso por rangos de materiales.
+
+    Por cada lote, en una sola transacción, se bloquean con FOR UPDATE las
+    filas de estadísticas del rango, se cuentan los préstamos y se escriben
+    los conteos con un INSERT de varias filas. Un préstamo o devolución que
+    llegue mientras tanto espera el bloqueo y suma su incremento sobre el
+    conteo ya escrito, en vez de quedar pisado por él. Corrige la deriva que
+    puedan dejar los contadores incrementales de la aplicación.
+    """
+    cursor = conn.cursor(dictionary=True)
+    mes = date.today().replace(day=1)
+    ultimo_id = 0
+    materiales = 0
+    while True:
+        cursor.execute(
+            "SELECT id_material FROM MATERIALES WHERE id_material > %s ORDER BY id_material LIMIT %s",
+            (ultimo_id, tamano_lote)
+        )
+        ids = [fila['id_material'] for fila in cursor.fetchall()]
+        if not ids:
+            break
+        conn.commit()
+        # Los bloqueos de rango también detienen las filas nuevas del rango. El
+        # conteo es la primera lectura consistente de la transacción, así que
+        # ve todo lo confirmado antes de obtener los bloqueos.
+        cursor.execute(
+            "SELECT MATERIALES_id_material FROM ESTADISTICAS_MATERIAL WHERE MATERIALES_id_material > %s AND MATERIALES_id_material <= %s FOR UPDATE",
+            (ultimo_id, ids[-1])
+        )
+        cursor.fetchall()
+        cursor.execute(
+            "SELECT MATERIALES_id_material FROM ESTADISTICAS_MATERIAL_MES WHERE MATERIALES_id_material > %s AND MATERIALES_id_material <= %s AND mes = %s FOR UPDATE",
+            (ultimo_id, ids[-1], mes)
+        )
+        cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT MATERIALES_id_material AS material_id, COUNT(*) AS total,
+                   SUM(estado_prestamo = 'Activo') AS activos, MAX(fecha_prestamo) AS ultimo,
+                   SUM(fecha_prestamo >= %s) AS del_mes
+            FROM PRESTAMOS
+            WHERE MATERIALES_id_material > %s AND MATERIALES_id_material <= %s
+            GROUP BY MATERIALES_id_material
+            """,
+            (mes, ultimo_id, ids[-1])
+        )
+        conteos = cursor.fetchall()
+        ultimo_id = ids[-1]
+        if not conteos:
+            conn.commit()
+            continue
+
+        filas = ', '.join(['(%s, %s, %s, %s)'] * len(conteos))
+        params = [valor for c in conteos for valor in (c['material_id'], c['total'], c['activos'], c['ultimo'])]
+        cursor.execute(f"""
+        INSERT INTO ESTADISTICAS_MATERIAL (MATERIALES_id_material, total_prestamos, prestamos_activos, ultimo_prestamo)
+        VALUES {filas}
+        ON DUPLICATE KEY UPDATE
+            total_prestamos = VALUES(total_prestamos),
+            prestamos_activos = VALUES(prestamos_activos),
+            ultimo_prestamo = VALUES(ultimo_prestamo)
+        """, tuple(params))
+
+        del_mes = [c for c in conteos if c['del_mes']]
+        if del_mes:
+            filas = ', '.join(['(%s, %s, %s)'] * len(del_mes))
+            params = [valor for c in del_mes for valor in (c['material_id'], mes, c['del_mes'])]
+            cursor.execute(f"""
+            INSERT INTO ESTADISTICAS_MATERIAL_MES (MATERIALES_id_material, mes, prestamos)
+            VALUES {filas}
+            ON DUPLICATE KEY UPDATE prestamos = VALUES(prestamos)
+            """, tuple(params))
+        conn.commit()
+        materiales += len(conteos)
+        if pausa:
+            time.sleep(pausa)
+    cursor.close()
+    return {'materiales_refrescados': materiales}
+
+
+class PlanificadorTareas:
+    """Ejecuta tareas periódicas sobre conexiones del pool, fuera de las peticiones.
+
+    Las tareas incrementales corren cada `intervalo` segundos y las nocturnas
+    una vez al día a la `hora_nocturna` local. Cada tarea toma un GET_LOCK de
+    MySQL con su nombre, de modo que dos workers nunca ejecutan la misma tarea
+    a la vez.
+    """
+
+    def __init__(self, pool, incrementales, nocturnas, intervalo, hora_nocturna):
+        self.pool = pool
+        self.incrementales = incrementales
+        self.nocturnas = nocturnas
+        self.intervalo = intervalo
+        self.hora_nocturna = hora_nocturna
+        self.detener = threading.Event()
+
+    def ejecutar(self, nombre, funcion):
+        conn = self.pool.obtener()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (f'sigb_tarea_{nombre}',))
+            if cursor.fetchone()[0] != 1:
+                cursor.close()
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {nombre}: otro worker la está ejecutando, se omite.")
+                return None
+            inicio = time.monotonic()
+            try:
+                resumen = funcion(conn)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (f'sigb_tarea_{nombre}',))
+                cursor.fetchall()
+                cursor.close()
+            print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {nombre}: {resumen} ({time.monotonic() - inicio:.1f} s)")
+            return resumen
+        except Exception as e:
+            conn.rollback()
+            print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] Error en la tarea {nombre}: {e}")
+            return None
+        finally:
+            self.pool.devolver(conn)
+
+    def _proxima_nocturna(self, ahora):
+        proxima = ahora.replace(hour=self.hora_nocturna, minute=0, second=0, microsecond=0)
+        if proxima <= ahora:
+            proxima += timedelta(days=1)
+        return proxima
+
+    def ejecutar_siempre(self):
+        """Bucle del worker; termina cuando se activa `detener`."""
+        proxima_nocturna = self._proxima_nocturna(datetime.now())
+        proxima_incremental = time.monotonic()
+        while not self.detener.is_set():
+            if datetime.now() >= proxima_nocturna:
+                for nombre, funcion in self.nocturnas:
+                    self.ejecutar(nombre, funcion)
+                proxima_nocturna = self._proxima_nocturna(datetime.now())
+            if time.monotonic() >= proxima_incremental:
+                for nombre, funcion in self.incrementales:
+                    self.ejecutar(nombre, funcion)
+                proxima_incremental = time.monotonic() + self.intervalo
+            espera = min(proxima_incremental - time.monotonic(), (proxima_nocturna - datetime.now()).total_seconds())
+            self.detener.wait(max(1.0, espera))
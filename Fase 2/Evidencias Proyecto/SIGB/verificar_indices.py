@@ -0,0 +1,146 @@
+"""Verifica con EXPLAIN que las consultas de /api no recorran tablas completas.
+
+Ejecuta EXPLAIN sobre las consultas de app.py y falla si alguna hace un
+recorrido completo (type = ALL) sobre una tabla grande.
+Con --sembrar N se insertan antes N materiales y 10*N préstamos sintéticos
+para que el optimizador se comporte como con una colección real.
+
+Uso: python verificar_indices.py [--sembrar 200000]
+"""
+import sys
+from datetime import date
+
+import mysql.connector
+
+from configuracion import (
+    MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE, OPAC_LIMITE_RESULTADOS, LISTADO_LIMITE_DEFECTO
+)
+from consultas import (
+    campos_listado, sql_listado_materiales, sql_busqueda_opac, SQL_DETALLE_MATERIAL,
+    sql_prestamos_activos, sql_conteo_prestamos_activos, SQL_REPORTE_MORA, SQL_REPORTE_USO
+)
+
+TABLAS_GRANDES = {'MATERIALES', 'PRESTAMOS', 'RESERVAS', 'MATERIALES_CATEGORIAS', 'USUARIOS', 'ESTADISTICAS_MATERIAL'}
+
+# EXPLAIN informa el alias usado en la consulta, no el nombre de la tabla.
+ALIAS = {'M': 'MATERIALES', 'P': 'PRESTAMOS', 'U': 'USUARIOS', 'MC': 'MATERIALES_CATEGORIAS', 'EST': 'ESTADISTICAS_MATERIAL', 'R': 'RESERVAS'}
+
+# Las consultas de la API se arman con los mismos constructores y constantes
+# de consultas.py que usa app.py, así el EXPLAIN revisa exactamente lo que se
+# ejecuta. /api/admin/usuarios y /api/listas_catalogacion devuelven tablas
+# completas por diseño y no se incluyen.
+CONSULTAS = [
+    ('listar_materiales', *sql_listado_materiales(campos_listado(None)[0], 1000000, LISTADO_LIMITE_DEFECTO)),
+    ('buscar_materiales (texto)', *sql_busqueda_opac('garcia', None, OPAC_LIMITE_RESULTADOS)),
+    ('buscar_materiales (prefijo)', *sql_busqueda_opac('Ci', None, OPAC_LIMITE_RESULTADOS)),
+    ('buscar_materiales (categoría)', *sql_busqueda_opac('', 1, OPAC_LIMITE_RESULTADOS)),
+    ('obtener_detalle_material', SQL_DETALLE_MATERIAL, (1,)),
+    ('listar_prestamos_activos (página)', *sql_prestamos_activos({}, (date(2024, 1, 1), 0), LISTADO_LIMITE_DEFECTO)),
+    ('listar_prestamos_activos (rut)', *sql_prestamos_activos({'rut': '11111111-1'}, None, LISTADO_LIMITE_DEFECTO)),
+    ('listar_prestamos_activos (material)', *sql_prestamos_activos({'material_id': 1}, None, LISTADO_LIMITE_DEFECTO)),
+    ('listar_prestamos_activos (vencidos)', *sql_prestamos_activos({'vencidos': True}, None, LISTADO_LIMITE_DEFECTO)),
+    ('conteo_prestamos_activos (material)', *sql_conteo_prestamos_activos({'material_id': 1})),
+    ('reporte_usuarios_mora', SQL_REPORTE_MORA, ()),
+    ('reporte_materiales_uso', SQL_REPORTE_USO, ()),
+]
+
+# Consultas escritas dentro de las funciones de app.py, tareas.py y reservas.py;
+# deben mantenerse a mano al cambiar esas funciones.
+CONSULTAS += [
+    ('tarea marcar-vencidos', """
+        SELECT P.id_prestamo, P.fecha_devolucion FROM PRESTAMOS P
+        WHERE P.estado_prestamo = 'Activo' AND P.fecha_devolucion < CURDATE()
+          AND (P.fecha_devolucion > %s OR (P.fecha_devolucion = %s AND P.id_prestamo > %s))
+        ORDER BY P.fecha_devolucion, P.id_prestamo LIMIT 500
+    """, ('2024-01-01', '2024-01-01', 0)),
+    ('tarea expirar-reservas', """
+        SELECT id_reserva FROM RESERVAS
+        WHERE estado_reserva = 'Retenida' AND fecha_limite_retiro < CURDATE()
+        ORDER BY fecha_limite_retiro, id_reserva LIMIT 500
+    """, ()),
+    ('metricas prestamos_activos', """
+        SELECT COUNT(id_prestamo) FROM PRESTAMOS WHERE estado_prestamo = 'Activo'
+    """, ()),
+    ('registrar_reserva', """
+        SELECT id_reserva FROM RESERVAS WHERE usuario_vigente = %s AND MATERIALES_id_material = %s
+    """, (1, 1)),
+    ('registrar_devolucion (cola de reservas)', """
+        SELECT id_reserva, USUARIOS_id_usuario FROM RESERVAS
+        WHERE MATERIALES_id_material = %s AND estado_reserva = 'Pendiente'
+        ORDER BY id_reserva LIMIT 1
+    """, (1,)),
+    ('registrar_prestamo (reserva retenida)', """
+        SELECT id_reserva FROM RESERVAS
+        WHERE usuario_vigente = %s AND MATERIALES_id_material = %s AND estado_reserva = 'Retenida'
+    """, (1, 1)),
+    ('registrar_prestamo (usuario)', "SELECT id_usuario FROM USUARIOS WHERE rut = %s", ('20594886-4',)),
+    ('registrar_devolucion', """
+        SELECT P.MATERIALES_id_material, P.estado_prestamo, P.fecha_devolucion, M.tipo
+        FROM PRESTAMOS P JOIN MATERIALES M ON P.MATERIALES_id_material = M.id_material
+        WHERE P.id_prestamo = %s FOR UPDATE
+    """, (1,)),
+]
+
+
+def sembrar(conn, cantidad):
+    """Inserta `cantidad` materiales y 10 préstamos por material con datos sintéticos."""
+    cursor = conn.cursor()
+    cursor.execute("SET SESSION cte_max_recursion_depth = %s", (cantidad * 10 + 1,))
+    cursor.execute("""
+    SELECT (SELECT MIN(id_autor) FROM AUTOR), (SELECT MIN(id_editorial) FROM EDITORIAL),
+           (SELECT MIN(id_usuario) FROM USUARIOS), (SELECT MAX(id_material) FROM MATERIALES)
+    """)
+    autor_id, editorial_id, usuario_id, ultimo_material = cursor.fetchone()
+    ultimo_material = ultimo_material or 0
+
+    cursor.execute("""
+    INSERT INTO MATERIALES (titulo, anio_publicacion, isbn, ejemplares_totales, ejemplares_disponibles,
+        tipo, disponible, EDITORIAL_id_editorial, AUTOR_id_autor, texto_busqueda)
+    WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+    SELECT CONCAT('Material sintético ', n), 2000 + n MOD 25, CONCAT('SINT-', %s + n), 5, 5,
+        'Libro', 'S', %s, %s, CONCAT('material sintetico ', n)
+    FROM seq
+    """, (cantidad, ultimo_material, editorial_id, autor_id))
+    conn.commit()
+
+    cursor.execute("""
+    INSERT INTO PRESTAMOS (fecha_prestamo, fecha_devolucion, estado_prestamo, USUARIOS_id_usuario, MATERIALES_id_material)
+    WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+    SELECT NOW() - INTERVAL n MOD 400 DAY, CURDATE() - INTERVAL n MOD 400 DAY + INTERVAL 14 DAY,
+        IF(n MOD 20 = 0, 'Activo', 'Devuelto'), %s, %s + 1 + n MOD %s
+    FROM seq
+    """, (cantidad * 10, usuario_id, ultimo_material, cantidad))
+    conn.commit()
+    cursor.execute("ANALYZE TABLE MATERIALES, PRESTAMOS, MATERIALES_CATEGORIAS, RESERVAS")
+    cursor.fetchall()
+    cursor.close()
+
+
+def main():
+    conn = mysql.connector.connect(
+        host=MYSQL_HOST, user=MYSQL_USER, password=MYSQL_PASSWORD, database=MYSQL_DATABASE
+    )
+    if '--sembrar' in sys.argv:
+        sembrar(conn, int(sys.argv[sys.argv.index('--sembrar') + 1]))
+
+    cursor = conn.cursor(dictionary=True)
+    fallas = []
+    for nombre, sql, params in CONSULTAS:
+        cursor.execute("EXPLAIN " + sql, params)
+        for fila in cursor.fetchall():
+            tabla = ALIAS.get(fila['table'], fila['table'])
+            if fila['type'] == 'ALL' and tabla in TABLAS_GRANDES:
+                fallas.append(f"{nombre}: recorrido completo de {tabla} (~{fila['rows']} filas)")
+        print(f"{'OK ' if not any(f.startswith(nombre + ':') for f in fallas) else 'MAL'} {nombre}")
+    cursor.close()
+    conn.close()
+
+    if fallas:
+        print("\nConsultas sin índice adecuado:")
+        for falla in fallas:
+            print(f"  - {falla}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()